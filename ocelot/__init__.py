@@ -17,20 +17,62 @@ are significant speedups versus the pure-python library toolz.
 
 See https://github.com/pytoolz/cytoolz for more information."""
 
-try:
-    import cytoolz as toolz
-except ImportError:
-    import warnings
-    import toolz
-    warnings.warn(CYTOOLZ)
-
-from .data import data_dir
-from .collection import Collection
-from .io import *
-from .configuration import (
-    cutoff_config,
-    consequential_config,
-)
-from .filesystem import OutputDir
-from .report import HTMLReport
-from .model import system_model
+import importlib
+import sys
+import types
+
+
+def _import_toolz():
+    try:
+        import cytoolz as toolz
+    except ImportError:
+        import warnings
+        import toolz
+        warnings.warn(CYTOOLZ)
+    return toolz
+
+# Public names, and the modules which define them. These modules import most
+# of Ocelot and its dependencies, so they are only imported when a name is
+# first used; ``import ocelot`` (e.g. for ``ocelot-cli --help``) stays fast.
+_PUBLIC_NAMES = {
+    'data_dir': '.data',
+    'Collection': '.collection',
+    'extract_directory': '.io',
+    'cleanup_data_directory': '.io',
+    'dataset_schema': '.io',
+    'validate_directory': '.io',
+    'validate_directory_against_xsd': '.io',
+    'cutoff_config': '.configuration',
+    'consequential_config': '.configuration',
+    'OutputDir': '.filesystem',
+    'HTMLReport': '.report',
+    'system_model': '.model',
+}
+
+
+def _import_public_name(name):
+    if name == 'toolz':
+        return _import_toolz()
+    return getattr(importlib.import_module(_PUBLIC_NAMES[name], __name__), name)
+
+
+class _OcelotModule(types.ModuleType):
+    """Class of the ``ocelot`` module, which imports public names when they are first used"""
+    def __getattr__(self, name):
+        if name != 'toolz' and name not in _PUBLIC_NAMES:
+            raise AttributeError("module {!r} has no attribute {!r}".format(
+                self.__name__, name))
+        value = _import_public_name(name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_PUBLIC_NAMES) | {'toolz'})
+
+
+if sys.version_info >= (3, 5):
+    # Assigning the class of a module is possible since Python 3.5
+    sys.modules[__name__].__class__ = _OcelotModule
+else:
+    for _name in ('toolz',) + tuple(_PUBLIC_NAMES):
+        globals()[_name] = _import_public_name(_name)
@@ -6,18 +6,20 @@ Commands:
 
   * run: Run a system model. Uses the default system model (ecoinvent cutoff) if <config> is not specified. <dirpath> is the input files directory.
   * cleanup: Delete all model runs more than one week old.
-  * validate: Extract the ecospold2 files in <dirpath> and make sure the extracted data meets the Ocelot internal format. This command doesn't use the extraction cache.
-  * xsd: Validate the ecospold2 files in <dirpath> against the default XSD or another XSD specified in <schema>.
+  * follow: Show the datasets followed with --follow in model run <run> (a run id or directory). Without <filename>, list the followed dataset files and the transformation functions which changed them. With <filename>, print the followed datasets from this file after transformation function --step (default is the final result; -1 is the input data).
+  * validate: Extract the ecospold2 files in <dirpath> and make sure the extracted data meets the Ocelot internal format. Uses the extraction cache, and only validates datasets which changed since the last validation, unless --nocache is given. Errors are written as JSON lines to ocelot-validation-errors.jsonl.
+  * xsd: Validate the ecospold2 files in <dirpath> against the default XSD or another XSD specified in <schema>. Files are validated in parallel; use --jobs to set the number of worker processes.
 
-See https://docs.ocelot.space/filesystem.html#writing-intermediate-results for information on saving strategies.
+See https://docs.ocelot.space/filesystem.html#writing-intermediate-results for information on saving strategies. Model runs can be resumed from any saved intermediate result with --resume, as long as the transformation functions up to that point haven't changed. To debug a single dataset or product, --subset runs the system model on only the selected datasets and the datasets which can influence them.
 
 Usage:
-  ocelot-cli run <dirpath> [--noshow] [--save=<strategy>] [--follow=<filename>]
-  ocelot-cli run <dirpath> <config> [--noshow] [--save=<strategy>] [--follow=<filename>]
+  ocelot-cli run <dirpath> [--noshow] [--save=<strategy>] [--follow=<filename>] [--resume=<checkpoint>] [--step-cache] [--profile | --cprofile] [--executor=<mode>] [--jobs=<n>] [--subset=<dataset>...]
+  ocelot-cli run <dirpath> <config> [--noshow] [--save=<strategy>] [--follow=<filename>] [--resume=<checkpoint>] [--step-cache] [--profile | --cprofile] [--executor=<mode>] [--jobs=<n>] [--subset=<dataset>...]
   ocelot-cli cleanup
-  ocelot-cli validate <dirpath>
-  ocelot-cli xsd <dirpath> <schema>
-  ocelot-cli xsd <dirpath>
+  ocelot-cli follow <run> [<filename>] [--step=<index>]
+  ocelot-cli validate <dirpath> [--jobs=<n>] [--nocache]
+  ocelot-cli xsd <dirpath> <schema> [--jobs=<n>]
+  ocelot-cli xsd <dirpath> [--jobs=<n>]
   ocelot-cli -l | --list
   ocelot-cli -h | --help
   ocelot-cli --version
@@ -27,41 +29,82 @@ Options:
   --noshow            Don't open HTML report in new web browser tab
   --save=<strategy>   Strategy for which intermediate results to save.
   --follow=<filename> Filename to follow during system model execution
+  --step-cache        Reuse transformation results from earlier runs on the same data
+  --profile           Measure time and memory use of each transformation function
+  --cprofile          Like --profile, and also save cProfile statistics
+  --subset=<dataset>  Only use this dataset (filepath, id or reference product) and the datasets it depends on; can be repeated
+  --resume=<checkpoint> Resume from intermediate result <run id>:<index> of an earlier run
+  --step=<index>      Transformation function index
+  --nocache           Don't use cached extracted data or validation results
+  --jobs=<n>          Number of worker processes; default is number of CPUs
+  --executor=<mode>   Apply single-dataset functions with "serial", "thread", or "process" workers
   -h --help           Show this screen.
   --version           Show version.
 
 """
+# Commands import what they need, so that ``--help`` doesn't import all of Ocelot
 from docopt import docopt
-from ocelot import (
-    cleanup_data_directory,
-    data_dir,
-    system_model,
-    validate_directory_against_xsd,
-    validate_directory,
-)
 import os
 import sys
 
 
+def show_followed(run, filename=None, step=None):
+    from ocelot.follow import list_followed, reconstruct
+    from pprint import pprint
+    followed = list_followed(run)
+    if not filename:
+        for filepath, (_, indices) in sorted(followed.items()):
+            print("{}: changed by functions {}".format(
+                filepath, ", ".join(str(index) for index in indices)))
+        return
+    matches = [key for key in sorted(followed) if filename in key]
+    if not matches:
+        print("No followed dataset file matches {}".format(filename))
+        sys.exit(1)
+    for filepath in matches:
+        datasets = reconstruct(followed[filepath][0],
+                               int(step) if step is not None else None)
+        for label, ds in sorted(datasets.items()):
+            print("{} ({})".format(filepath, label))
+            pprint(ds)
+
+
 def main():
     try:
         args = docopt(__doc__, version='Ocelot open source linker CLI 0.2')
         if args['run']:
+            from ocelot import system_model
             system_model(
                 args["<dirpath>"],
                 args['<config>'],
                 show=not args['--noshow'],
                 save_strategy=args['--save'],
-                follow=args['--follow']
+                follow=args['--follow'],
+                resume_from=args['--resume'],
+                step_cache=args['--step-cache'],
+                profile="cprofile" if args['--cprofile'] else args['--profile'],
+                executor=args['--executor'] or "serial",
+                workers=int(args['--jobs']) if args['--jobs'] else None,
+                subset=args['--subset']
             )
         elif args['validate']:
-            validate_directory(args['<dirpath>'])
+            from ocelot import validate_directory
+            validate_directory(
+              args['<dirpath>'],
+              use_cache=not args['--nocache'],
+              jobs=int(args['--jobs']) if args['--jobs'] else None
+            )
         elif args['xsd']:
+            from ocelot import data_dir, validate_directory_against_xsd
             validate_directory_against_xsd(
               args['<dirpath>'],
-              args['<schema>'] or os.path.join(data_dir, 'EcoSpold02.xsd')
+              args['<schema>'] or os.path.join(data_dir, 'EcoSpold02.xsd'),
+              jobs=int(args['--jobs']) if args['--jobs'] else None
             )
+        elif args['follow']:
+            show_followed(args['<run>'], args['<filename>'], args['--step'])
         elif args['cleanup']:
+            from ocelot import cleanup_data_directory
             cleanup_data_directory()
         else:
             raise ValueError
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the results of two Ocelot model runs.
+
+<run> and <reference> can each be a results pickle file, a model run id or directory (uses the final results), or <run>:<index> to use the intermediate result saved after transformation function <index>.
+
+Datasets are matched by code, or by activity hash if they don't have a code. Prints a summary and the differences of the first datasets; use --output to write all differences to a JSON file.
+
+Usage:
+  ocelot-compare compare <run> <reference> [--rtol=<x>] [--atol=<x>] [--limit=<n>] [--output=<filepath>]
+  ocelot-compare -h | --help
+  ocelot-compare --version
+
+Options:
+  --rtol=<x>          Relative tolerance for exchange amounts [default: 1e-6]
+  --atol=<x>          Absolute tolerance for exchange amounts [default: 1e-12]
+  --limit=<n>         Number of dataset differences to print [default: 20]
+  --output=<filepath> Write the summary and all differences to this JSON file
+  -h --help           Show this screen.
+  --version           Show version.
+
+"""
+from docopt import docopt
+from ocelot.compare import compare_results, load_results
+import json
+import sys
+
+
+def print_comparison(comparison, limit):
+    for label, value in comparison['summary'].items():
+        print("{}: {}".format(label, value))
+    for diff in comparison['datasets'][:limit]:
+        print("\n{} ({}) [{}]: {}".format(
+            diff['name'], diff['location'], diff['key'], diff['status']))
+        for field, (first, second) in sorted(diff['fields'].items()):
+            print("    {}: {} -> {}".format(field, first, second))
+        for exc in diff['only in first']:
+            print("    - {}".format(exc))
+        for exc in diff['only in second']:
+            print("    + {}".format(exc))
+        for exc, first, second in diff['amounts']:
+            print("    {}: {:.6g} -> {:.6g}".format(exc, first, second))
+    remaining = len(comparison['datasets']) - limit
+    if remaining > 0:
+        print("\n... and {} more datasets".format(remaining))
+
+
+def main():
+    try:
+        args = docopt(__doc__, version='Ocelot compare CLI 0.1')
+        if args['compare']:
+            comparison = compare_results(
+                load_results(args['<run>']),
+                load_results(args['<reference>']),
+                rtol=float(args['--rtol']),
+                atol=float(args['--atol']),
+            )
+            print_comparison(comparison, int(args['--limit']))
+            if args['--output']:
+                with open(args['--output'], "w", encoding='utf-8') as f:
+                    json.dump(comparison, f, ensure_ascii=False, indent=2)
+    except KeyboardInterrupt:
+        print("Terminating Ocelot compare")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
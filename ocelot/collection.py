@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+from .executors import SerialExecutor, open_executor
 from collections.abc import MutableSequence, Iterable
+import contextlib
+import logging
+import time
 import wrapt
 
 
@@ -10,6 +14,8 @@ class Collection(MutableSequence):
 
     Instantiate a ``Collection`` with a name, and the desired transformation functions: ``Collection("some name", do_something, do_something_else)``.
 
+    Consecutive single-dataset functions are applied in one pass over the datasets if fusion is possible; see ``fuse_functions`` and ``can_fuse``.
+
     """
     def __init__(self, name, *functions):
         self.name = name
@@ -45,7 +51,8 @@ class Collection(MutableSequence):
             yield obj
 
     def __call__(self, data):
-        for func in self:
+        functions = fuse_functions(self.functions) if can_fuse() else self
+        for func in functions:
             data = func(data)
         return data
 
@@ -68,3 +75,143 @@ def unwrap_functions(lst):
                 yield func
 
     return list(unwrapper(lst))
+
+
+# Whether functions may be fused; see ``fusion_allowed``
+_fusion_allowed = True
+
+
+@contextlib.contextmanager
+def fusion_allowed(allowed):
+    """Context manager which sets whether consecutive single-dataset functions may be fused.
+
+    ``system_model`` doesn't allow fusion if each function must be applied separately, e.g. to follow datasets or to cache the result of each function."""
+    global _fusion_allowed
+    previous, _fusion_allowed = _fusion_allowed, allowed
+    try:
+        yield
+    finally:
+        _fusion_allowed = previous
+
+
+def can_fuse():
+    """Return ``True`` if fusion is allowed and the current executor is serial"""
+    with open_executor() as current:
+        return _fusion_allowed and isinstance(current, SerialExecutor)
+
+
+def single_dataset_step(func):
+    """Return ``(function, filter_function)`` if ``func`` is applied to each dataset separately, otherwise ``None``.
+
+    Recognizes ``TransformationWrapper`` instances without their own executor, and functions decorated with ``single_input``."""
+    from .transformations.utils import single_input
+    from .wrapper import TransformationWrapper
+
+    if isinstance(func, TransformationWrapper) and func.executor is None:
+        return func.func, func.filter_function
+    elif (isinstance(func, wrapt.FunctionWrapper)
+          and getattr(func, '_self_wrapper', None) is single_input.__wrapped__):
+        return func.__wrapped__, None
+
+
+def fuse_functions(functions, split_after=lambda index: False):
+    """Replace runs of consecutive single-dataset functions with ``FusedPass`` objects.
+
+    Applying each of these functions in turn builds a new list of all datasets every time. A ``FusedPass`` instead applies all the functions in the run to the first dataset (and the datasets it was split into), then to the second dataset, and so on. The result is the same, as long as the functions don't depend on the order in which datasets are processed.
+
+    ``split_after`` is called with the position of each function in ``functions``; runs are not fused across a function for which it returns ``True``, e.g. because its intermediate result should be saved."""
+    fused, run = [], []
+
+    def end_run():
+        if len(run) > 1:
+            fused.append(FusedPass(run[:]))
+        else:
+            fused.extend(run)
+        del run[:]
+
+    for index, func in enumerate(unwrap_functions(functions)):
+        if single_dataset_step(func) is None:
+            end_run()
+            fused.append(func)
+        else:
+            run.append(func)
+            if split_after(index):
+                end_run()
+    end_run()
+    return fused
+
+
+class FusedPass(object):
+    """Apply several single-dataset functions in one pass over the datasets.
+
+    Log messages are collected separately for each function, so that ``system_model`` can still write separate function start and end log messages, with the messages of each function in between."""
+    def __init__(self, functions):
+        self.functions = functions
+        self.steps = [single_dataset_step(func) for func in functions]
+
+    def __iter__(self):
+        return iter(self.functions)
+
+    def __len__(self):
+        return len(self.functions)
+
+    def __call__(self, data):
+        data, _, _, records = self.run(data)
+        for step in records:
+            for record in step:
+                logging.getLogger(record.name).handle(record)
+        return data
+
+    def run(self, data):
+        """Return ``(data, counts, durations, records)``.
+
+        ``counts`` and ``durations`` are the number of datasets after, and the time spent in, each function. ``records`` are the log records emitted by each function."""
+        counts = [0] * len(self.steps)
+        durations = [0.] * len(self.steps)
+        records = [[] for _ in self.steps]
+        current = [0]
+        output = []
+        with _collect_log_records(lambda record: records[current[0]].append(record)):
+            for ds in data:
+                datasets = [ds]
+                for index, (func, filter_function) in enumerate(self.steps):
+                    current[0] = index
+                    start = time.perf_counter()
+                    datasets = [child for obj in datasets for child in (
+                        func(obj) if filter_function is None
+                        or filter_function(obj) else [obj]
+                    )]
+                    durations[index] += time.perf_counter() - start
+                    counts[index] += len(datasets)
+                output.extend(datasets)
+        return output, counts, durations, records
+
+    def __str__(self):
+        return "Fused pass of {} functions".format(len(self))
+
+    __repr__ = lambda self: str(self)
+
+
+class _Collector(logging.Handler):
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def emit(self, record):
+        self.callback(record)
+
+
+@contextlib.contextmanager
+def _collect_log_records(callback):
+    """Context manager which temporarily sends all records of the Ocelot loggers to ``callback``"""
+    saved = {}
+    for name in ('ocelot', 'ocelot-detailed'):
+        logger = logging.getLogger(name)
+        saved[name] = (logger.handlers, logger.propagate)
+        logger.handlers, logger.propagate = [_Collector(callback)], False
+    try:
+        yield
+    finally:
+        for name, (handlers, propagate) in saved.items():
+            logger = logging.getLogger(name)
+            logger.handlers, logger.propagate = handlers, propagate
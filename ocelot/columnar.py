@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""Memory-mapped columnar storage for the extraction cache.
+
+The cache is a directory of NumPy ``.npy`` files, one per column, plus a shared string table and a blob file:
+
+* ``strings.bin`` and ``string_offsets.npy``: Every distinct string, UTF-8 encoded and concatenated. String columns store an index into this table.
+* ``exchanges/*.npy``: One row per exchange. Numeric fields (``amount``, production volume ``amount``, ``conditional exchange``) are stored directly; string fields are string table indices.
+* ``datasets/*.npy``: One row per dataset. String fields, plus the offset and count of the dataset's exchanges, and the offset and length of its blob.
+* ``files/*.npy``: One row per source file, with the offset and count of its datasets.
+* ``blobs.bin``: One pickle per dataset with everything that doesn't fit in a column, e.g. parameters, properties, and uncertainty distributions.
+
+All arrays are memory-mapped on load, and datasets are only turned back into dictionaries when they are accessed. All strings in materialized datasets are interned."""
+from .records import dataset_record
+from collections import OrderedDict
+from collections.abc import Mapping, MutableSequence
+import json
+import numpy as np
+import os
+import pickle
+import shutil
+import sys
+
+COLUMNAR_VERSION = 1
+
+# String index sentinels
+ABSENT, NONE = -1, -2
+
+DATASET_STRINGS = (
+    'filepath',
+    'id',
+    'parent',
+    'name',
+    'location',
+    'type',
+    'technology level',
+    'start date',
+    'end date',
+    'economic scenario',
+    'access restricted',
+    'dataset author',
+    'data entry',
+    'ISIC classification',
+)
+
+EXCHANGE_STRINGS = (
+    'id',
+    'tag',
+    'name',
+    'unit',
+    'type',
+    'compartment',
+    'subcompartment',
+    'activity link',
+    'byproduct classification',
+    'variable',
+    'formula',
+)
+
+
+def column_filename(field):
+    return field.replace(" ", "_") + ".npy"
+
+
+class StringTable(object):
+    """Assign a stable integer index to each distinct string"""
+    def __init__(self):
+        self.index = {}
+        # Strings in index order
+        self.strings = []
+
+    def __call__(self, value):
+        if value is None:
+            return NONE
+        try:
+            return self.index[value]
+        except KeyError:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+            return self.index[value]
+
+    def write(self, dirpath):
+        encoded = [string.encode('utf-8') for string in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x in encoded])
+        np.save(os.path.join(dirpath, "string_offsets.npy"), offsets)
+        with open(os.path.join(dirpath, "strings.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+
+
+def _is_string(value):
+    return value is None or isinstance(value, str)
+
+
+def _is_float(value):
+    return isinstance(value, float) and value == value
+
+
+def _encode_exchange(exc, strings, columns):
+    """Append the columnar fields of ``exc`` to ``columns``; return a dictionary of the remaining fields"""
+    stored = set()
+    for field in EXCHANGE_STRINGS:
+        if field in exc and _is_string(exc[field]):
+            columns[field].append(strings(exc[field]))
+            stored.add(field)
+        else:
+            columns[field].append(ABSENT)
+    if _is_float(exc.get('amount')):
+        columns['amount'].append(exc['amount'])
+        stored.add('amount')
+    else:
+        columns['amount'].append(np.nan)
+    if isinstance(exc.get('conditional exchange'), bool):
+        columns['conditional exchange'].append(int(exc['conditional exchange']))
+        stored.add('conditional exchange')
+    else:
+        columns['conditional exchange'].append(ABSENT)
+
+    extra = {key: value for key, value in exc.items() if key not in stored}
+    pv = extra.get('production volume')
+    if isinstance(pv, Mapping) and _is_float(pv.get('amount')):
+        columns['production volume'].append(pv['amount'])
+        extra['production volume'] = {k: v for k, v in pv.items()
+                                      if k != 'amount'}
+    else:
+        columns['production volume'].append(np.nan)
+    return extra
+
+
+def write_columnar_cache(data, dirpath):
+    """Write ``data`` to the columnar cache directory ``dirpath``.
+
+    ``data`` is either a dictionary of ``{filename: [datasets]}``, or an iterable of ``(filename, datasets)`` pairs in any order. Pairs are encoded as soon as they arrive, so a generator of extraction results never needs to be held in memory as dictionaries.
+
+    The cache is written to a temporary directory first, and then moved into place, replacing any existing cache."""
+    tmp_dirpath = dirpath + ".tmp"
+    if os.path.exists(tmp_dirpath):
+        shutil.rmtree(tmp_dirpath)
+    for subdirectory in ("files", "datasets", "exchanges"):
+        os.makedirs(os.path.join(tmp_dirpath, subdirectory))
+
+    strings = StringTable()
+    files = {'name': [], 'dataset start': [], 'dataset count': []}
+    datasets = {field: [] for field in DATASET_STRINGS + (
+        'exchange start', 'exchange count', 'blob start', 'blob length')}
+    exchanges = {field: [] for field in EXCHANGE_STRINGS + (
+        'amount', 'conditional exchange', 'production volume')}
+
+    if isinstance(data, Mapping):
+        data = sorted(data.items())
+
+    with open(os.path.join(tmp_dirpath, "blobs.bin"), "wb") as blobs:
+        for filename, file_datasets in data:
+            files['name'].append(strings(filename))
+            files['dataset start'].append(len(datasets['id']))
+            files['dataset count'].append(len(file_datasets))
+            for ds in file_datasets:
+                for field in DATASET_STRINGS:
+                    if field in ds and _is_string(ds[field]):
+                        datasets[field].append(strings(ds[field]))
+                    else:
+                        datasets[field].append(ABSENT)
+                extra = {
+                    'dataset': {
+                        key: value for key, value in ds.items()
+                        if key != 'exchanges'
+                        and not (key in DATASET_STRINGS and _is_string(value))
+                    },
+                    'exchanges': [
+                        _encode_exchange(exc, strings, exchanges)
+                        for exc in ds.get('exchanges', [])
+                    ],
+                    'has exchanges': 'exchanges' in ds,
+                }
+                blob = pickle.dumps(extra, protocol=pickle.HIGHEST_PROTOCOL)
+                datasets['exchange start'].append(
+                    len(exchanges['amount']) - len(extra['exchanges']))
+                datasets['exchange count'].append(len(extra['exchanges']))
+                datasets['blob start'].append(blobs.tell())
+                datasets['blob length'].append(len(blob))
+                blobs.write(blob)
+
+    dtypes = {
+        'amount': np.float64,
+        'production volume': np.float64,
+        'conditional exchange': np.int8,
+    }
+    for subdirectory, columns in (("files", files),
+                                  ("datasets", datasets),
+                                  ("exchanges", exchanges)):
+        for field, values in columns.items():
+            np.save(
+                os.path.join(tmp_dirpath, subdirectory, column_filename(field)),
+                np.array(values, dtype=dtypes.get(field, np.int64))
+            )
+    strings.write(tmp_dirpath)
+    with open(os.path.join(tmp_dirpath, "format.json"), "w") as f:
+        json.dump({'version': COLUMNAR_VERSION}, f)
+
+    if os.path.exists(dirpath):
+        shutil.rmtree(dirpath)
+    os.rename(tmp_dirpath, dirpath)
+    return dirpath
+
+
+def _load(filepath):
+    """Memory-map a ``.npy`` file; empty arrays can't be mapped and are loaded normally"""
+    try:
+        return np.load(filepath, mmap_mode='r')
+    except ValueError:
+        return np.load(filepath)
+
+
+def _load_bytes(filepath):
+    if not os.path.getsize(filepath):
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(filepath, dtype=np.uint8, mode='r')
+
+
+class ColumnarCache(Mapping):
+    """Read-only access to a columnar cache directory written by ``write_columnar_cache``.
+
+    Behaves like a dictionary of ``{filename: [datasets]}``; datasets are materialized each time a filename is looked up. Use ``datasets()`` to get a lazy sequence of all datasets instead.
+
+    If ``records``, datasets are materialized as slotted ``ocelot.records.Dataset`` records instead of dictionaries."""
+    def __init__(self, dirpath, records=False):
+        with open(os.path.join(dirpath, "format.json")) as f:
+            if json.load(f)['version'] != COLUMNAR_VERSION:
+                raise ValueError("Unsupported columnar cache format")
+        self.dirpath = dirpath
+        self.records = records
+        self.string_offsets = _load(os.path.join(dirpath, "string_offsets.npy"))
+        self.string_bytes = _load_bytes(os.path.join(dirpath, "strings.bin"))
+        self.blobs = _load_bytes(os.path.join(dirpath, "blobs.bin"))
+        self.strings = [None] * (len(self.string_offsets) - 1)
+        self.files = self._load_columns(
+            "files", ('name', 'dataset start', 'dataset count'))
+        self.datasets_table = self._load_columns(
+            "datasets", DATASET_STRINGS + (
+                'exchange start', 'exchange count', 'blob start', 'blob length'))
+        self.exchanges_table = self._load_columns(
+            "exchanges", EXCHANGE_STRINGS + (
+                'amount', 'conditional exchange', 'production volume'))
+        # Files can be written in any order; always present them sorted
+        self.filenames = OrderedDict(sorted(
+            (self.string(index), position)
+            for position, index in enumerate(self.files['name'].tolist())
+        ))
+
+    def close(self):
+        """Drop all memory-mapped arrays, so that the cache directory can be replaced or deleted, also on Windows.
+
+        The cache can't be used afterwards, but datasets which were already materialized are not affected."""
+        self.string_offsets = self.string_bytes = self.blobs = None
+        self.files, self.datasets_table, self.exchanges_table = {}, {}, {}
+
+    def _load_columns(self, subdirectory, fields):
+        return {
+            field: _load(os.path.join(self.dirpath, subdirectory,
+                                      column_filename(field)))
+            for field in fields
+        }
+
+    def string(self, index):
+        """Return the string at ``index``. Equal indices return the same object."""
+        if index == NONE:
+            return None
+        value = self.strings[index]
+        if value is None:
+            start, end = self.string_offsets[index:index + 2].tolist()
+            value = self.strings[index] = sys.intern(
+                self.string_bytes[start:end].tobytes().decode('utf-8')
+            )
+        return value
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __iter__(self):
+        return iter(self.filenames)
+
+    def __getitem__(self, filename):
+        position = self.filenames[filename]
+        start = int(self.files['dataset start'][position])
+        count = int(self.files['dataset count'][position])
+        return [self.dataset(index) for index in range(start, start + count)]
+
+    def datasets(self):
+        """Return a ``LazyDatasets`` sequence of all datasets, in filename order"""
+        starts = self.files['dataset start'].tolist()
+        counts = self.files['dataset count'].tolist()
+        return LazyDatasets(self, (
+            index
+            for position in self.filenames.values()
+            for index in range(starts[position],
+                               starts[position] + counts[position])
+        ))
+
+    def dataset(self, index):
+        """Materialize the dataset at row ``index`` as a new dictionary, or a new ``Dataset`` record if ``self.records``"""
+        # Not imported at module level: ``ocelot.io`` imports ``ocelot.filesystem``, which imports this module
+        from .io.compact import intern_strings
+        table = self.datasets_table
+        ds = {}
+        for field in DATASET_STRINGS:
+            value = int(table[field][index])
+            if value != ABSENT:
+                ds[field] = self.string(value)
+        start = int(table['blob start'][index])
+        end = start + int(table['blob length'][index])
+        extra = intern_strings(pickle.loads(self.blobs[start:end].tobytes()))
+        ds.update(extra['dataset'])
+
+        start = int(table['exchange start'][index])
+        end = start + int(table['exchange count'][index])
+        columns = {field: column[start:end].tolist()
+                   for field, column in self.exchanges_table.items()}
+        exchanges = []
+        for row, remainder in enumerate(extra['exchanges']):
+            exc = {}
+            for field in EXCHANGE_STRINGS:
+                value = columns[field][row]
+                if value != ABSENT:
+                    exc[field] = self.string(value)
+            amount = columns['amount'][row]
+            if amount == amount:
+                exc['amount'] = amount
+            conditional = columns['conditional exchange'][row]
+            if conditional != ABSENT:
+                exc['conditional exchange'] = bool(conditional)
+            exc.update(remainder)
+            pv = columns['production volume'][row]
+            if pv == pv:
+                exc['production volume'] = dict(
+                    {'amount': pv}, **remainder['production volume'])
+            exchanges.append(exc)
+        if extra['has exchanges']:
+            ds['exchanges'] = exchanges
+        return dataset_record(ds) if self.records else ds
+
+
+class LazyDatasets(MutableSequence):
+    """List-like sequence of datasets which are only materialized from a ``ColumnarCache`` when accessed.
+
+    Materialized datasets are kept, so changes made by transformation functions are not lost. Pickling a ``LazyDatasets`` materializes everything and produces a normal list."""
+    def __init__(self, cache, indices):
+        self.cache = cache
+        # Integers are rows in the cache which haven't been materialized yet
+        self.items = list(indices)
+
+    def _get(self, position):
+        item = self.items[position]
+        if isinstance(item, int):
+            item = self.items[position] = self.cache.dataset(item)
+        return item
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(position)
+                    for position in range(*index.indices(len(self.items)))]
+        return self._get(index)
+
+    def __setitem__(self, index, obj):
+        self.items[index] = obj
+
+    def __delitem__(self, index):
+        del self.items[index]
+
+    def __len__(self):
+        return len(self.items)
+
+    def insert(self, index, obj):
+        self.items.insert(index, obj)
+
+    def materialize(self):
+        """Return all datasets as a normal list"""
+        return [self._get(position) for position in range(len(self.items))]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyDatasets)):
+            return self.materialize() == list(other)
+        return NotImplemented
+
+    def __add__(self, other):
+        return self.materialize() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.materialize()
+
+    def __reduce__(self):
+        return (list, (self.materialize(),))
+
+    def __repr__(self):
+        materialized = sum(1 for item in self.items if not isinstance(item, int))
+        return "LazyDatasets with {} datasets ({} materialized)".format(
+            len(self.items), materialized)
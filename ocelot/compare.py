@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Compare the results of two model runs.
+
+Datasets are matched by their ``code``, or by ``activity_hash`` if they don't have a code, using dictionaries, so matching is linear in the number of datasets. Exchanges within matched datasets are matched by type, name, unit, compartment, and linked ``code``. All amounts of matched exchanges are then compared at once with ``numpy.isclose``.
+
+The result of ``compare_results`` is a dictionary with a ``summary`` and a list of per-dataset differences in ``datasets``; see ``ocelot-compare --help`` for the command line interface."""
+from .errors import OutputDirectoryError
+from .filesystem import find_pickle, find_run_directory, load_pickle
+from .transformations.utils import activity_hash
+from collections import Counter
+import numpy as np
+import os
+
+DEFAULT_RTOL = 1e-6
+DEFAULT_ATOL = 1e-12
+
+# Dataset fields compared for matched datasets
+DATASET_FIELDS = ("name", "location", "type", "reference product", "unit")
+
+
+def load_results(spec):
+    """Load model run results from ``spec``.
+
+    ``spec`` is the path of a results pickle (which can be compressed), a model run (report id or run directory), which loads the final results, or ``"<run>:<index>"``, which loads the intermediate result saved after transformation function ``<index>``."""
+    if os.path.isfile(spec):
+        filepath = spec
+    else:
+        run, index = spec, None
+        if ":" in spec:
+            head, tail = spec.rsplit(":", 1)
+            if tail.isdigit():
+                run, index = head, tail
+        directory = find_run_directory(run)
+        if directory is None:
+            raise OutputDirectoryError("Can't find model run {}".format(run))
+        if index is None:
+            filenames = ["final-results.pickle"]
+        else:
+            filenames = sorted(filename[:filename.index(".pickle") + 7]
+                               for filename in os.listdir(directory)
+                               if ".pickle" in filename
+                               and not filename.endswith(".tmp")
+                               and filename.split(".")[0] == index)
+        filepath = (find_pickle(os.path.join(directory, filenames[0]))
+                    if filenames else None)
+        if filepath is None:
+            raise OutputDirectoryError("No saved results {} in model run {}".format(
+                index or "final-results", run))
+    return load_pickle(filepath)
+
+
+def dataset_key(ds):
+    return ds.get('code') or activity_hash(ds)
+
+
+def exchange_key(exc):
+    return (
+        exc['type'],
+        exc['name'],
+        exc.get('unit'),
+        exc.get('compartment'),
+        exc.get('subcompartment'),
+        exc.get('code'),
+    )
+
+
+def format_exchange_key(key):
+    type_, name, unit, compartment, subcompartment, code, *occurrence = key
+    label = "{}: {} ({})".format(type_, name, unit)
+    if compartment:
+        label += " [{}]".format("/".join(filter(None, (compartment, subcompartment))))
+    if code:
+        label += " <- {}".format(code)
+    if occurrence:
+        label += " #{}".format(occurrence[0])
+    return label
+
+
+def index_by(objs, key_func):
+    """Return ``{key: obj}``. Repeated keys get an occurrence number as an extra element."""
+    index, seen = {}, Counter()
+    for obj in objs:
+        key = key_func(obj)
+        if seen[key]:
+            new_key = (key + (seen[key],) if isinstance(key, tuple)
+                       else (key, seen[key]))
+        else:
+            new_key = key
+        seen[key] += 1
+        index[new_key] = obj
+    return index
+
+
+def compare_results(first, second, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    """Compare two lists of datasets.
+
+    Returns a dictionary with ``summary`` counts, and ``datasets``, a list of differences for each matched dataset which differs, and for each dataset which is only in one of the results."""
+    first_index = index_by(first, dataset_key)
+    second_index = index_by(second, dataset_key)
+    diffs = {}
+    # Matched exchange amounts, and (dataset key, exchange key) for each pair
+    amounts, labels = [], []
+
+    def diff_for(key, ds):
+        if key not in diffs:
+            diffs[key] = {
+                'key': str(key),
+                'name': ds.get('name'),
+                'location': ds.get('location'),
+                'reference product': ds.get('reference product'),
+                'fields': {},
+                'only in first': [],
+                'only in second': [],
+                'amounts': [],
+            }
+        return diffs[key]
+
+    only_first = [key for key in first_index if key not in second_index]
+    only_second = [key for key in second_index if key not in first_index]
+    for key in only_first:
+        diff_for(key, first_index[key])['status'] = "only in first"
+    for key in only_second:
+        diff_for(key, second_index[key])['status'] = "only in second"
+
+    matched = [key for key in first_index if key in second_index]
+    for key in matched:
+        a, b = first_index[key], second_index[key]
+        fields = {field: [a.get(field), b.get(field)] for field in DATASET_FIELDS
+                  if a.get(field) != b.get(field)}
+        if fields:
+            diff_for(key, a)['fields'] = fields
+        a_exchanges = index_by(a['exchanges'], exchange_key)
+        b_exchanges = index_by(b['exchanges'], exchange_key)
+        missing = [exc for exc in a_exchanges if exc not in b_exchanges]
+        extra = [exc for exc in b_exchanges if exc not in a_exchanges]
+        if missing or extra:
+            diff = diff_for(key, a)
+            diff['only in first'] = [format_exchange_key(exc) for exc in missing]
+            diff['only in second'] = [format_exchange_key(exc) for exc in extra]
+        for exc_key, exc in a_exchanges.items():
+            if exc_key in b_exchanges:
+                amounts.append((exc['amount'], b_exchanges[exc_key]['amount']))
+                labels.append((key, exc_key))
+
+    if amounts:
+        array = np.array(amounts, dtype=float)
+        close = np.isclose(array[:, 0], array[:, 1], rtol=rtol, atol=atol,
+                           equal_nan=True)
+        for position in np.flatnonzero(~close):
+            key, exc_key = labels[position]
+            diff_for(key, first_index[key])['amounts'].append([
+                format_exchange_key(exc_key),
+                float(array[position, 0]),
+                float(array[position, 1]),
+            ])
+
+    for diff in diffs.values():
+        diff.setdefault('status', "changed")
+
+    return {
+        'summary': {
+            'datasets in first': len(first_index),
+            'datasets in second': len(second_index),
+            'matched datasets': len(matched),
+            'only in first': len(only_first),
+            'only in second': len(only_second),
+            'changed datasets': sum(1 for diff in diffs.values()
+                                    if diff['status'] == "changed"),
+            'compared exchanges': len(amounts),
+            'changed amounts': sum(len(diff['amounts']) for diff in diffs.values()),
+        },
+        'datasets': list(diffs.values()),
+    }
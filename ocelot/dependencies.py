@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Find the datasets which can influence the result for a few selected datasets.
+
+When debugging a single dataset or product, most of the database is irrelevant. ``dependency_closure`` finds all datasets which can change the selected datasets during a model run, so that the system model can be run on only these datasets.
+
+Dataset ``A`` depends on dataset ``B`` if:
+
+* ``A`` has an activity link to ``B``, or ``B`` has an activity link to ``A`` (hard links change the production volume of the linked dataset, which changes its share in markets),
+* ``B`` is the parent activity of ``A``,
+* ``A`` is a market activity or market group, and ``B`` produces its reference product (as reference product or byproduct); this covers market suppliers and markets supplying market groups,
+* ``A`` and ``B`` have the same activity name and a product in common, as regional datasets change the global dataset into a rest-of-world dataset.
+
+Technosphere inputs without activity links are linked to markets and market groups during the model run. For the selected datasets, all markets and market groups for these inputs are added to the closure, together with their own dependencies, so that the inputs of the selected datasets are linked as in a full model run. These inputs are not followed any further than this, i.e. not for the datasets which the selected datasets depend on, as this would include almost every supply chain."""
+from .errors import NoMatchingDatasets
+from collections import defaultdict, deque
+import os
+
+MARKETS = ("market activity", "market group")
+
+
+def reference_products(ds):
+    products = {exc['name'] for exc in ds['exchanges']
+                if exc['type'] == 'reference product'}
+    if ds.get('reference product'):
+        products.add(ds['reference product'])
+    return products
+
+
+def products(ds):
+    return reference_products(ds).union(
+        exc['name'] for exc in ds['exchanges'] if exc['type'] == 'byproduct')
+
+
+class DependencyGraph(object):
+    """Graph of dependencies between the datasets in ``data``.
+
+    Nodes are indices into ``data``, as dataset ids are not unique."""
+    def __init__(self, data):
+        self.data = data
+        self.by_id = defaultdict(list)
+        self.by_product = defaultdict(list)
+        self.by_activity = defaultdict(list)
+        self.linked_from = defaultdict(set)
+        for index, ds in enumerate(data):
+            self.by_id[ds['id']].append(index)
+            for product in products(ds):
+                self.by_product[product].append(index)
+                self.by_activity[(ds['name'], product)].append(index)
+        for index, ds in enumerate(data):
+            for exc in ds['exchanges']:
+                if exc.get('activity link'):
+                    for target in self.by_id[exc['activity link']]:
+                        self.linked_from[target].add(index)
+
+    def dependencies(self, index):
+        """Return the indices of the datasets which ``data[index]`` directly depends on"""
+        ds = self.data[index]
+        found = set(self.linked_from[index])
+        for exc in ds['exchanges']:
+            if exc.get('activity link'):
+                found.update(self.by_id[exc['activity link']])
+        if ds.get('parent'):
+            found.update(self.by_id[ds['parent']])
+        for product in products(ds):
+            found.update(self.by_activity[(ds['name'], product)])
+        if ds['type'] in MARKETS:
+            for product in reference_products(ds):
+                found.update(self.by_product[product])
+        found.discard(index)
+        return found
+
+    def input_markets(self, index):
+        """Return the indices of the markets and market groups which can supply the unlinked technosphere inputs of ``data[index]``"""
+        found = set()
+        for exc in self.data[index]['exchanges']:
+            if exc['type'] == 'from technosphere' and not exc.get('activity link'):
+                found.update(other for other in self.by_product[exc['name']]
+                             if self.data[other]['type'] in MARKETS
+                             and exc['name'] in reference_products(self.data[other]))
+        found.discard(index)
+        return found
+
+    def select(self, selector):
+        """Return the indices of the datasets matching ``selector``.
+
+        ``selector`` can be a dataset filepath or filename, a dataset id, or the name of a reference product."""
+        found = set(self.by_id.get(selector, []))
+        found.update(index for index, ds in enumerate(self.data)
+                     if selector in reference_products(ds))
+        found.update(index for index, ds in enumerate(self.data)
+                     if ds.get('filepath') and (
+                        ds['filepath'] == selector
+                        or os.path.basename(ds['filepath']) == selector))
+        return found
+
+    def closure(self, indices):
+        """Return the indices of ``indices`` and all datasets they depend on, directly or indirectly"""
+        seen = set(indices)
+        queue = deque(seen)
+        while queue:
+            for index in self.dependencies(queue.popleft()):
+                if index not in seen:
+                    seen.add(index)
+                    queue.append(index)
+        return seen
+
+
+def dependency_closure(data, selectors):
+    """Return the datasets in ``data`` matching ``selectors``, together with the markets for their inputs, and all datasets these depend on.
+
+    ``selectors`` is a list of dataset filepaths, filenames, ids, or reference product names. Datasets are returned in their original order. Raises ``NoMatchingDatasets`` if a selector doesn't match any dataset."""
+    if isinstance(selectors, str):
+        selectors = [selectors]
+    graph = DependencyGraph(data)
+    selected = set()
+    for selector in selectors:
+        found = graph.select(selector)
+        if not found:
+            raise NoMatchingDatasets(
+                "No dataset filepath, id or reference product matches {}".format(selector))
+        selected.update(found)
+    markets = {market for index in selected for market in graph.input_markets(index)}
+    closure = graph.closure(selected.union(markets))
+    return [ds for index, ds in enumerate(data) if index in closure]
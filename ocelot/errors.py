@@ -99,3 +99,11 @@ class MissingAlternativeProducer(OcelotError):
 class MarketGroupError(OcelotError):
     """Error with market group definition or suppliers"""
     pass
+
+class InvalidCheckpoint(OcelotError):
+    """Intermediate result can't be found, or was created with a different configuration"""
+    pass
+
+class NoMatchingDatasets(OcelotError):
+    """No dataset matches the given filepath, id, or product name"""
+    pass
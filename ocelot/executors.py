@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Apply single-dataset transformation functions serially, in threads, or in worker processes.
+
+``TransformationWrapper`` and the ``single_input`` decorator apply a function to each dataset independently, so the datasets can be split into chunks and handed to workers. Every executor has a ``map(function, datasets)`` method which returns the results in the same order as the input datasets.
+
+The executor is chosen per model run with ``system_model(..., executor="process")``, which sets the *current executor*, or per wrapper with ``TransformationWrapper(..., executor="thread")``. Executors can be given as an instance, or as one of the strings ``"serial"``, ``"thread"``, or ``"process"``. The default is serial.
+
+Messages logged to the ``ocelot`` and ``ocelot-detailed`` loggers in worker processes are collected and passed to the loggers in the main process, in the order of the input datasets. Worker threads log directly. Inside a worker, nested wrappers always run serially."""
+from concurrent.futures import ThreadPoolExecutor as _ThreadPool
+import contextlib
+import importlib
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import warnings
+
+# Default number of datasets sent to a worker at once
+DEFAULT_CHUNKSIZE = 100
+
+LOGGER_NAMES = ('ocelot', 'ocelot-detailed')
+
+_local = threading.local()
+
+
+def _chunks(items, chunksize):
+    return [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+
+class SerialExecutor(object):
+    """Apply the function to each dataset in turn, in this thread"""
+    def map(self, function, datasets):
+        return [function(ds) for ds in datasets]
+
+    def close(self):
+        pass
+
+
+class ThreadExecutor(object):
+    """Apply the function to chunks of datasets in a pool of ``workers`` threads.
+
+    Only useful for functions which spend most of their time outside the Python interpreter, e.g. in numpy or I/O."""
+    def __init__(self, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+        self.workers = workers or os.cpu_count()
+        self.chunksize = chunksize
+        self.pool = None
+
+    def map(self, function, datasets):
+        datasets = list(datasets)
+        if len(datasets) <= self.chunksize or getattr(_local, 'in_worker', False):
+            return SerialExecutor().map(function, datasets)
+        if self.pool is None:
+            self.pool = _ThreadPool(self.workers)
+        chunks = self.pool.map(_run_thread_chunk,
+                               [(function, chunk) for chunk in
+                                _chunks(datasets, self.chunksize)])
+        return [result for chunk in chunks for result in chunk]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+class ProcessExecutor(object):
+    """Apply the function to chunks of datasets in a pool of ``workers`` processes.
+
+    The function and datasets must be picklable. Functions decorated with ``wrapt`` (like ``single_input`` functions) are sent by reference. If the function can't be pickled, it is applied serially, with a warning."""
+    def __init__(self, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+        self.workers = workers or os.cpu_count()
+        self.chunksize = chunksize
+        self.pool = None
+
+    def map(self, function, datasets):
+        datasets = list(datasets)
+        if len(datasets) <= self.chunksize or getattr(_local, 'in_worker', False):
+            return SerialExecutor().map(function, datasets)
+        sendable = _picklable(function)
+        if sendable is None:
+            return SerialExecutor().map(function, datasets)
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        levels = {name: logging.getLogger(name).getEffectiveLevel()
+                  for name in LOGGER_NAMES}
+        chunks = self.pool.map(_run_process_chunk,
+                               [(sendable, chunk, levels) for chunk in
+                                _chunks(datasets, self.chunksize)],
+                               chunksize=1)
+        results = []
+        for chunk, records in chunks:
+            for name, record in records:
+                logging.getLogger(name).handle(logging.makeLogRecord(record))
+            results.extend(chunk)
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+EXECUTORS = {
+    'serial': SerialExecutor,
+    'thread': ThreadExecutor,
+    'process': ProcessExecutor,
+}
+
+_current = SerialExecutor()
+
+
+def create_executor(executor, workers=None):
+    """Return an executor for ``executor``, which is an executor or one of ``"serial"``, ``"thread"``, and ``"process"``"""
+    if isinstance(executor, str):
+        try:
+            cls = EXECUTORS[executor]
+        except KeyError:
+            raise ValueError("Unknown executor {}; must be one of {}".format(
+                executor, ", ".join(sorted(EXECUTORS))))
+        return cls() if cls is SerialExecutor else cls(workers)
+    return executor
+
+
+@contextlib.contextmanager
+def open_executor(executor=None):
+    """Context manager which yields ``executor`` if given, otherwise the current executor.
+
+    Executors created from strings are closed afterwards."""
+    if executor is None:
+        yield _current
+    elif isinstance(executor, str):
+        executor = create_executor(executor)
+        try:
+            yield executor
+        finally:
+            executor.close()
+    else:
+        yield executor
+
+
+@contextlib.contextmanager
+def use_executor(executor, workers=None):
+    """Context manager which sets the current executor, and closes it afterwards if it was created here"""
+    global _current
+    previous, created = _current, isinstance(executor, str)
+    _current = create_executor(executor, workers)
+    try:
+        yield _current
+    finally:
+        if created:
+            _current.close()
+        _current = previous
+
+
+class _Reference(object):
+    """Picklable reference to the function wrapped by the module-level object ``module.qualname``"""
+    def __init__(self, module, qualname):
+        self.module, self.qualname = module, qualname
+
+    def __call__(self, ds):
+        obj = importlib.import_module(self.module)
+        for name in self.qualname.split("."):
+            obj = getattr(obj, name)
+        return obj.__wrapped__(ds)
+
+
+def _picklable(function):
+    try:
+        pickle.dumps(function)
+        return function
+    except Exception:
+        pass
+    module = getattr(function, "__module__", None)
+    qualname = getattr(function, "__qualname__", "")
+    try:
+        obj = importlib.import_module(module)
+        for name in qualname.split("."):
+            obj = getattr(obj, name)
+        if getattr(obj, "__wrapped__", None) is function:
+            return _Reference(module, qualname)
+    except (ImportError, AttributeError, TypeError, ValueError):
+        pass
+    warnings.warn("Can't send {} to worker processes; applying it serially"
+                  .format(getattr(function, "__name__", function)))
+    return None
+
+
+def _run_thread_chunk(args):
+    function, chunk = args
+    _local.in_worker = True
+    try:
+        return [function(ds) for ds in chunk]
+    finally:
+        _local.in_worker = False
+
+
+class _RecordCollector(logging.Handler):
+    def __init__(self, name, records):
+        super().__init__()
+        self.name, self.records = name, records
+
+    def emit(self, record):
+        record = dict(record.__dict__, exc_info=None)
+        self.records.append((self.name, record))
+
+
+def _run_process_chunk(args):
+    function, chunk, levels = args
+    records, saved = [], {}
+    for name in LOGGER_NAMES:
+        logger = logging.getLogger(name)
+        saved[name] = (logger.handlers, logger.level, logger.propagate)
+        logger.handlers = [_RecordCollector(name, records)]
+        logger.setLevel(levels[name])
+        logger.propagate = False
+    _local.in_worker = True
+    try:
+        return [function(ds) for ds in chunk], records
+    finally:
+        _local.in_worker = False
+        for name, (handlers, level, propagate) in saved.items():
+            logger = logging.getLogger(name)
+            logger.handlers, logger.level, logger.propagate = handlers, level, propagate
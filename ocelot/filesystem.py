@@ -1,18 +1,41 @@
 # -*- coding: utf-8 -*-
-from .errors import OutputDirectoryError
+from .columnar import ColumnarCache, write_columnar_cache
+from .errors import InvalidCheckpoint, OutputDirectoryError
 import appdirs
+import gzip
 import hashlib
+import json
 import os
 import pickle
 import re
 import unicodedata
 import uuid
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
 # Ecospold 2 extractor version. Bump this to invalidate all caches.
-__io_version__ = "8"
+__io_version__ = "10"
 
 re_slugify = re.compile('[^\w\s-]', re.UNICODE)
 
+# Filename suffixes of compressed pickles
+COMPRESSION_SUFFIXES = {
+    None: "",
+    "gzip": ".gz",
+    "lz4": ".lz4",
+    "zstd": ".zst",
+}
+
+# Fastest available compression for model run results
+DEFAULT_COMPRESSION = ("zstd" if zstandard else "lz4" if lz4_frame else None)
+
 
 def safe_filename(string):
     """Convert arbitrary strings to make them safe for filenames. Substitutes strange characters, and uses unicode normalization.
@@ -79,45 +102,175 @@ def get_base_directory():
 def get_cache_filepath_for_data_path(data_path):
     """Return the cache directory for source directory ``data_path``.
 
-    The cache filepath is in the directory returned by ``get_cache_directory``. The file name is the MD5 hash of the string ``data_path`` + ``__io_version__``, plus the suffix ``".pickle"``"""
+    The cache filepath is in the directory returned by ``get_cache_directory``. The file name is the MD5 hash of the string ``data_path`` + ``__io_version__``, plus the suffix ``".columnar"``. The cache itself is a directory; see ``ocelot.columnar``."""
     return os.path.join(
         get_cache_directory(),
         hashlib.md5(
             (os.path.abspath(data_path) + __io_version__).encode("utf-8")
-        ).hexdigest() + ".pickle"
+        ).hexdigest() + ".columnar"
+    )
+
+
+def get_manifest_filepath_for_data_path(data_path):
+    """Return the filepath of the per-file cache manifest for source directory ``data_path``.
+
+    The manifest sits next to the cache file, with the suffix ``".manifest.json"``."""
+    return get_cache_filepath_for_data_path(data_path) + ".manifest.json"
+
+
+def get_validation_cache_filepath_for_data_path(data_path):
+    """Return the filepath of the cached internal validation verdicts for source directory ``data_path``.
+
+    The verdicts sit next to the cache file, with the suffix ``".validation.json"``."""
+    return get_cache_filepath_for_data_path(data_path) + ".validation.json"
+
+
+def list_source_files(data_path):
+    """Return sorted list of the ``.spold`` filenames in ``data_path``"""
+    return sorted(
+        filename for filename in os.listdir(data_path)
+        if filename.lower().endswith(".spold")
     )
 
 
+def fingerprint_file(filepath, previous=None):
+    """Return a dictionary with the ``size``, ``mtime``, and content ``hash`` of ``filepath``.
+
+    If ``previous`` is given and the size and modification time are unchanged, ``previous`` is returned without reading the file."""
+    stat = os.stat(filepath)
+    if (previous
+            and previous.get('size') == stat.st_size
+            and previous.get('mtime') == stat.st_mtime):
+        return previous
+    with open(filepath, "rb") as f:
+        content_hash = hashlib.md5(f.read()).hexdigest()
+    return {
+        'hash': content_hash,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+    }
+
+
+def get_cache_manifest(data_path):
+    """Load the per-file cache manifest for source directory ``data_path``.
+
+    Returns a dictionary of ``{filename: fingerprint}``. The dictionary is empty if there is no manifest, the cache file itself is missing, or the manifest was written by a different ``__io_version__``."""
+    manifest_fp = get_manifest_filepath_for_data_path(data_path)
+    if not (os.path.exists(manifest_fp)
+            and os.path.exists(get_cache_filepath_for_data_path(data_path))):
+        return {}
+    with open(manifest_fp, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('io version') != __io_version__:
+        return {}
+    return manifest['files']
+
+
+def stale_cache_files(data_path):
+    """Compare the ``.spold`` files in ``data_path`` against the cache manifest.
+
+    Files are only hashed if their size or modification time changed, so touching a file doesn't force a re-extraction.
+
+    Returns ``(fingerprints, changed, removed)``: the current fingerprints of all source files, the sorted filenames which are new or whose content changed, and the sorted filenames which are cached but no longer present."""
+    assert os.path.isdir(data_path), "Invalid path for ``data_path``: {}".format(data_path)
+    manifest = get_cache_manifest(data_path)
+    fingerprints = {
+        filename: fingerprint_file(
+            os.path.join(data_path, filename),
+            manifest.get(filename)
+        ) for filename in list_source_files(data_path)
+    }
+    changed = sorted(
+        filename for filename, fingerprint in fingerprints.items()
+        if manifest.get(filename, {}).get('hash') != fingerprint['hash']
+    )
+    removed = sorted(set(manifest).difference(fingerprints))
+    return fingerprints, changed, removed
+
+
 def check_cache_directory(data_path):
     """Check that the data in the cache directory for source directory ``data_path`` is still fresh.
 
-    Returns a boolean."""
+    Uses the per-file manifest; see ``stale_cache_files``. Returns a boolean."""
     assert os.path.isdir(data_path), "Invalid path for ``data_path``: {}".format(data_path)
-    cache_fp = get_cache_filepath_for_data_path(data_path)
-    if not os.path.exists(cache_fp):
+    if not get_cache_manifest(data_path):
         return False
-    cache_time = os.stat(cache_fp).st_mtime
-    source_time = max([
-        os.stat(data_path).st_mtime,
-        max(
-            os.stat(os.path.join(data_path, fn)).st_mtime for fn in
-            filter(lambda x: not x.startswith("."), os.listdir(data_path))
-        )
-    ])
-    return cache_time > source_time
+    _, changed, removed = stale_cache_files(data_path)
+    return not changed and not removed
 
 
-def get_from_cache(data_path):
+def get_from_cache(data_path, records=False):
     """Return cached extracted data from directory ``data_path``.
 
-    This function only loads the pickled cache data; use ``check_cache_directory`` to make sure cache is not expired."""
-    return pickle.load(open(get_cache_filepath_for_data_path(data_path), "rb"))
+    Returns a ``ColumnarCache``, which behaves like a read-only dictionary of ``{filename: [datasets]}``. The cache files are memory-mapped, and datasets are only materialized when accessed; ``get_from_cache(data_path).datasets()`` returns a lazy list of all datasets.
+
+    If ``records``, datasets are materialized as slotted records; see ``ocelot.records``.
+
+    This function only opens the cache; use ``check_cache_directory`` to make sure cache is not expired."""
+    return ColumnarCache(get_cache_filepath_for_data_path(data_path), records)
+
+
+def cache_data(data, data_path, fingerprints=None):
+    """Write extracted ``data`` from source directory ``data_path`` to cache directory for future use.
+
+    ``data`` is a dictionary of ``{filename: [datasets]}``, or an iterable of ``(filename, datasets)`` pairs. It is written in the columnar cache format; see ``ocelot.columnar``.
 
+    If ``fingerprints`` (as returned by ``stale_cache_files``) are given, also write the per-file cache manifest."""
+    write_columnar_cache(data, get_cache_filepath_for_data_path(data_path))
+    if fingerprints is not None:
+        with open(get_manifest_filepath_for_data_path(data_path), "w",
+                  encoding='utf-8') as f:
+            json.dump({'io version': __io_version__, 'files': fingerprints}, f)
 
-def cache_data(data, data_path):
-    """Write extracted ``data`` from source directory ``data_path`` to cache directory for future use."""
-    with open(get_cache_filepath_for_data_path(data_path), "wb") as f:
-        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def open_compressed(filepath, mode, compression=None):
+    """Open ``filepath`` in binary ``mode``, compressed with ``compression``.
+
+    ``compression`` is one of ``None``, ``"gzip"``, ``"lz4"`` (needs the ``lz4`` library), and ``"zstd"`` (needs the ``zstandard`` library)."""
+    if compression is None:
+        return open(filepath, mode)
+    elif compression == "gzip":
+        return gzip.open(filepath, mode, compresslevel=1)
+    elif compression == "lz4":
+        if lz4_frame is None:
+            raise ImportError("lz4 compression needs the lz4 library")
+        return lz4_frame.open(filepath, mode)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression needs the zstandard library")
+        return zstandard.open(filepath, mode)
+    raise ValueError("Unknown compression {}".format(compression))
+
+
+def compression_for_filepath(filepath):
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and filepath.endswith(suffix):
+            return compression
+
+
+def write_pickle(filepath, data, compression=None):
+    """Pickle ``data`` to ``filepath``, which is written atomically"""
+    tmp_filepath = filepath + ".tmp"
+    with open_compressed(tmp_filepath, "wb", compression) as f:
+        if isinstance(data, bytes):
+            # Already pickled
+            f.write(data)
+        else:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filepath, filepath)
+
+
+def load_pickle(filepath):
+    """Load a pickle, which can be compressed; see ``COMPRESSION_SUFFIXES``"""
+    with open_compressed(filepath, "rb", compression_for_filepath(filepath)) as f:
+        return pickle.load(f)
+
+
+def find_pickle(filepath):
+    """Return the path of pickle ``filepath``, or of a compressed version of it, or ``None``"""
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if os.path.isfile(filepath + suffix):
+            return filepath + suffix
 
 
 class OutputDir(object):
@@ -140,33 +293,84 @@ class OutputDir(object):
             )
 
 
-def save_intermediate_result(output_dir, index, data, func_name=None):
-    if func_name is None:
-        func_name = ""
-    else:
-        func_name = "." + safe_filename(func_name)
+def save_intermediate_result(output_dir, index, data, func_name=None,
+                             configuration=None, writer=None):
+    """Pickle ``data`` to ``<index>.<func_name>.pickle`` in ``output_dir``.
+
+    If ``configuration``, a list of function identities (see ``ocelot.utils.get_function_identity``) of all the transformation functions applied so far, is given, also write ``<index>.<func_name>.json``. This makes the intermediate result a checkpoint that ``load_checkpoint`` can resume from.
+
+    If a ``writer`` (see ``ocelot.writer.ResultWriter``) is given, the files are written in the background, and the pickle can be compressed."""
     dump_fp = os.path.join(
         output_dir,
-        str(index) + func_name + ".pickle"
+        str(index) + ("." + safe_filename(func_name) if func_name else "") + ".pickle"
     )
-    with open(dump_fp, "wb") as f:
-        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
-
-
-def save_specific_dataset(output_dir, index, data, follow, func_name):
-    selected = [ds for ds in data if follow in ds['filepath']]
-    if not selected:
-        return
-    data = {
-        'index': index,
-        'function name': func_name or '',
-        'follow string': follow,
-        'datasets': selected
-    }
-    dump_fp = os.path.join(
-        output_dir,
-        "follow",
-        "{}.{}.pickle".format(index, follow)
+    if configuration is not None:
+        sidecar = (dump_fp[:-len(".pickle")] + ".json", {
+            'index': index,
+            'function name': func_name or "",
+            'configuration': configuration,
+        })
+    else:
+        sidecar = None
+    if writer is not None:
+        writer.save(dump_fp, data, sidecar)
+    else:
+        write_pickle(dump_fp, data)
+        write_sidecar(sidecar)
+
+
+def write_sidecar(sidecar):
+    """Write the ``(filepath, metadata)`` JSON file of an intermediate result"""
+    if sidecar is not None:
+        filepath, metadata = sidecar
+        with open(filepath, "w", encoding='utf-8') as f:
+            json.dump(metadata, f)
+
+
+def list_checkpoints(output_dir):
+    """Return a sorted list of the indices of checkpoints in model run directory ``output_dir``"""
+    return sorted(
+        int(filename.split(".")[0])
+        for filename in os.listdir(output_dir)
+        if filename.endswith(".json") and filename.split(".")[0].isdigit()
     )
-    with open(dump_fp, "wb") as f:
-        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def find_run_directory(run_id):
+    """Return the directory of model run ``run_id``, which is a report id of a model run in the output directory, or the path of a run directory.
+
+    Returns ``None`` if the directory doesn't exist."""
+    output_dir = (run_id if os.path.isdir(run_id)
+                  else os.path.join(get_output_directory(), run_id))
+    return output_dir if os.path.isdir(output_dir) else None
+
+
+def load_checkpoint(resume_from):
+    """Load intermediate result ``resume_from``, given as ``"<run id>:<index>"``.
+
+    ``<run id>`` is the report id of an earlier model run in the output directory, or the path of its run directory. Only intermediate results saved with their configuration can be resumed from; see ``save_intermediate_result``.
+
+    Returns ``(data, metadata)``, where ``metadata`` has the ``index``, ``function name``, and ``configuration`` of the checkpoint. Raises ``InvalidCheckpoint`` if the checkpoint can't be found."""
+    try:
+        run_id, index = str(resume_from).rsplit(":", 1)
+        index = int(index)
+    except ValueError:
+        raise InvalidCheckpoint(
+            "Can't parse checkpoint {}; use <run id>:<index>".format(resume_from))
+    output_dir = find_run_directory(run_id)
+    if output_dir is None:
+        raise InvalidCheckpoint("Can't find model run {}".format(run_id))
+    prefix = str(index) + "."
+    filenames = [filename for filename in os.listdir(output_dir)
+                 if filename.startswith(prefix) and filename.endswith(".json")]
+    if not filenames:
+        raise InvalidCheckpoint(
+            "No checkpoint {} in model run {}. Available checkpoints: {}".format(
+            index, run_id, list_checkpoints(output_dir) or "none"))
+    metadata_fp = os.path.join(output_dir, filenames[0])
+    with open(metadata_fp, encoding='utf-8') as f:
+        metadata = json.load(f)
+    data_fp = find_pickle(metadata_fp[:-len(".json")] + ".pickle")
+    if data_fp is None:
+        raise InvalidCheckpoint("Data of checkpoint {} is missing".format(resume_from))
+    return load_pickle(data_fp), metadata
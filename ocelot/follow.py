@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Follow selected datasets through a model run.
+
+``system_model(..., follow="<filename>")`` records every change to the datasets whose filepath contains ``<filename>``. The followed datasets are found once, at the start of the model run, and then tracked by object identity: after each transformation function, if the same objects are still at the same positions and the number of datasets didn't change, only these objects are compared with their previous state. Otherwise, e.g. after a function copied or split datasets, the followed datasets are looked up again by filepath, and matched to the earlier datasets by identity, ``code``, or ``id``. If changes are tracked (see ``ocelot.tracking``), followed datasets whose version didn't change are not copied or compared at all.
+
+Only changes are written. Each followed dataset file gets one append-only file in the ``follow`` directory of the model run, which is a sequence of pickled records:
+
+.. code-block:: python
+
+    {
+        'index': index of transformation function, -1 for the input data,
+        'function name': str,
+        'filepath': dataset filepath,
+        'changes': {
+            label: {'set': {key: new value}, 'delete': [keys]}, or None if the dataset was removed
+        }
+    }
+
+Labels identify datasets within a file; datasets split from the same dataset have different labels. Use ``reconstruct`` or ``ocelot-cli follow`` to get the datasets after any transformation function."""
+from .errors import OutputDirectoryError
+from .filesystem import create_dir, find_run_directory, safe_filename
+from .tracking import version
+from collections import defaultdict
+import copy
+import os
+import pickle
+
+
+class DatasetFollower(object):
+    """Record changes to the datasets whose filepath contains ``follow`` in model run directory ``output_dir``"""
+    def __init__(self, output_dir, follow):
+        self.directory = create_dir(os.path.join(output_dir, "follow"))
+        self.follow = follow
+        # List of (position in data, dataset object, label)
+        self.tracked = []
+        self.count = None
+        self.states = {}
+        # {label: (dataset, version)} of tracked datasets when their state was taken
+        self.versions = {}
+        self.files = {}
+
+    def start(self, data):
+        """Find the followed datasets in ``data``, and write their initial state"""
+        self.snapshot(-1, data, "input")
+
+    def snapshot(self, index, data, func_name):
+        """Write the changes to the followed datasets after transformation function ``index``"""
+        if not self.unchanged_positions(data):
+            self.resolve(data)
+        changes = defaultdict(dict)
+        current, versions = {}, {}
+        for _, ds, label in self.tracked:
+            ds_version = version(ds)
+            if ds_version is not None:
+                versions[label] = (ds, ds_version)
+                previous, previous_version = self.versions.get(label, (None, None))
+                if previous is ds and previous_version == ds_version:
+                    current[label] = self.states[label]
+                    continue
+            state = _state(ds)
+            current[label] = state
+            diff = _diff(self.states.get(label, {}), state)
+            if diff is not None:
+                changes[ds['filepath']][label] = diff
+        for label, state in self.states.items():
+            if label not in current:
+                changes[state['filepath']][label] = None
+        self.states, self.versions = current, versions
+        for filepath, file_changes in changes.items():
+            self.write(filepath, {
+                'index': index,
+                'function name': func_name or '',
+                'filepath': filepath,
+                'changes': file_changes,
+            })
+
+    def unchanged_positions(self, data):
+        return (self.count == len(data)
+                and all(data[position] is ds for position, ds, _ in self.tracked))
+
+    def resolve(self, data):
+        """Look up followed datasets in ``data``, and match them with the previously tracked datasets"""
+        by_identity = {id(ds): label for _, ds, label in self.tracked}
+        by_code = {state['code']: label for label, state in self.states.items()
+                   if state.get('code')}
+        by_id = defaultdict(list)
+        for label, state in sorted(self.states.items()):
+            by_id[state.get('id')].append(label)
+        found = [(position, ds) for position, ds in enumerate(data)
+                 if self.follow in ds.get('filepath', '')]
+
+        used, tracked = set(), []
+        for position, ds in found:
+            label = by_identity.get(id(ds))
+            if label is None or label in used:
+                label = by_code.get(ds.get('code'))
+            if label is None or label in used:
+                label = next((obj for obj in by_id.get(ds.get('id'), [])
+                              if obj not in used), None)
+            if label is None or label in used:
+                label = self.new_label(ds, used)
+            used.add(label)
+            tracked.append((position, ds, label))
+        self.tracked = tracked
+        self.count = len(data)
+
+    def new_label(self, ds, used):
+        counter = 0
+        while True:
+            label = "{}#{}".format(ds.get('id'), counter)
+            if label not in used and label not in self.states:
+                return label
+            counter += 1
+
+    def write(self, filepath, record):
+        if filepath not in self.files:
+            self.files[filepath] = os.path.join(
+                self.directory,
+                safe_filename(os.path.basename(filepath)) + ".pickle"
+            )
+        with open(self.files[filepath], "ab") as f:
+            pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _state(ds):
+    return copy.deepcopy(dict(ds))
+
+
+def _diff(old, new):
+    """Return the changes from ``old`` to ``new``, or ``None`` if there are none"""
+    changed = {key: value for key, value in new.items()
+               if key not in old or old[key] != value}
+    deleted = [key for key in old if key not in new]
+    if changed or deleted:
+        return {'set': changed, 'delete': deleted}
+
+
+def read_follow_file(filepath):
+    """Iterate over the records in a follow file"""
+    with open(filepath, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def list_followed(run):
+    """Return a dictionary ``{dataset filepath: (follow file, [function indices])}`` for model run ``run``, given as a run id or run directory"""
+    run_directory = find_run_directory(run)
+    if run_directory is None:
+        raise OutputDirectoryError("Can't find model run {}".format(run))
+    directory = os.path.join(run_directory, "follow")
+    followed = {}
+    for filename in sorted(os.listdir(directory)):
+        filepath = os.path.join(directory, filename)
+        records = list(read_follow_file(filepath))
+        if records:
+            followed[records[0]['filepath']] = (
+                filepath, [record['index'] for record in records])
+    return followed
+
+
+def reconstruct(filepath, index=None):
+    """Return the followed datasets in follow file ``filepath`` after transformation function ``index``.
+
+    Returns a dictionary ``{label: dataset}``. ``index`` of ``-1`` is the input data; ``None`` is the final result."""
+    datasets = {}
+    for record in read_follow_file(filepath):
+        if index is not None and record['index'] > index:
+            break
+        for label, diff in record['changes'].items():
+            if diff is None:
+                datasets.pop(label, None)
+                continue
+            ds = datasets.setdefault(label, {})
+            ds.update(copy.deepcopy(diff['set']))
+            for key in diff['delete']:
+                del ds[key]
+    return datasets
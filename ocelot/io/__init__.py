@@ -7,27 +7,56 @@ __all__ = (
     "validate_directory_against_xsd",
 )
 
-from .extract_ecospold2 import extract_ecospold2_directory
-from ..filesystem import check_cache_directory, get_from_cache, cache_data
+from .extract_ecospold2 import (
+    DEFAULT_CHUNKSIZE,
+    extract_ecospold2_directory,
+    extract_ecospold2_files,
+)
+from ..filesystem import cache_data, get_from_cache, stale_cache_files
 import os
 
 
-def extract_directory(data_path, use_cache=True, use_mp=True):
+def extract_directory(data_path, use_cache=True, use_mp=True,
+                      engine="objectify", processes=None,
+                      chunksize=DEFAULT_CHUNKSIZE, records=False):
     """Extract ecospold2 files in directory ``dirpath``.
 
-    Uses and writes to cache if ``use_cache`` is ``True``.
+    Uses and writes to cache if ``use_cache`` is ``True``. The cache is incremental: only files which are new or whose content changed since the last extraction are extracted again, and the results are merged with the cached datasets of the other files. Extraction results are written straight into the cache as workers return them, and the datasets are then read back lazily from the cache, so the full list of dataset dictionaries is never held in memory twice.
+
+    ``engine``, ``processes``, and ``chunksize`` are passed to ``extract_ecospold2_directory``. If ``records``, datasets are slotted records instead of dictionaries; see ``ocelot.records``.
 
     Returns datasets in Ocelot internal format."""
     data_path = os.path.abspath(data_path)
     if not use_cache:
-        return extract_ecospold2_directory(data_path, use_mp)
-    elif check_cache_directory(data_path):
+        return extract_ecospold2_directory(data_path, use_mp, engine,
+                                           processes, chunksize, records)
+
+    fingerprints, changed, removed = stale_cache_files(data_path)
+    if fingerprints and not changed and not removed:
         print("Using cached ecospold2 data")
-        return get_from_cache(data_path)
-    else:
-        data = extract_ecospold2_directory(data_path, use_mp)
-        cache_data(data, data_path)
-    return data
+        return get_from_cache(data_path, records).datasets()
+
+    def merged():
+        if len(changed) < len(fingerprints):
+            print("Using cached ecospold2 data for {} unchanged files".format(
+                len(fingerprints) - len(changed)))
+            cache = get_from_cache(data_path)
+            try:
+                for filename in list(cache):
+                    if filename in fingerprints and filename not in changed:
+                        yield filename, cache[filename]
+            finally:
+                # The old cache directory is replaced once all files are written
+                cache.close()
+        extracted = extract_ecospold2_files(
+            [os.path.join(data_path, filename) for filename in changed],
+            use_mp, engine, processes, chunksize
+        )
+        for filepath, datasets in extracted:
+            yield os.path.basename(filepath), datasets
+
+    cache_data(merged(), data_path, fingerprints)
+    return get_from_cache(data_path, records).datasets()
 
 from .cleanup import cleanup_data_directory
 from .validate_ecospold2 import validate_directory_against_xsd, validate_directory
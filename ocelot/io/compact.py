@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Share equal strings in extracted datasets, within a chunk sent between processes or across the whole process.
+
+Every string value read from XML (units, compartments, product names, locations) is a separate object, even when it is equal to a string seen a moment earlier. Pickle only writes an object once per dump and uses back references afterwards, but it recognizes objects by identity, not equality, so each of these strings is written again.
+
+``share_strings`` replaces equal strings with a single object in place. Pickling the result is much smaller, and unpickling it in the parent process creates each distinct string only once, which also lowers the parent's memory use. Pickle's C implementation still rebuilds the dictionaries, which is faster than any expansion of a tuple-based encoding in Python.
+
+``intern_strings`` does the same with the interpreter-wide table of ``sys.intern``, so that equal strings are shared across all datasets in a process, and not just within one chunk. It is applied to all extracted datasets, and to datasets loaded from the cache. ``copy.deepcopy`` returns strings unchanged, so copied exchanges keep sharing the interned strings."""
+import sys
+
+
+def share_strings(obj, strings=None):
+    """Replace equal strings in the nested dictionaries and lists of ``obj`` with a single object.
+
+    Modifies ``obj`` in place, and returns it. ``strings`` is an optional dictionary of already seen strings, which can be shared across calls."""
+    if strings is None:
+        strings = {}
+    return _replace_strings(obj, lambda string: strings.setdefault(string, string))
+
+
+def intern_strings(obj):
+    """Replace all strings in the nested dictionaries and lists of ``obj``, including dictionary keys, with interned strings.
+
+    Modifies ``obj`` in place, and returns it."""
+    return _replace_strings(obj, sys.intern, keys=True)
+
+
+def _replace_strings(obj, lookup, keys=False):
+    def _share(obj):
+        if isinstance(obj, str):
+            return lookup(obj)
+        elif isinstance(obj, dict):
+            if keys and any(type(key) is str and lookup(key) is not key
+                            for key in obj):
+                items = [(lookup(key) if type(key) is str else key, value)
+                         for key, value in obj.items()]
+                obj.clear()
+                obj.update(items)
+            for key, value in obj.items():
+                if isinstance(value, (str, dict, list)):
+                    obj[key] = _share(value)
+        elif isinstance(obj, list):
+            for index, value in enumerate(obj):
+                if isinstance(value, (str, dict, list)):
+                    obj[index] = _share(value)
+        return obj
+
+    return _share(obj)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Compile voluptuous schemas to specialized Python validation functions.
+
+Voluptuous interprets a schema recursively for every value it validates: each dictionary key is matched against candidate keys, every value goes through a chain of closures, and a validated copy of the whole input is built along the way. This is the right thing for producing good error messages, but it is slow when validating hundreds of thousands of exchanges which are almost all valid.
+
+``compile_schema`` generates the source code of a function which only answers whether data is valid, with the dictionary keys, types, and literal values of the schema inlined, and compiles it once. The returned validator calls this fast check first, and only runs the original voluptuous schema if the check fails, so that errors, their paths and messages are exactly the same as before.
+
+Only the subset of voluptuous used by Ocelot is compiled: ``Schema``, dictionaries with literal, ``Optional`` and ``Required`` keys, lists, ``Any``, types, and literal values. Other callables are called as they are. Unsupported constructs raise ``NotImplementedError`` when compiling."""
+from voluptuous import Any, Invalid, Optional, Required, Schema
+from voluptuous.schema_builder import ALLOW_EXTRA, PREVENT_EXTRA, Marker, Undefined
+import inspect
+
+PRIMITIVE_TYPES = (str, bytes, int, float, bool, complex, type(None))
+
+
+class _SchemaCompiler(object):
+    """Generate the source code of validation functions for a schema and its subschemas"""
+    def __init__(self):
+        self.lines = []
+        self.namespace = {'Invalid': Invalid}
+        self.count = 0
+
+    def constant(self, value):
+        name = "_c{}".format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def function(self, body):
+        """Add function ``_vN(data)`` with the lines ``body``; return its name"""
+        self.count += 1
+        name = "_v{}".format(self.count)
+        self.lines.append("def {}(data):".format(name))
+        self.lines.extend("    " + line for line in body)
+        self.lines.append("")
+        return name
+
+    def expression(self, schema, var, required, extra=PREVENT_EXTRA):
+        """Return a Python expression which is true if ``var`` is valid for ``schema``"""
+        if isinstance(schema, Schema):
+            return self.expression(schema.schema, var, schema.required,
+                                   schema.extra)
+        elif isinstance(schema, Any):
+            if schema.discriminant is not None:
+                raise NotImplementedError("``Any`` with discriminant")
+            # ``Any`` compiles its validators with its own ``required`` flag
+            return "({})".format(" or ".join(
+                self.expression(validator, var, schema.required, extra)
+                for validator in schema.validators
+            ) or "False")
+        elif isinstance(schema, dict):
+            return "{}({})".format(self.mapping(schema, required, extra), var)
+        elif isinstance(schema, list):
+            return "{}({})".format(self.sequence(schema, required, extra), var)
+        elif inspect.isclass(schema):
+            return "isinstance({}, {})".format(var, self.constant(schema))
+        elif type(schema) in PRIMITIVE_TYPES:
+            return "({} == {})".format(var, self.constant(schema))
+        elif callable(schema):
+            return "{}({})".format(self.callable(schema), var)
+        raise NotImplementedError("Can't compile schema {!r}".format(schema))
+
+    def mapping(self, schema, required, extra):
+        if extra not in (ALLOW_EXTRA, PREVENT_EXTRA):
+            raise NotImplementedError("Only ALLOW_EXTRA and PREVENT_EXTRA")
+        keys, body = set(), [
+            "if not isinstance(data, dict):",
+            "    return False",
+        ]
+        for key, value in schema.items():
+            if isinstance(key, Marker):
+                if (not isinstance(key, (Optional, Required))
+                        or not isinstance(key.default, Undefined)):
+                    raise NotImplementedError("Can't compile key {!r}".format(key))
+                literal = key.schema
+            else:
+                literal = key
+            if type(literal) not in PRIMITIVE_TYPES:
+                raise NotImplementedError("Can't compile key {!r}".format(key))
+            keys.add(literal)
+            name = self.constant(literal)
+            check = self.expression(value, "value", required, extra)
+            if isinstance(key, Required) or (required and not isinstance(key, Optional)):
+                body.extend([
+                    "value = data.get({}, _missing)".format(name),
+                    "if value is _missing or not {}:".format(check),
+                    "    return False",
+                ])
+            else:
+                body.extend([
+                    "value = data.get({}, _missing)".format(name),
+                    "if value is not _missing and not {}:".format(check),
+                    "    return False",
+                ])
+        if extra == PREVENT_EXTRA:
+            body[2:2] = [
+                "if not {}.issuperset(data):".format(self.constant(frozenset(keys))),
+                "    return False",
+            ]
+        body.append("return True")
+        self.namespace['_missing'] = _missing
+        return self.function(body)
+
+    def sequence(self, schema, required, extra):
+        if not schema:
+            body = ["return isinstance(data, list) and not data"]
+        else:
+            check = " or ".join(self.expression(validator, "value", required, extra)
+                                for validator in schema)
+            body = [
+                "if not isinstance(data, list):",
+                "    return False",
+                "for value in data:",
+                "    if not ({}):".format(check),
+                "        return False",
+                "return True",
+            ]
+        return self.function(body)
+
+    def callable(self, schema):
+        return self.function([
+            "try:",
+            "    {}(data)".format(self.constant(schema)),
+            "except (ValueError, Invalid):",
+            "    return False",
+            "return True",
+        ])
+
+
+class _Missing(object):
+    def __repr__(self):
+        return "<missing>"
+
+_missing = _Missing()
+
+
+# Compiled validators, by schema ``id``. The schema is stored as well, so that its ``id`` can't be reused.
+_compiled = {}
+
+
+def compile_schema(schema):
+    """Compile voluptuous ``schema`` to a fast validation function.
+
+    The returned function takes the data to validate. It returns the data unchanged if it is valid, and otherwise calls ``schema``, which raises the usual voluptuous ``MultipleInvalid`` error. Unlike calling ``schema``, no validated copy of the data is made.
+
+    Validators are compiled once per schema and cached. The generated source code is available as the ``source`` attribute of the validator."""
+    if id(schema) in _compiled:
+        return _compiled[id(schema)][1]
+    compiler = _SchemaCompiler()
+    compiler.function(["return " + compiler.expression(schema, "data", False)])
+    source = "\n".join(compiler.lines)
+    exec(compile(source, "<compiled schema>", "exec"), compiler.namespace)
+    is_valid = compiler.namespace["_v{}".format(compiler.count)]
+
+    def validate(data):
+        if is_valid(data):
+            return data
+        return schema(data)
+
+    validate.is_valid = is_valid
+    validate.source = source
+    _compiled[id(schema)] = (schema, validate)
+    return validate
@@ -9,11 +9,14 @@ from .ecospold2_meta import (
     TECHNOLOGY_LEVEL,
     UNCERTAINTY_MAPPING,
 )
+from .compact import intern_strings, share_strings
+from .extract_ecospold2_stream import stream_extractor
+from ..filesystem import list_source_files
+from ..records import dataset_record
 from lxml import objectify
 from time import time
 import multiprocessing
 import os
-import pyprind
 import signal
 
 
@@ -212,38 +215,119 @@ def generic_extractor(filepath):
     return data
 
 
-def extract_ecospold2_directory(dirpath, use_mp=True):
-    """Extract all the ``.spold`` files in the directory ``dirpath``.
+EXTRACTION_ENGINES = {
+    'objectify': generic_extractor,
+    'stream': stream_extractor,
+}
+
+
+# Number of files sent to a worker process in one task
+DEFAULT_CHUNKSIZE = 25
+
+
+def extract_chunk(task):
+    """Extract a chunk of files in a worker process.
+
+    ``task`` is a tuple of ``(engine, filepaths)``. Returns a list of ``(filepath, datasets)`` pairs. Equal strings in the chunk are shared with ``ocelot.io.compact.share_strings``, to reduce the cost of sending the results back to the parent process."""
+    engine, filepaths = task
+    extractor = EXTRACTION_ENGINES[engine]
+    strings = {}
+    return [(fp, share_strings(extractor(fp), strings)) for fp in filepaths]
+
+
+class ExtractionProgress(object):
+    """Print live extraction throughput in files and megabytes per second.
+
+    ``label`` starts the final summary line."""
+    def __init__(self, filelist, interval=1, label="Extracted"):
+        self.label = label
+        self.total = len(filelist)
+        self.sizes = {fp: os.path.getsize(fp) for fp in filelist}
+        self.files, self.bytes = 0, 0
+        self.start = self.last = time()
+        self.interval = interval
+
+    def update(self, filepath):
+        self.files += 1
+        self.bytes += self.sizes[filepath]
+        if time() - self.last >= self.interval:
+            self.last = time()
+            print(self.status(), end="\r", flush=True)
+
+    def status(self):
+        elapsed = max(time() - self.start, 1e-9)
+        return "{}/{} files ({:.1f} files/s, {:.1f} MB/s)".format(
+            self.files, self.total, self.files / elapsed,
+            self.bytes / elapsed / 1e6)
+
+    def finish(self):
+        print("{} {} in {:.1f} seconds".format(
+            self.label, self.status(), time() - self.start))
+
+
+def extract_ecospold2_files(filelist, use_mp=True, engine="objectify",
+                            processes=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Extract each file in ``filelist``.
 
-    Use a multiprocessing pool if ``use_mp``, which is the default."""
+    Generator which yields ``(filepath, datasets)`` pairs as soon as each file is extracted. All strings in ``datasets`` are interned with ``ocelot.io.compact.intern_strings``. With multiprocessing, files are sent to ``processes`` workers (default is the number of CPUs) in chunks of ``chunksize`` files, and pairs are returned in completion order, **not** in the order of ``filelist``. Consumers that need a stable order should sort by filepath.
+
+    See ``extract_ecospold2_directory`` for ``use_mp`` and ``engine``."""
+    if engine not in EXTRACTION_ENGINES:
+        raise ValueError("Unknown extraction engine: {}".format(engine))
+    if chunksize < 1:
+        raise ValueError("``chunksize`` must be at least 1")
     if os.name == 'nt':
         use_mp = False
 
-    assert os.path.isdir(dirpath), "Can't find directory {}".format(dirpath)
-    filelist = [os.path.join(dirpath, filename)
-                for filename in os.listdir(dirpath)
-                if filename.lower().endswith(".spold")
-                ]
-
     print("Extracting {} undefined datasets".format(len(filelist)))
+    progress = ExtractionProgress(filelist)
 
-    if use_mp:
-        start = time()
+    if use_mp and filelist:
+        tasks = [(engine, filelist[index:index + chunksize])
+                 for index in range(0, len(filelist), chunksize)]
         # With code from
         # http://jtushman.github.io/blog/2014/01/14/python-%7C-multiprocessing-and-interrupts/
         with multiprocessing.Pool(
-                processes=multiprocessing.cpu_count(),
+                processes=processes or multiprocessing.cpu_count(),
                 initializer=lambda : signal.signal(signal.SIGINT, signal.SIG_IGN)
             ) as pool:
             try:
-                data = pool.map(generic_extractor, filelist)
+                for chunk in pool.imap_unordered(extract_chunk, tasks):
+                    for filepath, datasets in chunk:
+                        progress.update(filepath)
+                        yield filepath, intern_strings(datasets)
             except KeyboardInterrupt:
                 pool.terminate()
                 raise KeyboardInterrupt
-        print("Extracted {} undefined datasets in {:.1f} seconds".format(len(data), time() - start))
     else:
-        data = [generic_extractor(fp)
-                for fp in pyprind.prog_bar(filelist)]
+        extractor = EXTRACTION_ENGINES[engine]
+        for filepath in filelist:
+            datasets = intern_strings(extractor(filepath))
+            progress.update(filepath)
+            yield filepath, datasets
+    progress.finish()
+
+
+def extract_ecospold2_directory(dirpath, use_mp=True, engine="objectify",
+                                processes=None, chunksize=DEFAULT_CHUNKSIZE,
+                                records=False):
+    """Extract all the ``.spold`` files in the directory ``dirpath``.
+
+    Use a multiprocessing pool if ``use_mp``, which is the default. ``processes`` and ``chunksize`` set the number of worker processes and files per task; see ``extract_ecospold2_files``.
+
+    ``engine`` selects the extraction function from ``EXTRACTION_ENGINES``: ``"objectify"`` (the default) builds a full ``lxml.objectify`` tree per file, while ``"stream"`` uses ``lxml.etree.iterparse`` and frees elements as it goes.
+
+    If ``records``, datasets are returned as slotted ``ocelot.records.Dataset`` records instead of dictionaries. They behave the same in all transformation functions, but use much less memory.
+
+    Datasets are returned sorted by filepath, regardless of the order in which workers finish."""
+    assert os.path.isdir(dirpath), "Can't find directory {}".format(dirpath)
+    filelist = [os.path.join(dirpath, filename)
+                for filename in list_source_files(dirpath)]
+    data = sorted(extract_ecospold2_files(filelist, use_mp, engine,
+                                          processes, chunksize),
+                  key=lambda pair: pair[0])
 
     # Unroll lists of lists
-    return [y for x in data for y in x]
+    if records:
+        return [dataset_record(y) for x in data for y in x[1]]
+    return [y for x in data for y in x[1]]
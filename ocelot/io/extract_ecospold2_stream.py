@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Streaming ecospold2 extraction engine.
+
+Produces the same datasets as ``generic_extractor``, but walks the file with ``lxml.etree.iterparse`` instead of building a full ``objectify`` tree. Each activity description, exchange, parameter, and administrative information element is converted as soon as it is closed, and then cleared, so only one exchange subtree is alive at any one time."""
+from .ecospold2_meta import (
+    ACCESS_RESTRICTED,
+    BYPRODUCT_CLASSIFICATION,
+    INPUT_GROUPS,
+    OUTPUT_GROUPS,
+    PEDIGREE_LABELS,
+    SPECIAL_ACTIVITY_TYPE,
+    TECHNOLOGY_LEVEL,
+    UNCERTAINTY_MAPPING,
+)
+from lxml import etree
+
+NS = "{http://www.EcoInvent.org/EcoSpold02}"
+
+DATASET_TAGS = (NS + "activityDataset", NS + "childActivityDataset")
+EXCHANGE_TAGS = (NS + "intermediateExchange", NS + "elementaryExchange")
+PARAMETER_TAG = NS + "parameter"
+DESCRIPTION_TAG = NS + "activityDescription"
+ADMINISTRATIVE_TAG = NS + "administrativeInformation"
+FLOW_DATA_TAG = NS + "flowData"
+
+EVENT_TAGS = (DATASET_TAGS + EXCHANGE_TAGS
+              + (PARAMETER_TAG, DESCRIPTION_TAG, ADMINISTRATIVE_TAG))
+
+DISTRIBUTION_TAGS = [NS + label for label in (
+    'lognormal', 'normal', 'triangular', 'beta',
+    'uniform', 'undefined', 'binomial', 'gamma'
+)]
+
+
+def _text(elem, tag):
+    """Text of first child ``tag``, or ``None`` if missing or empty"""
+    child = elem.find(NS + tag)
+    return None if child is None else child.text
+
+
+def _get(elem, *tags):
+    """Follow a path of first children, like ``objectify`` attribute access"""
+    for tag in tags:
+        elem = elem.find(NS + tag)
+    return elem
+
+
+def stream_pedigree_matrix(elem):
+    matrix = elem.find(NS + "pedigreeMatrix")
+    if matrix is None:
+        return {}
+    return {value: int(matrix.get(key))
+            for key, value in PEDIGREE_LABELS.items()}
+
+
+def stream_uncertainty(unc):
+    """Streaming counterpart of ``extract_uncertainty``"""
+    distribution = next(
+        child
+        for tag in DISTRIBUTION_TAGS
+        for child in (unc.find(tag),)
+        if child is not None
+    )
+    data = {UNCERTAINTY_MAPPING.get(key, key): float(value)
+            for key, value in distribution.items()}
+    data.update({
+        'type': distribution.tag[len(NS):],
+        'pedigree matrix': stream_pedigree_matrix(unc)
+    })
+    if not data['pedigree matrix'] and data['type'] in ('lognormal', 'normal'):
+        data['pedigree matrix'] = {x: 5 for x in PEDIGREE_LABELS.values()}
+    return data
+
+
+def stream_parameter(elem):
+    param = {
+        'name': _text(elem, 'name'),
+        'id': elem.get('parameterId'),
+        'amount': float(elem.get('amount')),
+        'unit': (_text(elem, 'unitName')
+                 if elem.find(NS + 'unitName') is not None
+                 else "dimensionless"),
+    }
+    unc = elem.find(NS + "uncertainty")
+    if unc is not None:
+        param['uncertainty'] = stream_uncertainty(unc)
+    if elem.get('variableName'):
+        param['variable'] = elem.get('variableName').strip()
+    if elem.get('mathematicalRelation'):
+        param['formula'] = elem.get('mathematicalRelation').strip()
+    return param
+
+
+def stream_property(elem):
+    data = {
+        'id': elem.get('propertyId'),
+        'amount': float(elem.get('amount')),
+        'name': _text(elem, 'name'),
+        'unit': (_text(elem, 'unitName')
+                 if elem.find(NS + 'unitName') is not None
+                 else "dimensionless"),
+    }
+    unc = elem.find(NS + "uncertainty")
+    if unc is not None:
+        data['uncertainty'] = stream_uncertainty(unc)
+    if elem.get("variableName"):
+        data['variable'] = elem.get("variableName")
+    if elem.get("mathematicalRelation"):
+        data['formula'] = elem.get("mathematicalRelation").strip()
+    return data
+
+
+def stream_production_volume(elem):
+    data = {'amount': float(elem.get('productionVolumeAmount') or 0)}
+    unc = elem.find(NS + "productionVolumeUncertainty")
+    if unc is not None:
+        data['uncertainty'] = stream_uncertainty(unc)
+    formula = elem.get('productionVolumeMathematicalRelation')
+    if formula:
+        data['formula'] = formula.strip()
+    variable = elem.get('productionVolumeVariableName')
+    if variable:
+        data['variable'] = variable.strip()
+    return data
+
+
+def stream_exchange(dataset, elem):
+    """Streaming counterpart of ``extract_exchange``"""
+    input_group = elem.find(NS + "inputGroup")
+    data = {
+        'id': elem.get('id'),
+        'tag': elem.tag[len(NS):],
+        'name': _text(elem, 'name'),
+        'unit': _text(elem, 'unitName'),
+        'amount': float(elem.get('amount')),
+        'type': (INPUT_GROUPS[input_group.text]
+                 if input_group is not None
+                 else OUTPUT_GROUPS[_text(elem, 'outputGroup')]),
+    }
+
+    if elem.get('activityLinkId'):
+        data['activity link'] = elem.get("activityLinkId")
+
+    byproduct = [_text(obj, 'classificationValue')
+                 for obj in elem.iterchildren(NS + 'classification')
+                 if _text(obj, 'classificationSystem') == 'By-product classification']
+    assert len(set(byproduct)) < 2
+    if byproduct:
+        data['byproduct classification'] = BYPRODUCT_CLASSIFICATION[
+                byproduct[0]]
+
+    if elem.get("variableName"):
+        data['variable'] = elem.get("variableName").strip()
+    if elem.get("mathematicalRelation"):
+        data['formula'] = elem.get("mathematicalRelation").strip()
+
+    data['properties'] = [stream_property(obj)
+                          for obj in elem.iterchildren(NS + 'property')]
+
+    if 'environment' in data['type']:
+        compartment = elem.find(NS + 'compartment')
+        data['compartment'] = _text(compartment, 'compartment')
+        data['subcompartment'] = _text(compartment, 'subcompartment')
+
+    if data['type'] in ('reference product', 'byproduct'):
+        data['production volume'] = stream_production_volume(elem)
+
+    unc = elem.find(NS + "uncertainty")
+    if unc is not None:
+        data['uncertainty'] = stream_uncertainty(unc)
+
+    if 'environment' not in data['type']:
+        data['conditional exchange'] = (
+            'activity link' in data
+            and dataset['type'] == 'market activity'
+            and data['type'] == 'byproduct'
+            and data['amount'] < 0
+        )
+
+    return data
+
+
+def stream_isic_classification(elem):
+    for child in elem.iterchildren():
+        if ('classification' in child.tag[len(NS):]
+                and 'ISIC' in _text(child, 'classificationSystem')):
+            return _text(child, 'classificationValue')
+
+
+def stream_activity_description(dataset, elem):
+    activity = elem.find(NS + 'activity')
+    dataset.update({
+        'id': activity.get('id'),
+        'parent': activity.get('parentActivityId'),
+        'name': _text(activity, 'activityName'),
+        'location': _text(_get(elem, 'geography'), 'shortname'),
+        'type': SPECIAL_ACTIVITY_TYPE[activity.get('specialActivityType')],
+        'technology level': TECHNOLOGY_LEVEL[
+            _get(elem, 'technology').get('technologyLevel')],
+        'start date': _get(elem, 'timePeriod').get("startDate"),
+        'end date': _get(elem, 'timePeriod').get("endDate"),
+        'economic scenario': _text(_get(elem, 'macroEconomicScenario'), 'name'),
+        'ISIC classification': stream_isic_classification(elem),
+    })
+
+
+def stream_administrative_information(dataset, elem):
+    publication = elem.find(NS + 'dataGeneratorAndPublication')
+    dataset.update({
+        'access restricted': ACCESS_RESTRICTED[
+            publication.get('accessRestrictedTo')],
+        'dataset author': publication.get('personName'),
+        'data entry': _get(elem, 'dataEntryBy').get('personName'),
+    })
+
+
+def _free(elem):
+    """Clear ``elem`` and drop already processed siblings from the tree"""
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def stream_extractor(filepath):
+    """Extract all datasets in ``filepath`` with ``lxml.etree.iterparse``.
+
+    Drop-in replacement for ``generic_extractor``; returns the same list of datasets in Ocelot internal format."""
+    data, dataset = [], None
+    with open(filepath, "rb") as f:
+        try:
+            events = etree.iterparse(
+                f,
+                events=('start', 'end'),
+                tag=EVENT_TAGS,
+                remove_blank_text=True,
+                remove_comments=True,
+            )
+            for event, elem in events:
+                if elem.tag in DATASET_TAGS:
+                    if event == 'start':
+                        dataset = {'filepath': filepath,
+                                   'parameters': [],
+                                   'exchanges': []}
+                    else:
+                        data.append(dataset)
+                        dataset = None
+                        _free(elem)
+                    continue
+                elif event == 'start':
+                    continue
+                elif elem.tag == DESCRIPTION_TAG:
+                    stream_activity_description(dataset, elem)
+                elif elem.tag == ADMINISTRATIVE_TAG:
+                    stream_administrative_information(dataset, elem)
+                elif elem.getparent().tag != FLOW_DATA_TAG:
+                    # Nested element with a matching name; handled by parent
+                    continue
+                elif elem.tag == PARAMETER_TAG:
+                    dataset['parameters'].append(stream_parameter(elem))
+                else:
+                    dataset['exchanges'].append(stream_exchange(dataset, elem))
+                _free(elem)
+        except:
+            print(filepath)
+            raise
+    return data
@@ -1,58 +1,270 @@
 # -*- coding: utf-8 -*-
+from . import compile_schema
+from . import ecospold2_meta
 from . import extract_directory
-from .validate_internal import dataset_schema
+from . import validate_internal
+from .extract_ecospold2 import ExtractionProgress
+from .validate_internal import validate_dataset
+from ..filesystem import (
+    get_validation_cache_filepath_for_data_path,
+    list_source_files,
+)
 from lxml import etree
-from voluptuous import Invalid
+from voluptuous import Invalid, MultipleInvalid
+import hashlib
+import json
+import multiprocessing
 import os
-import pprint
 import pyprind
+import signal
+import voluptuous
 
 
-def validate_directory_against_xsd(dirpath, schema):
-    """Extract all the ``.spold`` files in the directory ``dirpath``.
+# Compiled XSD schema of a validation worker process; see ``_init_xsd_worker``
+_xsd_schema = None
 
-    Use a multiprocessing pool if ``use_mp``, which is the default."""
+
+def _init_xsd_worker(schema):
+    """Compile the XSD ``schema`` once per worker process, and ignore interrupts"""
+    global _xsd_schema
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _xsd_schema = load_xsd_schema(schema)
+
+
+def load_xsd_schema(schema):
+    """Parse and compile the XSD file ``schema``"""
+    with open(schema, "rb") as f:
+        return etree.XMLSchema(etree.parse(f))
+
+
+def validate_file_against_xsd(filepath, schema=None):
+    """Validate ``filepath`` against compiled XSD ``schema``, or against the schema of the current worker process.
+
+    Returns ``(filepath, errors)``, where ``errors`` is a list of ``{'line', 'column', 'message'}`` dictionaries; the list is empty if the file is valid. Files which are not well-formed XML return their syntax error."""
+    schema = schema or _xsd_schema
+    try:
+        with open(filepath, "rb") as f:
+            document = etree.parse(f)
+    except etree.XMLSyntaxError as err:
+        return filepath, [{
+            'line': err.lineno,
+            'column': err.offset,
+            'message': err.msg,
+        }]
+    if schema.validate(document):
+        return filepath, []
+    return filepath, [{
+        'line': error.line,
+        'column': error.column,
+        'message': error.message,
+    } for error in schema.error_log]
+
+
+def validate_files_against_xsd(filelist, schema, jobs=None):
+    """Validate each file in ``filelist`` against the XSD file ``schema``.
+
+    Generator which yields ``(filepath, errors)`` pairs as soon as each file is validated; see ``validate_file_against_xsd``. Uses a pool of ``jobs`` worker processes (default is the number of CPUs), each of which compiles ``schema`` only once, and yields pairs in completion order. With ``jobs=1``, files are validated in this process, in the order of ``filelist``."""
+    if jobs is not None and jobs < 1:
+        raise ValueError("``jobs`` must be at least 1")
+    if os.name == 'nt':
+        jobs = 1
+
+    if jobs != 1 and filelist:
+        with multiprocessing.Pool(
+                processes=jobs or multiprocessing.cpu_count(),
+                initializer=_init_xsd_worker,
+                initargs=(schema,)
+            ) as pool:
+            try:
+                yield from pool.imap_unordered(
+                    validate_file_against_xsd, filelist, chunksize=8)
+            except KeyboardInterrupt:
+                pool.terminate()
+                raise KeyboardInterrupt
+    else:
+        compiled = load_xsd_schema(schema)
+        for filepath in filelist:
+            yield validate_file_against_xsd(filepath, compiled)
+
+
+def validate_directory_against_xsd(dirpath, schema, jobs=None):
+    """Validate all the ``.spold`` files in the directory ``dirpath`` against the XSD file ``schema``.
+
+    Validation runs in ``jobs`` worker processes (default is the number of CPUs); see ``validate_files_against_xsd``. Errors are printed with their line numbers as soon as each invalid file is found.
+
+    Returns a dictionary of ``{filename: errors}`` for all invalid files."""
     assert os.path.isdir(dirpath), "Can't find data directory {}".format(dirpath)
     assert os.path.isfile(schema), "Can't find schema file {}".format(schema)
 
     filelist = [os.path.join(dirpath, filename)
-                for filename in os.listdir(dirpath)
-                if filename.lower().endswith(".spold")
-                ]
+                for filename in list_source_files(dirpath)]
 
     print("Validating {} undefined datasets".format(len(filelist)))
+    progress = ExtractionProgress(filelist, label="Validated")
+    errors = {}
 
-    errors = []
-    ecospold2_schema = etree.XMLSchema(etree.parse(open(schema)))
-
-    for fp in pyprind.prog_bar(filelist):
-        file = etree.parse(open(fp))
-        if not ecospold2_schema.validate(file):
-            errors.append(os.path.basename(fp))
+    for filepath, file_errors in validate_files_against_xsd(filelist, schema, jobs):
+        progress.update(filepath)
+        if file_errors:
+            filename = os.path.basename(filepath)
+            errors[filename] = file_errors
+            for error in file_errors:
+                print("{}:{}: {}".format(filename, error['line'], error['message']))
+    progress.finish()
 
     if errors:
-        print("The following files did not validate:")
-        pprint.pprint(errors)
+        print("{} of {} files did not validate".format(len(errors), len(filelist)))
     else:
         print("All files valid")
+    return errors
+
+
+# Number of datasets sent to a worker process in one validation task
+VALIDATION_CHUNKSIZE = 50
+
+
+def schema_fingerprint():
+    """Hash of the internal schema definitions, the constants they use, the schema compiler, and the voluptuous version, so that changing any of them invalidates cached verdicts"""
+    md5 = hashlib.md5()
+    for module in (validate_internal, ecospold2_meta, compile_schema):
+        with open(module.__file__, "rb") as f:
+            md5.update(f.read())
+    md5.update(voluptuous.__version__.encode('utf-8'))
+    return md5.hexdigest()
+
+
+def dataset_fingerprint(ds):
+    """Content hash of dataset ``ds``, independent of key order"""
+    return hashlib.md5(
+        json.dumps(ds, sort_keys=True, default=repr).encode("utf-8")
+    ).hexdigest()
+
+
+def validation_errors(ds):
+    """Validate ``ds`` against ``dataset_schema``, using the compiled ``validate_dataset``.
+
+    Returns a list of ``{'path', 'message'}`` dictionaries for all errors found; the list is empty if the dataset is valid."""
+    try:
+        validate_dataset(ds)
+    except MultipleInvalid as err:
+        errors = err.errors
+    except Invalid as err:
+        errors = [err]
+    else:
+        return []
+    return [{
+        'path': [x if isinstance(x, (int, str)) else str(x) for x in error.path],
+        'message': error.msg,
+    } for error in errors]
+
+
+def validate_dataset_chunk(datasets):
+    """Validate a chunk of datasets in a worker process. Returns a list of error lists, in the same order as ``datasets``."""
+    return [validation_errors(ds) for ds in datasets]
+
+
+def load_validation_cache(data_path):
+    """Load cached validation verdicts for source directory ``data_path``.
+
+    Returns a dictionary of ``{dataset fingerprint: errors}``. The dictionary is empty if there is no cache, or if it was written for different schema definitions."""
+    filepath = get_validation_cache_filepath_for_data_path(data_path)
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath, encoding='utf-8') as f:
+        cache = json.load(f)
+    if cache.get('schema') != schema_fingerprint():
+        return {}
+    return cache['verdicts']
+
+
+def save_validation_cache(data_path, verdicts):
+    with open(get_validation_cache_filepath_for_data_path(data_path), "w",
+              encoding='utf-8') as f:
+        json.dump({'schema': schema_fingerprint(), 'verdicts': verdicts}, f)
+
+
+def validate_datasets(datasets, jobs=None, verdicts=None,
+                      chunksize=VALIDATION_CHUNKSIZE):
+    """Validate ``datasets`` against ``dataset_schema``.
+
+    Generator which yields ``(dataset, fingerprint, errors)`` for each dataset; see ``validation_errors``. ``verdicts`` is an optional dictionary of ``{fingerprint: errors}`` from an earlier run; datasets with a known fingerprint are not validated again.
+
+    Other datasets are validated in a pool of ``jobs`` worker processes (default is the number of CPUs), in chunks of ``chunksize`` datasets. With ``jobs=1``, datasets are validated in this process."""
+    if jobs is not None and jobs < 1:
+        raise ValueError("``jobs`` must be at least 1")
+    if os.name == 'nt':
+        jobs = 1
+    verdicts = verdicts or {}
+
+    pending = []
+    for ds in datasets:
+        fingerprint = dataset_fingerprint(ds)
+        if fingerprint in verdicts:
+            yield ds, fingerprint, verdicts[fingerprint]
+        else:
+            pending.append((ds, fingerprint))
+    if not pending:
+        return
+
+    chunks = [pending[index:index + chunksize]
+              for index in range(0, len(pending), chunksize)]
+    if jobs != 1:
+        with multiprocessing.Pool(
+                processes=jobs or multiprocessing.cpu_count(),
+                initializer=lambda : signal.signal(signal.SIGINT, signal.SIG_IGN)
+            ) as pool:
+            try:
+                results = pool.imap(
+                    validate_dataset_chunk,
+                    ([ds for ds, _ in chunk] for chunk in chunks)
+                )
+                for chunk, chunk_errors in zip(chunks, results):
+                    for (ds, fingerprint), errors in zip(chunk, chunk_errors):
+                        yield ds, fingerprint, errors
+            except KeyboardInterrupt:
+                pool.terminate()
+                raise KeyboardInterrupt
+    else:
+        for ds, fingerprint in pending:
+            yield ds, fingerprint, validation_errors(ds)
+
+
+def validate_directory(dirpath, use_cache=True, jobs=None,
+                       logfile="ocelot-validation-errors.jsonl"):
+    """Extract the ecospold2 files in ``dirpath``, and validate the extracted datasets against ``dataset_schema``.
+
+    If ``use_cache``, reuses the extraction cache, and caches the validation verdict for each dataset content hash, so that only new or changed datasets are validated again. Datasets are validated in ``jobs`` worker processes; see ``validate_datasets``.
+
+    All errors are written to ``logfile`` as JSON lines, one per error, with the dataset filepath, id, name, and location, and the error path and message. Returns the list of errors."""
+    data = extract_directory(dirpath, use_cache)
+    verdicts = load_validation_cache(dirpath) if use_cache else {}
+    new_verdicts, errors, skipped = {}, [], 0
 
+    print("Validating {} datasets".format(len(data)))
+    bar = pyprind.ProgBar(len(data))
+    for ds, fingerprint, ds_errors in validate_datasets(data, jobs, verdicts):
+        skipped += fingerprint in verdicts
+        new_verdicts[fingerprint] = ds_errors
+        bar.update()
+        for error in ds_errors:
+            errors.append(dict({
+                'filepath': ds.get('filepath'),
+                'id': ds.get('id'),
+                'name': ds.get('name'),
+                'location': ds.get('location'),
+            }, **error))
+    if skipped:
+        print("Reused cached verdicts for {} unchanged datasets".format(skipped))
+    if use_cache:
+        save_validation_cache(dirpath, new_verdicts)
 
-def validate_directory(dirpath):
-    data, errors = extract_directory(dirpath, False), {}
-    print("Validating datasets:")
-    for ds in pyprind.prog_bar(data):
-        try:
-            dataset_schema(ds)
-        except Invalid as err:
-            errors[err.msg] = {"path": err.path, "dataset": ds}
     if errors:
-        logfile = "ocelot-validation-errors.log"
-        errors = [(k, v['path'], v['dataset']) for k, v in errors.items()]
         print("{} errors found.\nSee error logfile {} for details.".format(
             len(errors), logfile)
         )
         with open(logfile, "w", encoding='utf-8') as f:
-            f.write("Internal validation errors for extracted directory:\n{}\n".format(dirpath))
-            f.write(pprint.pformat(errors, width=120, compact=True))
+            for error in errors:
+                f.write(json.dumps(error, ensure_ascii=False) + "\n")
     else:
         print("No errors found")
+    return errors
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from .compile_schema import compile_schema
 from voluptuous import Schema, Any, Optional
 from .ecospold2_meta import SPECIAL_ACTIVITY_TYPE, TECHNOLOGY_LEVEL, PEDIGREE_LABELS
 
@@ -195,3 +196,6 @@ dataset_schema = Schema({
     # Temporary data - references to technosphere exchanges which supply a market
     Optional('suppliers'): list,
 }, required=True)
+
+# Fast validator with the same errors as ``dataset_schema``; see ``ocelot.io.compile_schema``
+validate_dataset = compile_schema(dataset_schema)
@@ -6,11 +6,13 @@ import time
 
 
 class JsonFormatter(logging.Formatter):
-    """Uses code from https://github.com/madzak/python-json-logger/ under BSD license"""
+    """Uses code from https://github.com/madzak/python-json-logger/ under BSD license.
+
+    The time of the message can be overridden with ``extra={'timestamp': ...}``."""
     def format(self, record):
         assert isinstance(record.msg, dict)
         message_dict = record.msg
-        message_dict['time'] = time.time()
+        message_dict['time'] = getattr(record, 'timestamp', None) or time.time()
         return json.dumps(message_dict, ensure_ascii=False)
 
 
@@ -1,25 +1,46 @@
 # -*- coding: utf-8 -*-
+from .collection import (
+    can_fuse,
+    fuse_functions,
+    fusion_allowed,
+    FusedPass,
+    unwrap_functions,
+)
 from .configuration import (
     cutoff_config,
     cutoff_config_ecoinvent_row,
     consequential_config,
 )
+from .dependencies import dependency_closure
+from .errors import InvalidCheckpoint
+from .executors import use_executor
 from .filesystem import (
     cache_data,
+    DEFAULT_COMPRESSION,
+    load_checkpoint,
     OutputDir,
     save_intermediate_result,
-    save_specific_dataset,
 )
+from .follow import DatasetFollower
 from .io import extract_directory
 from .logger import create_log, create_detailed_log
+from .profiling import TransformationProfiler
 from .report import HTMLReport
 from .results import SaveStrategy
-from .utils import get_function_meta, validate_configuration
+from .step_cache import StepCache
+from .tracking import ChangeTracker, track
+from .utils import (
+    get_function_identity,
+    get_function_meta,
+    validate_configuration,
+)
+from .writer import ResultWriter
 from collections.abc import Iterable, Sequence
 import itertools
 import logging
 import shutil
 import sys
+import time
 import wrapt
 
 logger = logging.getLogger('ocelot')
@@ -31,13 +52,19 @@ mapping = {
 }
 
 
-def apply_transformation(function, counter, data, output_dir, save_strategy, follow):
+def apply_transformation(function, counter, data, output_dir, save_strategy, follow,
+                         configuration=None, step_cache=None, profiler=None,
+                         writer=None, tracker=None):
+    if isinstance(function, FusedPass):
+        return apply_fused_pass(function, counter, data, output_dir,
+                                save_strategy, configuration, writer)
     # A `function` can be a list of functions
-    if (isinstance(function, Iterable)
+    elif (isinstance(function, Iterable)
         and not isinstance(function, wrapt.FunctionWrapper)):
         for obj in function:
-            data = apply_transformation(obj, counter, data,
-                                        output_dir, save_strategy)
+            data = apply_transformation(obj, counter, data, output_dir,
+                                        save_strategy, follow, configuration,
+                                        step_cache, profiler, writer, tracker)
         return data
     else:
         metadata = get_function_meta(function)
@@ -50,25 +77,83 @@ def apply_transformation(function, counter, data, output_dir, save_strategy, fol
         logger.info(metadata)
 
         print("Applying transformation {}".format(metadata['name']))
-        data = function(data)
+        if step_cache is not None:
+            apply = lambda data: step_cache.apply(function, data)
+        else:
+            apply = lambda data: (function(data), None)
+        if profiler is not None:
+            (data, hit), metadata['profile'] = profiler(
+                apply, data, index, metadata['name'])
+        else:
+            data, hit = apply(data)
+        if hit is not None:
+            metadata['step cache'] = "hit" if hit else "miss"
+        if tracker is not None:
+            data, modified, removed = tracker.step(data)
+            metadata['modified datasets'] = modified
+            metadata['removed datasets'] = removed
         metadata.update(
             type="function end",
             count=len(data)
         )
 
         if save_strategy(index):
-            save_intermediate_result(output_dir, index, data, metadata['name'])
+            save_intermediate_result(
+                output_dir, index, data, metadata['name'],
+                configuration[:index + 1] if configuration else None,
+                writer
+            )
 
         if follow:
-            save_specific_dataset(output_dir, index, data,
-                                  follow, metadata['name'])
+            follow.snapshot(index, data, metadata['name'])
 
         logger.info(metadata)
         return data
 
 
+def apply_fused_pass(fused, counter, data, output_dir, save_strategy,
+                     configuration=None, writer=None):
+    """Apply the functions in ``fused`` in one pass over the datasets.
+
+    Start and end messages are logged for each function, as if the functions had been applied one after the other, with the time spent in each function. Only the result after the last function can be saved."""
+    print("Applying transformations {} in one pass".format(
+        ", ".join(get_function_meta(function)['name'] for function in fused)))
+    timestamp, count = time.time(), len(data)
+    data, counts, durations, records = fused.run(data)
+    for function, step_count, duration, step_records in zip(
+            fused, counts, durations, records):
+        metadata = get_function_meta(function)
+        index = next(counter)
+        metadata.update(
+            index=index,
+            type="function start",
+            count=count,
+        )
+        logger.info(metadata, extra={'timestamp': timestamp})
+        for record in step_records:
+            logging.getLogger(record.name).handle(record)
+        timestamp += duration
+        count = step_count
+        metadata.update(
+            type="function end",
+            count=count,
+        )
+        logger.info(metadata, extra={'timestamp': timestamp})
+
+    if save_strategy(index):
+        save_intermediate_result(
+            output_dir, index, data, metadata['name'],
+            configuration[:index + 1] if configuration else None,
+            writer
+        )
+    return data
+
+
 def system_model(data_path, config=None, show=False, use_cache=True,
-                 save_strategy=None, follow=None):
+                 save_strategy=None, follow=None, resume_from=None,
+                 step_cache=False, profile=False, executor="serial",
+                 workers=None, fuse=True, subset=None,
+                 compression=DEFAULT_COMPRESSION, track_changes=None):
     """A system model is a set of assumptions and modeling choices that define how to take a list of unlinked and unallocated datasets, and transform these datasets into a new list of datasets which are linked and each have a single reference product.
 
     The system model itself is a list of functions. The definition of this list - which functions are included, and in which order - is defined by the input parameter ``config``, which can be a list of functions or a :ref:`configuration` object. The ``system_model`` does the following:
@@ -91,7 +176,16 @@ def system_model(data_path, config=None, show=False, use_cache=True,
         * ``show``: Boolean flag to open the final report in a web browser after model completion.
         * ``use_cache``: Boolean flag to use cached data instead of raw ecospold2 files when possible.
         * ``save_strategy``: Optional input argument to initialize a ``SaveStrategy``.
-        * ``follow``: Optional filename of a file to follow (i.e. save after each transformation function) during system model execution.
+        * ``follow``: Optional filename of a file to follow (i.e. save changes after each transformation function) during system model execution. See ``ocelot.follow``.
+        * ``step_cache``: Reuse results of transformation functions from earlier runs with the same input data. Either ``True``, or a ``StepCache`` instance to configure the cache location and size. Default is ``False``.
+        * ``profile``: Measure wall time, CPU time, and memory use of each transformation function, and show them in the report. Either ``True``, ``"cprofile"`` to also save ``cProfile`` statistics for each function, or a ``TransformationProfiler`` instance. Default is ``False``.
+        * ``executor``: How single-dataset transformation functions (``TransformationWrapper`` and ``single_input``) are applied: ``"serial"`` (default), ``"thread"``, ``"process"``, or an executor instance from ``ocelot.executors``. Wrappers with their own executor ignore this.
+        * ``workers``: Number of worker threads or processes. Default is the number of CPUs.
+        * ``fuse``: Apply consecutive single-dataset functions in one pass over the datasets (see ``ocelot.collection.fuse_functions``). Only used with the serial executor, and without ``follow``, ``step_cache``, ``profile``, or ``track_changes``, as these need each function to be applied separately. Intermediate results are still saved according to ``save_strategy``. Default is ``True``.
+        * ``subset``: Optional list of dataset filepaths, filenames, ids, or reference product names. If given, only these datasets and the datasets which can influence them (see ``ocelot.dependencies``) are used in the model run. Useful for debugging.
+        * ``compression``: Compression of saved intermediate and final results: ``None``, ``"gzip"``, ``"lz4"``, or ``"zstd"``. Default is zstd or lz4 if the library is installed, otherwise no compression. Results are written in the background; see ``ocelot.writer``.
+        * ``track_changes``: Track which datasets each transformation function changes (see ``ocelot.tracking``). The number of modified and removed datasets is shown in the report for each function, and ``follow`` and ``step_cache`` only copy or store changed datasets. Default is to track changes if ``follow`` or ``step_cache`` is used.
+        * ``resume_from``: Optional checkpoint ``"<run id>:<index>"`` of an earlier model run. Instead of extracting data and applying all transformation functions, the intermediate result saved after function ``<index>`` is loaded, and the model run continues with the next function. The transformation functions up to ``<index>``, including their source code, must be the same as in the earlier run.
 
     Returns:
 
@@ -105,10 +199,29 @@ def system_model(data_path, config=None, show=False, use_cache=True,
     elif not config:
         config = cutoff_config
     config = validate_configuration(config)
-    data = extract_directory(data_path, use_cache)
+    functions = unwrap_functions(config)
+    configuration = [get_function_identity(function) for function in functions]
+    if resume_from:
+        data, checkpoint = load_checkpoint(resume_from)
+        start = checkpoint['index'] + 1
+        if checkpoint['configuration'] != configuration[:start]:
+            raise InvalidCheckpoint(
+                "Transformation functions up to checkpoint {} don't match "
+                "the current configuration".format(resume_from)
+            )
+        print("Resuming from checkpoint {} after function {}".format(
+            resume_from, checkpoint['function name']))
+    else:
+        data = extract_directory(data_path, use_cache)
+        start = 0
+    if subset:
+        total = len(data)
+        data = dependency_closure(data, subset)
+        print("Using {} of {} datasets".format(len(data), total))
     output_manager = OutputDir(follow=follow)
+    writer = ResultWriter(compression)
     try:
-        counter = itertools.count()
+        counter = itertools.count(start)
         logfile_path = create_log(output_manager.directory)
         create_detailed_log(output_manager.directory)
 
@@ -121,14 +234,45 @@ def system_model(data_path, config=None, show=False, use_cache=True,
         })
 
         save_strategy = SaveStrategy(save_strategy)
+        if step_cache is True:
+            step_cache = StepCache()
+        if step_cache:
+            step_cache.start(data)
+        else:
+            step_cache = None
+        if profile is True or profile == "cprofile":
+            profile = TransformationProfiler(
+                output_manager.directory, cprofile=profile == "cprofile")
+        elif not profile:
+            profile = None
+        if track_changes is None:
+            track_changes = bool(follow or step_cache)
+        if track_changes:
+            data = track(data)
+            tracker = ChangeTracker(data)
+        else:
+            tracker = None
+        if follow:
+            follow = DatasetFollower(output_manager.directory, follow)
+            follow.start(data)
 
-        for obj in config:
-            data = apply_transformation(obj, counter, data,
-                                        output_manager.directory,
-                                        save_strategy, follow)
+        fuse = fuse and not (follow or step_cache or profile or tracker)
+        with use_executor(executor, workers), fusion_allowed(fuse):
+            schedule = functions[start:]
+            if can_fuse():
+                schedule = fuse_functions(
+                    schedule, lambda index: save_strategy(start + index))
+            for function in schedule:
+                data = apply_transformation(function, counter, data,
+                                            output_manager.directory,
+                                            save_strategy, follow,
+                                            configuration, step_cache, profile,
+                                            writer, tracker)
 
         print("Saving final results")
-        save_intermediate_result(output_manager.directory, "final-results", data)
+        save_intermediate_result(output_manager.directory, "final-results",
+                                 data, writer=writer)
+        writer.close()
 
         logger.info({'type': 'report end'})
         print(("Compare results with: ocelot-compare compare {} "
@@ -138,6 +282,13 @@ def system_model(data_path, config=None, show=False, use_cache=True,
 
     except KeyboardInterrupt:
         print("Terminating Ocelot model run")
-        print("Deleting output directory:\n{}".format(output_manager.directory))
-        shutil.rmtree(output_manager.directory)
+        # Background writes must finish before their directory is deleted
+        try:
+            writer.close()
+        finally:
+            print("Deleting output directory:\n{}".format(output_manager.directory))
+            shutil.rmtree(output_manager.directory)
         sys.exit(1)
+    finally:
+        # Also wait for pending writes if a transformation function failed
+        writer.close()
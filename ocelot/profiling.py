@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Profile transformation functions during a model run.
+
+A ``TransformationProfiler`` measures each transformation function separately: wall time, CPU time, the peak increase in resident memory (sampled with ``psutil`` in a background thread), and the peak and net change of the memory traced by ``tracemalloc``. Optionally, each function is also run under ``cProfile``, and the statistics are dumped to ``profiles/<index>.<name>.pstats`` in the model run directory, where they can be read with ``pstats`` or a viewer like SnakeViz.
+
+The net number of allocated memory blocks can also be counted, but this takes a ``tracemalloc`` snapshot before and after each function, which takes time proportional to the number of live memory blocks. For a full database, this is much slower than the functions themselves, so it is only done on request.
+
+Profiling slows down the model run, especially ``tracemalloc``, so it is only enabled on request; see ``system_model``."""
+from .filesystem import create_dir, safe_filename
+import cProfile
+import os
+import psutil
+import threading
+import time
+import tracemalloc
+
+
+class _PeakRSS(threading.Thread):
+    """Background thread which samples the resident set size of this process"""
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.process = psutil.Process()
+        self.interval = interval
+        self.start_rss = self.peak = self.process.memory_info().rss
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        return self.peak - self.start_rss
+
+
+class TransformationProfiler(object):
+    """Measure resource use of transformation functions.
+
+    ``output_dir`` is the model run directory; it is only needed if ``cprofile`` is ``True``. If ``trace_allocations`` is ``False``, ``tracemalloc`` is not used, which makes profiling much cheaper. If ``count_blocks`` is ``True``, the net number of allocated memory blocks is also counted from ``tracemalloc`` snapshots, which is slow for large data."""
+    def __init__(self, output_dir=None, cprofile=False, trace_allocations=True,
+                 count_blocks=False):
+        self.output_dir = output_dir
+        self.cprofile = cprofile
+        self.trace_allocations = trace_allocations
+        self.count_blocks = count_blocks and trace_allocations
+
+    def __call__(self, function, data, index, name):
+        """Return ``(function(data), profile)``, where ``profile`` is a dictionary of measurements"""
+        started_tracing = reset_peak = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            # ``reset_peak`` is new in Python 3.9; without it, the peak is
+            # only meaningful if tracing started just now
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+                reset_peak = True
+            traced_start = tracemalloc.get_traced_memory()[0]
+            if self.count_blocks:
+                blocks_start = _count_blocks()
+        profiler = cProfile.Profile() if self.cprofile else None
+        sampler = _PeakRSS()
+        sampler.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+        try:
+            if profiler is not None:
+                result = profiler.runcall(function, data)
+            else:
+                result = function(data)
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rss = sampler.stop()
+
+        profile = {
+            'wall time': wall,
+            'cpu time': cpu,
+            'peak rss delta': rss,
+        }
+        if self.trace_allocations:
+            traced, peak = tracemalloc.get_traced_memory()
+            profile['traced memory delta'] = traced - traced_start
+            if reset_peak or started_tracing:
+                profile['peak traced memory'] = peak - traced_start
+            if self.count_blocks:
+                profile['allocated blocks'] = _count_blocks() - blocks_start
+            if started_tracing:
+                tracemalloc.stop()
+        if profiler is not None:
+            directory = create_dir(os.path.join(self.output_dir, "profiles"))
+            filepath = os.path.join(
+                directory, "{}.{}.pstats".format(index, safe_filename(name)))
+            profiler.dump_stats(filepath)
+            profile['pstats'] = os.path.relpath(filepath, self.output_dir)
+        return result, profile
+
+
+def _count_blocks():
+    """Number of memory blocks currently traced by ``tracemalloc``"""
+    return sum(stat.count for stat in
+               tracemalloc.take_snapshot().statistics('filename'))
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""Memory-efficient record types for datasets and their components.
+
+Transformation functions treat datasets, exchanges, production volumes and uncertainty distributions as dictionaries. Each of these dictionaries carries its own hash table, which dominates memory use for large releases. The classes in this module store the common fields in ``__slots__`` instead, but implement the full ``MutableMapping`` interface, so ``ds['exchanges']``, ``exc.get('code')``, ``'formula' in exc``, ``del exc['uncertainty']``, ``deepcopy``, and pickling all work unchanged. Keys which aren't predefined fields are stored in a small overflow dictionary.
+
+Iteration yields the predefined fields first, in the order given in ``fields``, and then other keys in insertion order. Records compare equal to dictionaries with the same items."""
+from abc import ABCMeta
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+
+
+def _slot_name(key):
+    return "_" + key.replace(" ", "_").replace("%", "pct")
+
+
+def _make_slots(fields):
+    return tuple(_slot_name(key) for key in fields)
+
+
+class _RecordMeta(ABCMeta):
+    """Metaclass which builds the slot tables of each record class from its ``fields``.
+
+    ``_slots_in_order`` is a tuple of ``(key, slot name)`` pairs in the order of ``fields``, used for iteration; ``_slot_for`` is a ``{key: slot name}`` dictionary for lookups."""
+    def __new__(mcs, name, bases, namespace):
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls._slots_in_order = tuple((key, _slot_name(key)) for key in cls.fields)
+        cls._slot_for = dict(cls._slots_in_order)
+        return cls
+
+
+class Record(MutableMapping, metaclass=_RecordMeta):
+    """Base class for slotted records with a dictionary interface.
+
+    Subclasses define ``fields``, a tuple of the keys stored in slots.
+
+    Unlike a dictionary, iteration doesn't follow insertion order: the predefined fields always come first, in the order of ``fields``. JSON dumps and fingerprints of records can therefore differ from those of the dictionaries they were created from, even though they compare equal."""
+    __slots__ = ('_extra',)
+    fields = ()
+
+    def __init__(self, *args, **kwargs):
+        self._extra = None
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        attribute = self._slot_for.get(key)
+        if attribute is not None:
+            try:
+                return getattr(self, attribute)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is not None:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        attribute = self._slot_for.get(key)
+        if attribute is not None:
+            setattr(self, attribute, value)
+        else:
+            if self._extra is None:
+                self._extra = OrderedDict()
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        attribute = self._slot_for.get(key)
+        if attribute is not None:
+            try:
+                delattr(self, attribute)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is not None:
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        attribute = self._slot_for.get(key)
+        if attribute is not None:
+            return hasattr(self, attribute)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        attribute = self._slot_for.get(key)
+        if attribute is not None:
+            return getattr(self, attribute, default)
+        elif self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __iter__(self):
+        for key, attribute in self._slots_in_order:
+            if hasattr(self, attribute):
+                yield key
+        if self._extra is not None:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return (sum(1 for _, attribute in self._slots_in_order
+                    if hasattr(self, attribute))
+                + (len(self._extra) if self._extra is not None else 0))
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    __hash__ = None
+
+    def copy(self):
+        """Shallow copy, like ``dict.copy``"""
+        return type(self)(self)
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, dict(self.items()))
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
+
+    def __reduce_ex__(self, protocol):
+        return (type(self), (), self.__getstate__())
+
+
+class Uncertainty(Record):
+    """Uncertainty distribution, including the pedigree matrix"""
+    fields = (
+        'type',
+        'pedigree matrix',
+        'mean',
+        'mu',
+        'variance',
+        'variance with pedigree uncertainty',
+        'minimum',
+        'maximum',
+        'mode',
+        'standard deviation 95%',
+        'n',
+        'p',
+        'scale',
+        'shape',
+    )
+    __slots__ = _make_slots(fields)
+
+
+class ProductionVolume(Record):
+    """Production volume of a reference product or byproduct"""
+    fields = (
+        'amount',
+        'uncertainty',
+        'formula',
+        'variable',
+        'subtracted activity link volume',
+    )
+    __slots__ = _make_slots(fields)
+
+
+class Exchange(Record):
+    """Intermediate or elementary exchange"""
+    fields = (
+        'id',
+        'tag',
+        'name',
+        'unit',
+        'amount',
+        'type',
+        'activity link',
+        'byproduct classification',
+        'variable',
+        'formula',
+        'properties',
+        'compartment',
+        'subcompartment',
+        'production volume',
+        'uncertainty',
+        'conditional exchange',
+        'code',
+        'original id',
+    )
+    __slots__ = _make_slots(fields)
+
+
+class Dataset(Record):
+    """Activity dataset"""
+    fields = (
+        'filepath',
+        'id',
+        'parent',
+        'name',
+        'location',
+        'type',
+        'technology level',
+        'start date',
+        'end date',
+        'economic scenario',
+        'access restricted',
+        'dataset author',
+        'data entry',
+        'ISIC classification',
+        'parameters',
+        'exchanges',
+        'code',
+        'reference product',
+        'allocation method',
+    )
+    __slots__ = _make_slots(fields)
+
+
+def _uncertainty(obj):
+    return Uncertainty(obj) if isinstance(obj, dict) else obj
+
+
+def _production_volume(obj):
+    if not isinstance(obj, dict):
+        return obj
+    pv = ProductionVolume(obj)
+    if 'uncertainty' in pv:
+        pv['uncertainty'] = _uncertainty(pv['uncertainty'])
+    return pv
+
+
+def _uncertain(obj):
+    """Convert uncertainty of a property or parameter, which stay dictionaries"""
+    if isinstance(obj, dict) and 'uncertainty' in obj:
+        obj['uncertainty'] = _uncertainty(obj['uncertainty'])
+    return obj
+
+
+def exchange_record(exc):
+    """Convert exchange dictionary ``exc`` to an ``Exchange`` record"""
+    exc = Exchange(exc)
+    if 'production volume' in exc:
+        exc['production volume'] = _production_volume(exc['production volume'])
+    if 'uncertainty' in exc:
+        exc['uncertainty'] = _uncertainty(exc['uncertainty'])
+    if isinstance(exc.get('properties'), list):
+        exc['properties'] = [_uncertain(obj) for obj in exc['properties']]
+    return exc
+
+
+def dataset_record(ds):
+    """Convert dataset dictionary ``ds``, including its exchanges, to records.
+
+    Properties and parameters stay dictionaries, but their uncertainty distributions are converted."""
+    ds = Dataset(ds)
+    if isinstance(ds.get('exchanges'), list):
+        ds['exchanges'] = [exchange_record(exc) for exc in ds['exchanges']]
+    if isinstance(ds.get('parameters'), list):
+        ds['parameters'] = [_uncertain(obj) for obj in ds['parameters']]
+    return ds
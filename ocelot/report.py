@@ -26,6 +26,8 @@ def jsonize(data):
     data['count_data'] = _([x[1] for x in data['counts']])
     data['time_labels'] = [str(x) for x, _ in enumerate(data['times'])]
     data['time_data'] = _([x[1] for x in data['times']])
+    data['modified_labels'] = _([str(x[0]) for x in data['modified']])
+    data['modified_data'] = _([x[1] for x in data['modified']])
     for k, v in data['functions'].items():
         if hasattr(v, "tabledata"):
             v["tabledata"] = _(sorted(v["tabledata"]))
@@ -33,6 +35,9 @@ def jsonize(data):
         v['index'] = k
     data['functions'] = list(data['functions'].values())
     data['functions'].sort(key=lambda x: x['index'])
+    total = sum(row['wall time'] for row in data['profiles']) or 1
+    for row in data['profiles']:
+        row['share'] = 100 * row['wall time'] / total
     return data
 
 
@@ -86,6 +91,9 @@ class HTMLReport(object):
                 'counts': [("Start", line['count'])],
                 'times': [("Start", line['time'])],
                 'uuid': line['uuid'],
+                'step_cache': {'hit': 0, 'miss': 0},
+                'profiles': [],
+                'modified': [],
             })
         elif line['type'] == 'report end':
             data['times'].append(('End', line['time']))
@@ -109,7 +117,22 @@ class HTMLReport(object):
                 'id': 'function{}'.format(self.index),
                 'description': to_html(line['description'] or ''),
                 'table': line['table'],
+                'step_cache': line.get('step cache'),
+                'profile': line.get('profile'),
+                'modified': line.get('modified datasets'),
+                'removed': line.get('removed datasets'),
             })
+            if 'modified datasets' in line:
+                data['modified'].append((self.index, line['modified datasets']))
+            if line.get('step cache'):
+                data['step_cache'][line['step cache']] += 1
+            if line.get('profile'):
+                data['profiles'].append(dict(
+                    line['profile'],
+                    index=self.index,
+                    name=line['name'],
+                    id='function{}'.format(self.index),
+                ))
         elif line['type'] == 'table element':
             data['functions'][self.index]['tabledata'].append(line['data'])
         elif line['type'] == 'list element':
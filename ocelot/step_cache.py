@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of transformation function results.
+
+Many model runs apply the same first transformation functions to the same input data. With a ``StepCache``, the output of each transformation function is pickled under a key built from the fingerprint of its input data and the identity of the function (see ``ocelot.utils.get_function_identity``), and later runs load it instead of applying the function again.
+
+The fingerprint of the input data is only computed once, at the start of a model run; the key of each step is then the fingerprint of the input to the next step. This only works because transformation functions are deterministic: a function which depends on anything other than its input data and its own code should not be used with the step cache.
+
+If changes are tracked (see ``ocelot.tracking``), only the datasets which the function added or changed are stored; unchanged datasets are stored as their position in the input data, and taken from the input data when the result is loaded.
+
+Cached results are stored in the ``steps`` subdirectory of the Ocelot cache directory. When the total size is larger than ``max_size``, the least recently used results are deleted."""
+from .filesystem import create_dir, get_cache_directory
+from .tracking import version
+from .utils import get_function_identity
+import hashlib
+import os
+import pickle
+
+# Default maximum total size of cached results, in bytes
+DEFAULT_MAX_SIZE = 20 * 1024 ** 3
+
+
+class _HashWriter(object):
+    """File-like object which hashes everything written to it"""
+    def __init__(self):
+        self.hash = hashlib.md5()
+
+    def write(self, data):
+        self.hash.update(data)
+
+
+def fingerprint_data(data):
+    """Return a content hash of ``data``, computed from its pickle"""
+    writer = _HashWriter()
+    pickle.dump(data, writer, protocol=pickle.HIGHEST_PROTOCOL)
+    return writer.hash.hexdigest()
+
+
+def make_delta(inputs, data):
+    """Return ``data``, with unchanged tracked datasets replaced by their position in the input data.
+
+    ``inputs`` is ``{id: (position, dataset, version)}`` for the tracked datasets in the input data. Returns ``data`` if no input datasets are tracked."""
+    if not inputs:
+        return data
+    delta = []
+    for ds in data:
+        position, obj, obj_version = inputs.get(id(ds), (None, None, None))
+        if obj is ds and obj_version == version(ds):
+            delta.append(position)
+        else:
+            delta.append(ds)
+    return {'delta': delta}
+
+
+def expand_delta(result, data):
+    """Return the cached ``result``, taking unchanged datasets from the input ``data``"""
+    if isinstance(result, dict) and 'delta' in result:
+        return [data[obj] if isinstance(obj, int) else obj for obj in result['delta']]
+    return result
+
+
+class StepCache(object):
+    """Cache transformation function results across model runs.
+
+    Call ``start(data)`` with the input data of the model run, and then ``apply(function, data)`` instead of ``function(data)`` for each transformation function. ``hits`` and ``misses`` count how often cached results could be used."""
+    def __init__(self, dirpath=None, max_size=DEFAULT_MAX_SIZE):
+        self.dirpath = create_dir(
+            dirpath or os.path.join(get_cache_directory(), "steps"))
+        self.max_size = max_size
+        self.fingerprint = None
+        self.hits = self.misses = 0
+
+    def start(self, data):
+        self.fingerprint = fingerprint_data(data)
+
+    def key(self, function):
+        return hashlib.md5(
+            (self.fingerprint + get_function_identity(function)).encode('utf-8')
+        ).hexdigest()
+
+    def filepath(self, key):
+        return os.path.join(self.dirpath, key + ".pickle")
+
+    def apply(self, function, data):
+        """Return ``(function(data), hit)``, loading the result from the cache if possible.
+
+        ``hit`` is ``True`` if the result was loaded from the cache."""
+        if self.fingerprint is None:
+            self.start(data)
+        key = self.key(function)
+        filepath = self.filepath(key)
+        try:
+            with open(filepath, "rb") as f:
+                data = expand_delta(pickle.load(f), data)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            hit = False
+            # {id: (position, dataset, version)} of tracked input datasets
+            inputs = {id(ds): (position, ds, version(ds))
+                      for position, ds in enumerate(data)
+                      if version(ds) is not None}
+            data = function(data)
+            self.store(filepath, make_delta(inputs, data))
+            self.misses += 1
+        else:
+            hit = True
+            # Mark as recently used
+            os.utime(filepath)
+            self.hits += 1
+        self.fingerprint = key
+        return data, hit
+
+    def store(self, filepath, data):
+        tmp_filepath = filepath + ".tmp"
+        with open(tmp_filepath, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filepath, filepath)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used results until the total size is at most ``max_size``"""
+        entries = []
+        for filename in os.listdir(self.dirpath):
+            if filename.endswith(".pickle"):
+                stat = os.stat(os.path.join(self.dirpath, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            os.remove(os.path.join(self.dirpath, filename))
+            total -= size
+
+    def clear(self):
+        """Delete all cached results"""
+        for filename in os.listdir(self.dirpath):
+            os.remove(os.path.join(self.dirpath, filename))
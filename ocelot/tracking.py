@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""Track which datasets are changed by each transformation function.
+
+``track(data)`` converts datasets, and all dictionaries and lists inside them, to ``TrackedDict`` and ``TrackedList`` objects. These are subclasses of ``dict`` and ``list``, so transformation functions work on them unchanged, and reading is as fast as before. Every change, e.g. ``exc['amount'] = 2`` or ``ds['exchanges'].append(exc)``, increases the ``version`` of the dataset which contains the changed object.
+
+``ChangeTracker`` compares the versions of the datasets after each transformation function with the versions before, so it knows which datasets were changed, added or removed without comparing or copying dataset contents. The follow snapshots (``ocelot.follow``) and the step cache (``ocelot.step_cache``) use versions to only copy or store changed datasets.
+
+An object can be in several datasets, e.g. if a transformation function puts the same exchange into two datasets. It then has several roots, and every change to it increases the version of each of these datasets. Objects are never removed from the roots they were in, so a dataset can be counted as changed when it isn't, but a change is never missed. Several roots are held through weak references, so datasets which are no longer used are not kept alive by objects which they shared with other datasets.
+
+``copy()`` returns a plain shallow copy, like ``dict.copy`` and ``list.copy``: the objects in it are shared with the original, so changing them still increases the version of the original dataset.
+
+This is version tracking, and not copy-on-write: objects are still changed in place, and datasets are only copied where the transformation functions copy them. Copies made with ``copy.deepcopy``, e.g. when a dataset is split, are new tracked datasets. Tracked objects are pickled as plain dictionaries and lists, so saved results and datasets returned from worker processes are not tracked; ``ChangeTracker`` counts such datasets as changed, and tracks them again."""
+import copy
+import weakref
+
+
+def track(data):
+    """Return ``data`` with all (dictionary) datasets converted to ``TrackedDict``"""
+    return [_track(ds, None) if type(ds) is dict else ds for ds in data]
+
+
+def _track(obj, root):
+    """Return ``obj`` as a tracked object whose changes increase the version of ``root``.
+
+    ``root`` is a dataset, a tuple of weak references to datasets, or ``None``, in which case ``obj`` becomes a root, i.e. a dataset."""
+    kind = type(obj)
+    if kind is TrackedDict or kind is TrackedList:
+        if root is None and kind is TrackedDict:
+            root = obj
+        if root is not None:
+            _add_root(obj, root)
+        return obj
+    elif kind is dict:
+        new = TrackedDict()
+        if root is None:
+            root = new
+        new._root = root
+        dict.update(new, ((key, _track(value, root)) for key, value in obj.items()))
+        return new
+    elif kind is list:
+        new = TrackedList(_track(value, root) for value in obj)
+        new._root = root
+        return new
+    return obj
+
+
+def _datasets(root):
+    """Return the live datasets of ``root``, which is a dataset or a tuple of weak references to datasets"""
+    if type(root) is tuple:
+        return [dataset for dataset in (ref() for ref in root)
+                if dataset is not None]
+    return [root]
+
+
+def _add_root(obj, root):
+    """Make changes to the tracked ``obj``, and the objects in it, also increase the version of ``root``"""
+    for dataset in _datasets(root):
+        current = obj._root
+        if current is None:
+            obj._root = dataset
+            continue_down = True
+        elif current is dataset:
+            continue_down = False
+        else:
+            others = _datasets(current)
+            continue_down = not any(other is dataset for other in others)
+            if continue_down:
+                obj._root = tuple(weakref.ref(other) for other in others + [dataset])
+        if continue_down:
+            values = dict.values(obj) if type(obj) is TrackedDict else list.__iter__(obj)
+            for value in values:
+                if type(value) is TrackedDict or type(value) is TrackedList:
+                    _add_root(value, dataset)
+
+
+# Key in the ``deepcopy`` memo while a tracked object is copied
+_COPYING = 'ocelot.tracking'
+
+
+def _deepcopy(obj, memo):
+    """Deep copy of the tracked ``obj``.
+
+    The outermost copied object becomes a new dataset if it is a dictionary; the objects in it belong to this dataset only."""
+    outermost = _COPYING not in memo
+    memo[_COPYING] = True
+    try:
+        if type(obj) is TrackedDict:
+            new = TrackedDict()
+            memo[id(obj)] = new
+            dict.update(new, ((key, copy.deepcopy(value, memo))
+                              for key, value in dict.items(obj)))
+        else:
+            new = TrackedList()
+            memo[id(obj)] = new
+            list.extend(new, [copy.deepcopy(value, memo)
+                              for value in list.__iter__(obj)])
+    finally:
+        if outermost:
+            del memo[_COPYING]
+    return _track(new, None) if outermost else new
+
+
+def _touch(root):
+    if type(root) is tuple:
+        for ref in root:
+            dataset = ref()
+            if dataset is not None:
+                dataset.version += 1
+    elif root is not None:
+        root.version += 1
+
+
+class TrackedDict(dict):
+    """Dictionary which increases the ``version`` of its dataset when it is changed.
+
+    The dataset itself is the root ``TrackedDict``; its ``version`` counts all changes to the dataset and the objects in it. ``_root`` is the dataset, or a tuple of weak references to datasets if the object is in several of them."""
+    __slots__ = ('_root', 'version', '__weakref__')
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._root = None
+        self.version = 0
+
+    def _touch(self):
+        _touch(self._root)
+
+    def __setitem__(self, key, value):
+        self._touch()
+        dict.__setitem__(self, key, _track(value, self._root))
+
+    def __delitem__(self, key):
+        self._touch()
+        dict.__delitem__(self, key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, *args):
+        self._touch()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._touch()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._touch()
+        dict.clear(self)
+
+    def copy(self):
+        """Plain shallow copy; the objects in it still belong to this dataset"""
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return _deepcopy(self, memo)
+
+    def __reduce_ex__(self, protocol):
+        return (dict, (dict(self),))
+
+
+class TrackedList(list):
+    """List which increases the ``version`` of its dataset when it is changed"""
+    __slots__ = ('_root', '__weakref__')
+
+    def __init__(self, *args):
+        list.__init__(self, *args)
+        self._root = None
+
+    def _touch(self):
+        _touch(self._root)
+
+    def __setitem__(self, index, value):
+        self._touch()
+        if isinstance(index, slice):
+            value = [_track(obj, self._root) for obj in value]
+        else:
+            value = _track(value, self._root)
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._touch()
+        list.__delitem__(self, index)
+
+    def append(self, value):
+        self._touch()
+        list.append(self, _track(value, self._root))
+
+    def insert(self, index, value):
+        self._touch()
+        list.insert(self, index, _track(value, self._root))
+
+    def extend(self, values):
+        self._touch()
+        list.extend(self, [_track(value, self._root) for value in values])
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, factor):
+        self._touch()
+        return list.__imul__(self, factor)
+
+    def _mutator(name):
+        method = getattr(list, name)
+
+        def mutate(self, *args, **kwargs):
+            self._touch()
+            return method(self, *args, **kwargs)
+        mutate.__name__ = name
+        return mutate
+
+    remove = _mutator('remove')
+    pop = _mutator('pop')
+    clear = _mutator('clear')
+    sort = _mutator('sort')
+    reverse = _mutator('reverse')
+    del _mutator
+
+    def copy(self):
+        """Plain shallow copy; the objects in it still belong to this dataset"""
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return _deepcopy(self, memo)
+
+    def __reduce_ex__(self, protocol):
+        return (list, (list(self),))
+
+
+def version(ds):
+    """Return the version of a tracked dataset, or ``None`` if ``ds`` isn't tracked"""
+    return ds.version if type(ds) is TrackedDict else None
+
+
+class ChangeTracker(object):
+    """Find the datasets which were changed, added, or removed by each transformation function"""
+    def __init__(self, data):
+        self.versions = {}
+        self.datasets = []
+        self.update(data)
+
+    def update(self, data):
+        # Keep references, so that ids are not reused
+        self.datasets = list(data)
+        self.versions = {id(ds): version(ds) for ds in self.datasets}
+
+    def changed_positions(self, data):
+        """Return the positions in ``data`` of datasets which are new or were changed since the last ``update``"""
+        versions = self.versions
+        return [position for position, ds in enumerate(data)
+                if version(ds) is None or versions.get(id(ds), -1) != ds.version]
+
+    def step(self, data):
+        """Track new datasets in ``data``, update the versions, and return ``(data, changed, removed)``.
+
+        ``changed`` is the number of new or changed datasets, and ``removed`` the number of datasets which are no longer in ``data``."""
+        changed = self.changed_positions(data)
+        if any(version(data[position]) is None for position in changed):
+            data = track(data)
+        current = set(map(id, data))
+        removed = sum(1 for ds in self.datasets if id(ds) not in current)
+        self.update(data)
+        return data, len(changed), removed
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-from ._topology import Topology
-topology = Topology()
+from ._topology import LazyTopology, Topology
+topology = LazyTopology()
 
 from ..cutoff import RC_STRING
 from ...collection import Collection
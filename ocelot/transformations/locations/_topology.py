@@ -1,11 +1,247 @@
 # -*- coding: utf-8 -*-
+from ...filesystem import get_cache_directory
+from collections.abc import Mapping
 import functools
+import hashlib
 import json
+import numpy as np
 import os
-from constructive_geometries import ConstructiveGeometries
+import sqlite3
+import struct
+
+# Mean earth radius, in km
+EARTH_RADIUS = 6371.0088
+
+# Topology index file format version. Bump this to invalidate all indices.
+__index_version__ = "2"
+
+INDEX_MAGIC = b"OCTOPIDX"
+# Arrays in index files start at multiples of this many bytes
+INDEX_ALIGNMENT = 64
+
+
+def _pack_bits(mask):
+    """Pack the boolean array ``mask``, whose length is a multiple of 8, into ``uint8``, least significant bit first.
+
+    Same as ``np.packbits(mask, bitorder='little')``, which needs numpy 1.17."""
+    return np.packbits(mask.reshape(-1, 8)[:, ::-1], axis=1).ravel()
+
+
+def _unpack_bits(data):
+    """Unpack the last axis of the ``uint8`` array ``data`` into bits, least significant bit first.
+
+    Same as ``np.unpackbits(data, axis=-1, bitorder='little')``, which needs numpy 1.17."""
+    bits = np.unpackbits(data[..., np.newaxis], axis=-1)[..., ::-1]
+    return bits.reshape(data.shape[:-1] + (-1,))
+
+
+def _encode(faces, face_index, words):
+    """Return the bitset (an array of ``words`` ``uint64``) of an iterable of face ids"""
+    mask = np.zeros(words * 64, dtype=bool)
+    mask[[face_index[face] for face in faces]] = True
+    return _pack_bits(mask).view(np.uint64)
+
+
+def index_key(compatibility):
+    """Return the key of the topology index for the current ``constructive_geometries`` data and ``compatibility`` aliases"""
+    from constructive_geometries.cg import DATA_FILEPATH
+    hasher = hashlib.sha256()
+    with open(os.path.join(DATA_FILEPATH, "faces.json"), "rb") as f:
+        hasher.update(f.read())
+    hasher.update(json.dumps([__index_version__, compatibility]).encode('utf-8'))
+    return hasher.hexdigest()[:16]
+
+
+def _polygons(wkb, offset=0):
+    """Return ``(polygons, offset)`` for the WKB Polygon or MultiPolygon at ``offset``. Each polygon is a list of rings, and each ring an array of (longitude, latitude) points."""
+    order = '<' if wkb[offset] == 1 else '>'
+    kind, count = struct.unpack_from(order + 'II', wkb, offset + 1)
+    offset += 9
+    if kind == 3:
+        rings = []
+        for _ in range(count):
+            points, = struct.unpack_from(order + 'I', wkb, offset)
+            rings.append(np.frombuffer(wkb, dtype=order + 'f8', count=2 * points,
+                                       offset=offset + 4).reshape(points, 2))
+            offset += 4 + 16 * points
+        return [rings], offset
+    elif kind == 6:
+        polygons = []
+        for _ in range(count):
+            polygon, offset = _polygons(wkb, offset)
+            polygons.extend(polygon)
+        return polygons, offset
+    raise ValueError("Unsupported geometry type {}".format(kind))
+
+
+def _ring_area(points):
+    """Area of a closed ring of (longitude, latitude) points on a sphere, in km2"""
+    lon, lat = np.radians(points[:, 0]), np.radians(points[:, 1])
+    return abs(np.sum((lon[1:] - lon[:-1]) * (2 + np.sin(lat[:-1]) + np.sin(lat[1:])))
+               ) * EARTH_RADIUS ** 2 / 2
+
+
+def face_areas(filepath):
+    """Return ``{face id: area in km2}`` for the faces in the ``constructive_geometries`` GeoPackage ``filepath``.
+
+    GeoPackages are SQLite databases, so no GIS libraries are needed. Areas are computed on a sphere."""
+    # Size of the envelope after the 8 byte GeoPackage header, by envelope type
+    envelopes = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+    areas = {}
+    connection = sqlite3.connect(filepath)
+    try:
+        for geom, face in connection.execute("SELECT geom, id FROM all_faces"):
+            polygons, _ = _polygons(geom, 8 + envelopes[(geom[3] >> 1) & 7])
+            areas[face] = sum(
+                _ring_area(rings[0]) - sum(_ring_area(ring) for ring in rings[1:])
+                for rings in polygons
+            )
+    finally:
+        connection.close()
+    return areas
+
+
+def compute_index(compatibility):
+    """Compute the topology index from the ``constructive_geometries`` data.
+
+    Returns ``(header, arrays)``. ``header`` has the sorted ``locations`` and the ``aliases`` from ``compatibility``. ``arrays`` are:
+
+    * ``faces``: Sorted face ids
+    * ``bits``: Bitset of the faces of each location, one row of ``uint64`` words per location
+    * ``sizes``: Number of faces of each location
+    * ``face areas``: Area of each face, in km2
+    * ``containment``: ``containment[i, j]`` if location ``i`` contains location ``j``
+    * ``intersection``: ``intersection[i, j]`` if locations ``i`` and ``j`` share a face
+
+    """
+    from constructive_geometries import ConstructiveGeometries
+    from constructive_geometries.cg import DATA_FILEPATH
+    cg = ConstructiveGeometries()
+    data = cg.data
+    data['GLO'] = cg.all_faces
+    for old, fixed in compatibility:
+        data[old] = data[fixed]
+
+    locations = sorted(data)
+    faces = np.array(sorted(set().union(*data.values())), dtype=np.int64)
+    face_index = {face: i for i, face in enumerate(faces.tolist())}
+    words = (len(faces) + 63) // 64
+    bits = np.stack([_encode(set(data[location]), face_index, words)
+                     for location in locations])
+    areas = face_areas(os.path.join(DATA_FILEPATH, "faces.gpkg"))
+    header = {
+        'locations': locations,
+        'aliases': dict(compatibility),
+    }
+    arrays = {
+        'faces': faces,
+        'bits': bits,
+        'sizes': np.array([len(set(data[location])) for location in locations],
+                          dtype=np.int64),
+        'face areas': np.array([areas.get(face, 0.) for face in faces.tolist()]),
+        'containment': np.stack([~(bits & ~row).any(axis=1) for row in bits]),
+        'intersection': np.stack([(bits & row).any(axis=1) for row in bits]),
+    }
+    return header, arrays
+
+
+def write_index(filepath, header, arrays):
+    """Write a topology index to ``filepath``.
+
+    The file starts with ``INDEX_MAGIC``, the length of the JSON header as a little-endian ``uint64``, and the JSON header, which lists the ``dtype``, ``shape``, and ``offset`` of each array. The raw arrays follow, aligned to ``INDEX_ALIGNMENT`` bytes, so they can be memory-mapped."""
+    align = lambda x: -(-x // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in sorted(arrays.items()):
+        layout[name] = {
+            'dtype': array.dtype.str,
+            'shape': array.shape,
+            'offset': offset,
+        }
+        offset = align(offset + array.nbytes)
+    encoded = json.dumps(dict(header, arrays=layout)).encode('utf-8')
+    start = align(len(INDEX_MAGIC) + 8 + len(encoded))
+
+    tmp_filepath = filepath + ".tmp"
+    with open(tmp_filepath, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(len(encoded).to_bytes(8, 'little'))
+        f.write(encoded)
+        for name, array in sorted(arrays.items()):
+            f.seek(start + layout[name]['offset'])
+            f.write(array.tobytes())
+    os.replace(tmp_filepath, filepath)
+
+
+def read_index(filepath):
+    """Read a topology index written by ``write_index``. The arrays are memory-mapped, read-only."""
+    with open(filepath, "rb") as f:
+        if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError("Not a topology index: {}".format(filepath))
+        length = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(length).decode('utf-8'))
+    start = -(-(len(INDEX_MAGIC) + 8 + length) // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
+    arrays = {
+        name: np.memmap(filepath, dtype=np.dtype(spec['dtype']), mode='r',
+                        offset=start + spec['offset'], shape=tuple(spec['shape']))
+        for name, spec in header.pop('arrays').items()
+    }
+    return header, arrays
+
+
+def load_index(compatibility):
+    """Return the topology index, read from the cache directory if possible.
+
+    The index is computed, and written to the cache directory, if it isn't there yet, e.g. after ``constructive_geometries`` was updated."""
+    try:
+        filepath = os.path.join(
+            get_cache_directory(),
+            "topology.{}.index".format(index_key(compatibility))
+        )
+    except (OSError, AssertionError):
+        return compute_index(compatibility)
+    try:
+        return read_index(filepath)
+    except (OSError, ValueError):
+        pass
+    header, arrays = compute_index(compatibility)
+    try:
+        write_index(filepath, header, arrays)
+    except OSError:
+        pass
+    return header, arrays
+
+
+class _FaceSets(Mapping):
+    """Read-only mapping of locations to sets of face ids, decoded from the topology bitsets when first used"""
+    def __init__(self, topology):
+        self.topology = topology
+        self.cache = {}
+
+    def __getitem__(self, location):
+        if location not in self.cache:
+            self.cache[location] = self.topology._decode(
+                self.topology.bits[self.topology.index[location]])
+        return self.cache[location]
+
+    def __contains__(self, location):
+        return location in self.topology.index
+
+    def __iter__(self):
+        return iter(self.topology.locations)
+
+    def __len__(self):
+        return len(self.topology.locations)
 
 
 class Topology(object):
+    """Spatial relationships between locations, based on the topological faces of ``constructive_geometries``.
+
+    The faces of each location are stored as a bitset: a row of ``uint64`` words in ``bits``, with one bit per face. ``data`` maps locations to sets of face ids, which are decoded from the bitsets when first used. Containment and intersection between all pairs of locations are precomputed, so questions about location names are table lookups, and questions about sets of faces, ``subtract``, or a resolved ``RoW`` are bit operations on all locations at once.
+
+    The bitsets, containment and intersection tables, and location sizes are computed once for each version of the ``constructive_geometries`` data, and saved in the cache directory (see ``load_index``). Later imports memory-map this file instead of loading and processing the ``constructive_geometries`` data.
+
+    Sets of faces passed to the methods below must only contain faces of this topology."""
     compatibility = [
         # Power grids
         ('ASCC', 'US-ASCC'),
@@ -35,26 +271,122 @@ class Topology(object):
     ]
 
     def __init__(self, size_proxy=None):
-        self.size_proxy = size_proxy or self.default_size_proxy
+        header, arrays = load_index(self.compatibility)
+        self.locations = header['locations']
+        self.aliases = header['aliases']
+        self.index = {location: i for i, location in enumerate(self.locations)}
+        self.faces = arrays['faces']
+        self.bits = arrays['bits']
+        self.sizes = arrays['sizes']
+        self.face_areas = arrays['face areas']
+        self.containment = arrays['containment']
+        self.intersection = arrays['intersection']
+        self.data = _FaceSets(self)
+        self._face_index = None
+        self.size_proxy = size_proxy
+
+    @property
+    def face_index(self):
+        """Dictionary of face ids to their position in ``faces``"""
+        if self._face_index is None:
+            self._face_index = {face: i for i, face in enumerate(self.faces.tolist())}
+        return self._face_index
+
+    def _encode(self, faces):
+        """Return the bitset of an iterable of face ids"""
+        return _encode(faces, self.face_index, self.bits.shape[1])
+
+    def _decode(self, bits):
+        """Return the set of face ids in a bitset"""
+        mask = _unpack_bits(np.asarray(bits).view(np.uint8))
+        return set(self.faces[mask[:len(self.faces)].astype(bool)].tolist())
+
+    def bitset(self, location):
+        """Return the faces of ``location`` as a Python integer, with one bit per face.
+
+        ``location`` can be a location name, ``RoW`` (no faces), or a set of face ids. Integer bitsets are useful for many small queries, where ``&`` and ``~`` on integers are faster than on arrays."""
+        return int.from_bytes(self._location_bits(location).tobytes(), 'little')
+
+    def _location_bits(self, location):
+        if isinstance(location, (set, frozenset)):
+            return self._encode(location)
+        elif location == 'RoW':
+            return np.zeros(self.bits.shape[1], dtype=np.uint64)
+        return self.bits[self.index[location]]
 
-        cg = ConstructiveGeometries()
-        data = cg.data
-        data['GLO'] = cg.all_faces
-        for old, fixed in self.compatibility:
-            data[old] = data[fixed]
-        self.data = {k: set(v) for k, v in data.items()}
+    def _subtract(self, bits, subtract):
+        rows = [self.index[place] for place in subtract if place != 'RoW']
+        if not rows:
+            return bits
+        return bits & ~np.bitwise_or.reduce(self.bits[rows])
+
+    def _covered_by(self, bits):
+        """Return a boolean array of the locations whose faces are all in ``bits``"""
+        return ~(self.bits & ~bits).any(axis=1)
 
     def default_size_proxy(self, face_id):
         """Proxy function to allow for better indicators of area or importance than mere number of faces."""
         return 1
 
+    @property
+    def size_proxy(self):
+        """Size of each face, used to sort locations in ``ordered_dependencies``. Can be:
+
+        * ``"faces"`` (the default) or ``default_size_proxy``: Each face has size one, so locations are sorted by their number of faces
+        * ``"area"``: Face area in km2
+        * A dictionary of face ids to weights, e.g. population or production; missing faces have weight zero
+        * An array of weights, in the order of ``faces``
+        * A function which takes a face id, and returns its weight. It is called once for each face.
+
+        Weights are converted to an array, and the size of each location is computed for all locations at once, when first needed."""
+        return self._size_proxy
+
+    @size_proxy.setter
+    def size_proxy(self, proxy):
+        if proxy is None or (callable(proxy) and proxy == self.default_size_proxy):
+            proxy = "faces"
+        elif isinstance(proxy, str) and proxy not in ("faces", "area"):
+            raise ValueError("Unknown size proxy {}".format(proxy))
+        self._size_proxy = proxy
+        self._weights = self._location_sizes = None
+        self._ordered_dependencies.cache_clear()
+
+    def face_weights(self):
+        """Return the array of face sizes given by ``size_proxy``, in the order of ``faces``"""
+        if self._weights is None:
+            proxy = self.size_proxy
+            if isinstance(proxy, str):
+                weights = (np.ones(len(self.faces)) if proxy == "faces"
+                           else np.asarray(self.face_areas))
+            elif isinstance(proxy, Mapping):
+                weights = np.array([proxy.get(face, 0) for face in self.faces.tolist()],
+                                   dtype=float)
+            elif callable(proxy):
+                weights = np.array([proxy(face) for face in self.faces.tolist()],
+                                   dtype=float)
+            else:
+                weights = np.asarray(proxy, dtype=float)
+                if weights.shape != self.faces.shape:
+                    raise ValueError("Size proxy array must have one weight per face")
+            self._weights = weights
+        return self._weights
+
+    def location_sizes(self):
+        """Return the array of sizes of each location in ``locations``, i.e. the sum of its face weights"""
+        if self._location_sizes is None:
+            if isinstance(self.size_proxy, str) and self.size_proxy == "faces":
+                self._location_sizes = self.sizes.astype(float)
+            else:
+                mask = _unpack_bits(
+                    np.asarray(self.bits).view(np.uint8))[:, :len(self.faces)]
+                self._location_sizes = mask @ self.face_weights()
+        return self._location_sizes
+
     def resolve_row(self, others):
         """Resolve a ``RoW`` against an iterable of specific regions.
 
         Implicitly ignores ``RoW`` if present in ``others``."""
-        return self("GLO").difference(
-            set.union(*[self(place) for place in others])
-        )
+        return self._decode(self._subtract(self.bits[self.index['GLO']], others))
 
     def contained(self, location, exclude_self=False, subtract=None,
             resolved_row=None):
@@ -81,26 +413,27 @@ class Topology(object):
         if location == 'RoW' and resolved_row is None:
             return set()
         elif location == 'RoW':
-            faces = resolved_row
-        elif isinstance(location, (set, frozenset)):
-            faces = location
+            faces = self._encode(resolved_row)
         else:
-            faces = self(location)
+            faces = self._location_bits(location)
 
         if subtract:
-            faces = faces.difference(set.union(*[self(place) for place in subtract]))
+            faces = self._subtract(faces, subtract)
 
-        if not faces:
+        if not faces.any():
             # Empty set has no faces - it doesn't include itself because it
             # doesn't exist anywhere in space
             return set()
 
-        result = {key
-                  for key, value in self.data.items()
-                  if not value.difference(faces)
-                  and not (key == location and exclude_self)}
+        if isinstance(location, str) and location != 'RoW' and not subtract:
+            mask = self.containment[self.index[location]]
+        else:
+            mask = self._covered_by(faces)
+        result = {self.locations[i] for i in np.flatnonzero(mask)}
+        if exclude_self:
+            result.discard(location)
         if (resolved_row not in (set(), frozenset(), None)
-            and not resolved_row.difference(faces)
+            and not (self._encode(resolved_row) & ~faces).any()
             and not (location == 'RoW' and exclude_self)):
             result.add("RoW")
         # Always include RoW for 'GLO' unless ``resolved_row``
@@ -126,6 +459,10 @@ class Topology(object):
         ``GLO`` will contain ``RoW`` (even if ``RoW`` is undefined), as long as ``subtract`` is ``None``.
 
         """
+        if (isinstance(parent, str) and isinstance(child, str) and not subtract
+                and parent != 'RoW' and child != 'RoW'):
+            # Most common case; don't use the cache, and don't hash ``resolved_row``
+            return bool(self.containment[self.index[parent], self.index[child]])
         s = lambda x: frozenset(x) if isinstance(x, set) else x
         t = lambda x: tuple(x) if isinstance(x, list) else x
         return self._contains(s(parent), s(child), t(subtract), s(resolved_row))
@@ -137,51 +474,42 @@ class Topology(object):
             if not child:
                 # Empty set
                 return False
-            elif parent == 'RoW':
-                faces = resolved_row or set()
-            elif isinstance(parent, (set, frozenset)):
-                faces = parent
-            else:
-                faces = self(parent)
-
-            if subtract:
-                faces = faces.difference(set.union(
-                    *[self(place) for place in subtract]
-                ))
-
-            return faces.issuperset(child)
         elif parent == "GLO" and child == 'RoW' and not subtract:
             return True
         elif child == 'RoW' or (parent == 'RoW' and not resolved_row):
             return False
+        elif (isinstance(parent, str) and parent != 'RoW' and not subtract):
+            return bool(self.containment[self.index[parent], self.index[child]])
 
         if parent == 'RoW':
-            faces = resolved_row
-        elif isinstance(parent, (set, frozenset)):
-            faces = parent
+            faces = self._encode(resolved_row or ())
         else:
-            faces = self(parent)
+            faces = self._location_bits(parent)
 
         if subtract:
-            faces = faces.difference(set.union(
-                *[self(place) for place in subtract]
-            ))
+            faces = self._subtract(faces, subtract)
 
-        return faces.issuperset(self(child))
+        return not (self._location_bits(child) & ~faces).any()
 
     def ordered_dependencies(self, datasets, resolved_row=None):
         """Return a list of locations from ``datasets`` in order from largest to smallest.
 
-        Area calculations use ``self.size_proxy``, which by default uses number of topological faces."""
+        Area calculations use ``self.size_proxy``, which by default uses number of topological faces. The sizes of named locations are precomputed; the size of a resolved ``RoW`` is the sum of the weights of its faces."""
         q = lambda x: tuple(sorted({x['location'] for x in datasets}))
         s = lambda x: frozenset(x) if isinstance(x, set) else x
         return self._ordered_dependencies(q(datasets), s(resolved_row))
 
     @functools.lru_cache(maxsize=512)
     def _ordered_dependencies(self, locations, resolved_row):
-        get_faces = lambda loc: resolved_row if (loc == 'RoW' and resolved_row) else self(loc)
-        size = lambda loc: sum(self.size_proxy(face)
-                               for face in get_faces(loc))
+        sizes = self.location_sizes()
+
+        def size(loc):
+            if loc != 'RoW':
+                return sizes[self.index[loc]]
+            elif not resolved_row:
+                return 0
+            positions = [self.face_index[face] for face in resolved_row]
+            return self.face_weights()[positions].sum()
 
         ordered = sorted(locations, key=lambda k: (size(k), k), reverse=True)
         return ordered
@@ -191,11 +519,9 @@ class Topology(object):
         """Not used in Ocelot"""
         if location in ('GLO', 'RoW'):
             return set()
-        faces = self(location)
-        return {key
-                for key, value in self.data.items()
-                if value.intersection(faces)
-                and not (key == location and exclude_self)}
+        mask = self.intersection[self.index[location]]
+        return {self.locations[i] for i in np.flatnonzero(mask)
+                if not (exclude_self and self.locations[i] == location)}
 
     def intersects(self, parent, child):
         """Return boolean of whether ``parent`` contains ``child``.
@@ -207,11 +533,46 @@ class Topology(object):
         """Return a boolean if any elements in ``group`` overlap each other."""
         if not group:
             return None
-        faces = [self(obj) for obj in group]
-        return sum(len(o) for o in faces) != len(set.union(*faces))
+        rows = [self.index[obj] for obj in group if obj != 'RoW']
+        return bool(np.triu(self.intersection[np.ix_(rows, rows)], 1).any())
 
     def __call__(self, location):
         if location == 'RoW':
             return set()
         else:
             return self.data[location]
+
+
+class LazyTopology(object):
+    """Placeholder which becomes a ``Topology`` when it is first used.
+
+    ``ocelot.transformations.locations.topology`` is created at import time, but most commands never look at locations. The first attribute access or call creates the topology in place, i.e. this object's class is changed to ``Topology``, so later calls have no extra cost."""
+    def __init__(self, *args, **kwargs):
+        self._arguments = args, kwargs
+
+    def _load(self):
+        args, kwargs = self.__dict__['_arguments']
+        object.__setattr__(self, '__class__', Topology)
+        try:
+            Topology.__init__(self, *args, **kwargs)
+        except BaseException:
+            object.__setattr__(self, '__class__', LazyTopology)
+            raise
+        del self._arguments
+
+    def __getattr__(self, name):
+        if '_arguments' not in self.__dict__:
+            raise AttributeError(name)
+        self._load()
+        return getattr(self, name)
+
+    def __setattr__(self, name, value):
+        if name == '_arguments':
+            self.__dict__[name] = value
+        else:
+            self._load()
+            setattr(self, name, value)
+
+    def __call__(self, location):
+        self._load()
+        return self(location)
@@ -88,30 +88,108 @@ link_consumers_to_recycled_content_activities.__table__ = {
 
 
 
+class SupplierIndex(object):
+    """Find the markets and market groups which supply a consumer location.
+
+    Built once for all datasets. For each product, the markets and market groups, the resolved supplier ``RoW``, the candidate locations ordered from largest to smallest, and their faces as integer bitsets (see ``Topology.bitset``) are computed when the product is first needed. The suppliers for each combination of product, consumer location, and consumer ``RoW`` are cached, so consumers in the same location don't repeat the search.
+
+    The search is the same as with ``topology.contains``: candidates are taken from largest to smallest if they fit in the consumer location minus the candidates already found; if none fit, the smallest candidate which contains the consumer location is used."""
+    def __init__(self, data):
+        markets_filter = lambda x: x['type'] in ("market activity", "market group")
+        self.candidates = dict(toolz.groupby(
+            'reference product',
+            filter(markets_filter, data)
+        ))
+        # Used only to resolve RoW for consumers
+        self.row_mappings = {
+            kind: dict(toolz.groupby('name', filter(lambda x: x['type'] == kind, data)))
+            for kind in ("market activity", "transforming activity")
+        }
+        self.products, self.consumer_rows, self.cache = {}, {}, {}
+
+    def __contains__(self, product):
+        return product in self.candidates
+
+    def consumer_row(self, ds):
+        """Return ``(key, faces bitset)`` of the resolved ``RoW`` of consumer ``ds``, or ``(None, None)`` if ``ds`` isn't in ``RoW``"""
+        if ds['location'] != 'RoW':
+            return None, None
+        kind = ("transforming activity" if ds['type'] == 'transforming activity'
+                else "market activity")
+        key = (kind, ds['name'])
+        if key not in self.consumer_rows:
+            self.consumer_rows[key] = topology.bitset(topology.resolve_row(
+                [x['location'] for x in self.row_mappings[kind][ds['name']]]
+            ))
+        return key, self.consumer_rows[key]
+
+    def product(self, product):
+        """Return ``(ordered candidates, {location: (supplier, faces bitset)})`` for ``product``"""
+        if product not in self.products:
+            candidates = self.candidates[product]
+            markets = {x['location']: x for x in candidates
+                       if x['type'] == 'market activity'}
+            market_groups = {x['location']: x for x in candidates
+                             if x['type'] == 'market group'}
+            if 'RoW' in markets:
+                supplier_row = topology.resolve_row(markets)
+            else:
+                supplier_row = set()
+            ordered = topology.ordered_dependencies(
+                [{'location': l} for l in set(markets).union(set(market_groups))],
+                supplier_row
+            )
+            suppliers = {
+                location: (
+                    markets[location] if location in markets else market_groups[location],
+                    topology.bitset(supplier_row if location == 'RoW' else location)
+                )
+                for location in ordered
+            }
+            self.products[product] = ordered, suppliers
+        return self.products[product]
+
+    def suppliers(self, product, ds):
+        """Return the list of markets and market groups which supply ``product`` to ``ds``"""
+        row_key, row_faces = self.consumer_row(ds)
+        key = (product, ds['location'], row_key)
+        if key not in self.cache:
+            self.cache[key] = self.search(product, ds['location'], row_faces)
+        return self.cache[key]
+
+    def search(self, product, location, row_faces):
+        ordered, suppliers = self.product(product)
+        consumer = row_faces if location == 'RoW' else topology.bitset(location)
+
+        found, remaining = [], consumer
+        for candidate in ordered:
+            supplier, faces = suppliers[candidate]
+            if faces and not faces & ~remaining:
+                found.append(supplier)
+                if candidate != 'RoW':
+                    # Like ``subtract`` in ``topology.contains``, which ignores ``RoW``
+                    remaining &= ~faces
+        if not found and consumer:
+            # No market or market group within this location -
+            # Find smallest market or market group which contains this activity
+            for candidate in reversed(ordered):
+                supplier, faces = suppliers[candidate]
+                if not consumer & ~faces:
+                    found.append(supplier)
+                    break
+        return found
+
+
 def link_consumers_to_markets(data):
     """Link technosphere exchange inputs to markets and market groups.
 
     Should only be run after ``add_suppliers_to_markets``. Skips hard (activity) links, and exchanges which have already been linked.
 
+    Suppliers are found with a ``SupplierIndex``.
+
     Add the field ``code`` to each exchange with the code of the linked market activity."""
     no_mg_filter = lambda x: x['type'] != "market group"
-    ma_filter = lambda x: x['type'] == "market activity"
-    ta_filter = lambda x: x['type'] == "transforming activity"
-    markets_filter = lambda x: x['type'] in ("market activity", "market group")
-    markets_mapping = dict(toolz.groupby(
-        'reference product',
-        filter(markets_filter, data)
-    ))
-
-    # Used only to resolve RoW for consumers
-    ma_mapping = dict(toolz.groupby(
-        'name',
-        filter(ma_filter, data)
-    ))
-    ta_mapping = dict(toolz.groupby(
-        'name',
-        filter(ta_filter, data)
-    ))
+    index = SupplierIndex(data)
 
     def annotate(exc, ds):
         exc = annotate_exchange(exc, ds)
@@ -120,71 +198,14 @@ def link_consumers_to_markets(data):
 
     for ds in filter(no_mg_filter, data):
         # Only unlinked (not recycled content or direct linked) technosphere inputs
-        loc = ds['location']
-
-        if loc == 'RoW':
-            if ds['type'] == 'transforming activity':
-                dct = ta_mapping
-            else:
-                dct = ma_mapping
-            consumer_row = topology.resolve_row(
-                [x['location'] for x in dct[ds['name']]]
-            )
-        else:
-            consumer_row = None
-
-        def contains_wrapper(consumer, supplier, found, consumer_row, supplier_row):
-            kwargs = {
-                'parent': consumer,
-                'child': supplier_row if supplier == 'RoW' else supplier,
-                'subtract': found,
-                'resolved_row': consumer_row if consumer == 'RoW' else None
-            }
-            return topology.contains(**kwargs)
-
         for exc in list(filter(unlinked, ds['exchanges'])):
-            try:
-                candidates = markets_mapping[exc['name']]
-            except KeyError:
+            if exc['name'] not in index:
                 if exc['name'] == 'refinery gas':
-                    pass
+                    continue
                 else:
                     raise MissingSupplier("No markets found for product {}".format(exc['name']))
 
-            found, to_add = [], []
-
-            markets = {x['location']: x for x in candidates if x['type'] == 'market activity'}
-            market_groups = {x['location']: x for x in candidates if x['type'] == 'market group'}
-
-            if 'RoW' in markets:
-                supplier_row = topology.resolve_row(markets)
-            else:
-                supplier_row = set()
-
-            together = set(markets).union(set(market_groups))
-            ordered = topology.ordered_dependencies(
-                [{'location': l} for l in together],
-                supplier_row
-            )
-
-            for candidate in ordered:
-                if contains_wrapper(loc, candidate, found, consumer_row, supplier_row):
-                    found.append(candidate)
-                    if candidate in markets:
-                        to_add.append(markets[candidate])
-                    else:
-                        to_add.append(market_groups[candidate])
-            if not found:
-                # No market or market group within this location -
-                # Find smallest market or market group which contains this activity
-                for candidate in reversed(ordered):
-                    if contains_wrapper(candidate, loc, found, supplier_row, consumer_row):
-                        found.append(candidate)
-                        if candidate in markets:
-                            to_add.append(markets[candidate])
-                        else:
-                            to_add.append(market_groups[candidate])
-                        break
+            to_add = index.suppliers(exc['name'], ds)
 
             if len(to_add) == 1:
                 obj = to_add[0]
@@ -22,7 +22,7 @@ detailed = logging.getLogger('ocelot-detailed')
 def link_market_group_suppliers(data):
     """Link suppliers to market groups and populate ``dataset['suppliers']``.
 
-    Market groups can overlap, so our strategy is to fill up the market groups starting with the largest suppliers contained within the location. We choose between markets and market groups simultaneously, preferring markets over market groups if they have the same location (which is normally not allowed). Sorting is done using ``topology.default_size_proxy``, which currently counts the number of topological faces.
+    Market groups can overlap, so our strategy is to fill up the market groups starting with the largest suppliers contained within the location. We choose between markets and market groups simultaneously, preferring markets over market groups if they have the same location (which is normally not allowed). Sorting is done using ``topology.size_proxy``, which by default counts the number of topological faces; set it to ``"area"`` to sort by area.
 
     The same market can supply more than one market group, such as individual country mixes supplying the market groups for ENTSO-E and Europe without Switzerland.
 
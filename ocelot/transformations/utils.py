@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from ..errors import InvalidMultioutputDataset, ZeroProduction
+from ..executors import open_executor
 from .uncertainty import scale_exchange, remove_exchange_uncertainty
 from copy import deepcopy
 from pprint import pformat
@@ -321,6 +322,9 @@ def choose_reference_product_exchange(dataset, exchange, allocation_factor=1):
 
 @wrapt.decorator
 def single_input(wrapped, instance, args, kwargs):
-    """Decorator to allow a transformation function to take a single dataset input."""
+    """Decorator to allow a transformation function to take a single dataset input.
+
+    Datasets are processed by the executor of the current model run; see ``ocelot.executors``."""
     data = kwargs.get('data') or args[0]
-    return [ds for elem in data for ds in wrapped(elem)]
+    with open_executor() as executor:
+        return [ds for children in executor.map(wrapped, data) for ds in children]
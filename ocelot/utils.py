@@ -3,6 +3,8 @@ from .errors import InvalidTransformationFunction
 from .collection import Collection
 from collections.abc import Iterable
 import functools
+import hashlib
+import inspect
 
 
 def get_function_meta(function):
@@ -20,6 +22,69 @@ def get_function_meta(function):
         }
 
 
+SIMPLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+def _identity_parts(obj, seen=None):
+    """Yield stable strings which identify ``obj``, recursing into wrapped functions, their arguments, and their closures"""
+    if isinstance(obj, SIMPLE_TYPES):
+        yield repr(obj)
+        return
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, functools.partial):
+        yield "partial"
+        yield from _identity_parts(obj.func, seen)
+        for arg in obj.args:
+            yield from _identity_parts(arg, seen)
+        for key, value in sorted(obj.keywords.items()):
+            yield key
+            yield from _identity_parts(value, seen)
+    elif hasattr(obj, 'filter_function') and hasattr(obj, 'func'):
+        # ``TransformationWrapper``
+        yield type(obj).__qualname__
+        yield from _identity_parts(obj.func, seen)
+        yield from _identity_parts(obj.filter_function, seen)
+    elif isinstance(obj, (list, tuple)):
+        yield type(obj).__name__
+        for elem in obj:
+            yield from _identity_parts(elem, seen)
+    elif isinstance(obj, dict):
+        yield "dict"
+        for key, value in sorted(obj.items(), key=lambda item: repr(item[0])):
+            yield from _identity_parts(key, seen)
+            yield from _identity_parts(value, seen)
+    elif callable(obj):
+        obj = inspect.unwrap(obj)
+        yield "{}.{}".format(getattr(obj, '__module__', ''),
+                             getattr(obj, '__qualname__', type(obj).__qualname__))
+        try:
+            yield hashlib.md5(inspect.getsource(obj).encode('utf-8')).hexdigest()
+        except (OSError, TypeError):
+            pass
+        # Values captured by closures, like the label in ``create_allocation_filter``
+        for cell in getattr(obj, '__closure__', None) or ():
+            try:
+                value = cell.cell_contents
+            except ValueError:
+                continue
+            if isinstance(value, SIMPLE_TYPES + (list, tuple)) or callable(value):
+                yield from _identity_parts(value, seen)
+    else:
+        yield type(obj).__qualname__
+
+
+def get_function_identity(function):
+    """Return a hash which identifies transformation function ``function`` across runs.
+
+    The hash is built from the qualified name and a hash of the source code of the function, and of any functions it wraps. For ``functools.partial`` objects, the arguments are included too. Changing the code of a transformation function therefore changes its identity."""
+    return hashlib.md5(
+        "\n".join(_identity_parts(function)).encode('utf-8')
+    ).hexdigest()
+
+
 def validate_configuration(config):
     if not isinstance(config, Collection):
         as_iterable = Collection("Wrapper", *config)
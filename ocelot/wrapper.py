@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from .executors import open_executor
 
 
 class TransformationWrapper:
@@ -8,6 +9,8 @@ class TransformationWrapper:
 
     Each application of ``function`` should return a list of new datasets which replace the incoming dataset. The input data can be optionally filtered by ``filter_function``, which should take a dataset and return a boolean.
 
+    The datasets are processed by the executor of the current model run (see ``ocelot.executors``), unless a different ``executor`` is given, e.g. ``"process"``. The filter function is always applied in this process, so it doesn't need to be picklable. The order of the returned datasets is the same in all cases.
+
     Usage:
 
     .. code-block:: python
@@ -17,19 +20,26 @@ class TransformationWrapper:
         changed_data = new_function(old_data)
 
     """
-    def __init__(self, function, filter_function=None):
+    def __init__(self, function, filter_function=None, executor=None):
         self.func = function
         self.filter_function = filter_function
+        self.executor = executor
         self.__name__ = function.__name__
         self.__doc__ = function.__doc__
         self.__table__ = getattr(function, "__table__", None)
 
     def __call__(self, data):
-        if self.filter_function:
-            _ = lambda ds: self.func(ds) if self.filter_function(ds) else [ds]
-            return [ds for elem in data for ds in _(elem)]
-        else:
-            return [child for ds in data for child in self.func(ds)]
+        with open_executor(self.executor) as executor:
+            if self.filter_function:
+                data = list(data)
+                selected = [bool(self.filter_function(ds)) for ds in data]
+                results = iter(executor.map(
+                    self.func, [ds for ds, flag in zip(data, selected) if flag]))
+                return [child for ds, flag in zip(data, selected)
+                        for child in (next(results) if flag else [ds])]
+            else:
+                return [child for children in executor.map(self.func, data)
+                        for child in children]
 
 
 
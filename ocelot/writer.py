@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Write intermediate results in the background.
+
+Pickling the whole database at each save point would block the model run. A ``ResultWriter`` takes a snapshot of the data and writes it while the next transformation function runs:
+
+* With ``method="thread"`` (the default), the data is pickled in the main thread, as the next transformation function could change it, and a background thread compresses and writes the pickle. The model run still waits for the whole database to be pickled at each save; only compression and disk I/O overlap with the next transformation function.
+* With ``method="fork"``, a child process is forked for each result, which pickles, compresses, and writes the data. This avoids pickling in the main thread, but forking a process with other running threads (e.g. of a thread executor or the profiler) is unsafe, especially on macOS, and pickling in the child touches the reference count of every object, so each child ends up with its own copy of most of the data. Only use it on Linux, without other threads, and with enough memory.
+* ``method="sync"`` writes immediately.
+
+At most ``max_pending`` results are waiting or being written at the same time, which bounds the extra memory used; ``save`` waits if needed. ``flush`` waits until all results are written, and raises ``OSError`` if any of them failed. Forked children ignore CTRL-C, so results which are being written when the model run is interrupted are still completed by ``flush``.
+
+Results are compressed with zstd or lz4 if the ``zstandard`` or ``lz4`` library is installed; see ``ocelot.filesystem.DEFAULT_COMPRESSION``."""
+from .filesystem import (
+    COMPRESSION_SUFFIXES,
+    DEFAULT_COMPRESSION,
+    write_pickle,
+    write_sidecar,
+)
+import os
+import pickle
+import queue
+import signal
+import threading
+import traceback
+
+
+class ResultWriter(object):
+    """Write pickled results, optionally compressed, in the background"""
+    def __init__(self, compression=DEFAULT_COMPRESSION, max_pending=2, method="thread"):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError("Unknown compression {}".format(compression))
+        if method not in ("fork", "thread", "sync"):
+            raise ValueError("Unknown method {}".format(method))
+        if method == "fork" and not hasattr(os, "fork"):
+            raise ValueError("``os.fork`` is not available on this platform")
+        self.compression = compression
+        self.max_pending = max_pending
+        self.method = method
+        self.children = []
+        self.errors = []
+        self.queue = self.thread = None
+
+    def save(self, filepath, data, sidecar=None):
+        """Write ``data`` to ``filepath`` (plus the compression suffix), and then write ``sidecar``, a ``(filepath, metadata)`` tuple, if given"""
+        filepath += COMPRESSION_SUFFIXES[self.compression]
+        if self.method == "sync":
+            self.write(filepath, data, sidecar)
+        elif self.method == "fork":
+            while len(self.children) >= self.max_pending:
+                self.wait(*self.children.pop(0))
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                status = 0
+                try:
+                    self.write(filepath, data, sidecar)
+                except BaseException:
+                    traceback.print_exc()
+                    status = 1
+                finally:
+                    os._exit(status)
+            self.children.append((pid, filepath))
+        else:
+            if self.thread is None:
+                self.queue = queue.Queue(maxsize=self.max_pending)
+                self.thread = threading.Thread(target=self.work, daemon=True)
+                self.thread.start()
+            payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            self.queue.put((filepath, payload, sidecar))
+
+    def write(self, filepath, data, sidecar):
+        write_pickle(filepath, data, self.compression)
+        write_sidecar(sidecar)
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                try:
+                    self.write(*item)
+                except Exception:
+                    traceback.print_exc()
+                    self.errors.append(item[0])
+            finally:
+                self.queue.task_done()
+
+    def wait(self, pid, filepath):
+        _, status = os.waitpid(pid, 0)
+        # Zero if the child exited normally with exit code 0
+        if status != 0:
+            self.errors.append(filepath)
+
+    def flush(self):
+        """Wait until all results are written"""
+        while self.children:
+            self.wait(*self.children.pop(0))
+        if self.queue is not None:
+            self.queue.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise OSError("Couldn't write results:\n\t{}".format("\n\t".join(errors)))
+
+    def close(self):
+        """Flush, and stop the background thread"""
+        try:
+            self.flush()
+        finally:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.queue = self.thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
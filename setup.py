@@ -34,6 +34,7 @@ setup(
     entry_points = {
         'console_scripts': [
             'ocelot-cli = ocelot.bin.ocelot_cli:main',
+            'ocelot-compare = ocelot.bin.ocelot_compare:main',
         ]
     },
     install_requires=[
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from ocelot.errors import InvalidCheckpoint
+from ocelot.filesystem import list_checkpoints, load_checkpoint
+from ocelot.model import system_model
+from ocelot.utils import get_function_identity
+from ocelot.wrapper import TransformationWrapper
+import functools
+import pytest
+
+
+calls = []
+
+def add_one(data):
+    calls.append('add_one')
+    return data + [1]
+
+def add_two(data):
+    calls.append('add_two')
+    return data + [2]
+
+def add_three(data):
+    calls.append('add_three')
+    return data + [3]
+
+def add_number(data, number):
+    return data + [number]
+
+def test_checkpoints_written(fake_report):
+    output_dir, data = system_model([], [add_one, add_two], save_strategy="1:1")
+    assert list_checkpoints(output_dir.directory) == [1]
+    data, metadata = load_checkpoint("{}:1".format(output_dir.report_id))
+    assert data == [1, 2]
+    assert metadata['index'] == 1
+    assert metadata['function name'] == 'add_two'
+    assert len(metadata['configuration']) == 2
+
+def test_resume(fake_report):
+    config = [add_one, [add_two, add_three]]
+    output_dir, expected = system_model([], config, save_strategy="0:2")
+    del calls[:]
+    _, data = system_model(None, config,
+                           resume_from="{}:1".format(output_dir.report_id))
+    assert data == expected == [1, 2, 3]
+    assert calls == ['add_three']
+
+def test_resume_from_run_directory(fake_report):
+    output_dir, _ = system_model([], [add_one, add_two], save_strategy="1:1")
+    _, data = system_model(None, [add_one, add_two, add_three],
+                           resume_from=output_dir.directory + ":1")
+    assert data == [1, 2, 3]
+
+def test_resume_configuration_mismatch(fake_report):
+    output_dir, _ = system_model([], [add_one, add_two], save_strategy="1:1")
+    with pytest.raises(InvalidCheckpoint):
+        system_model(None, [add_one, add_three],
+                     resume_from="{}:1".format(output_dir.report_id))
+    with pytest.raises(InvalidCheckpoint):
+        system_model(None, [add_one],
+                     resume_from="{}:1".format(output_dir.report_id))
+
+def test_resume_missing_checkpoint(fake_report):
+    output_dir, _ = system_model([], [add_one, add_two], save_strategy="1:1")
+    with pytest.raises(InvalidCheckpoint):
+        system_model(None, [add_one, add_two],
+                     resume_from="{}:0".format(output_dir.report_id))
+    with pytest.raises(InvalidCheckpoint):
+        system_model(None, [add_one, add_two], resume_from="foo:1")
+    with pytest.raises(InvalidCheckpoint):
+        system_model(None, [add_one, add_two], resume_from="foo")
+
+def test_function_identity():
+    assert get_function_identity(add_one) == get_function_identity(add_one)
+    assert get_function_identity(add_one) != get_function_identity(add_two)
+    assert (get_function_identity(functools.partial(add_number, number=1))
+            == get_function_identity(functools.partial(add_number, number=1)))
+    assert (get_function_identity(functools.partial(add_number, number=1))
+            != get_function_identity(functools.partial(add_number, number=2)))
+    assert (get_function_identity(TransformationWrapper(add_one))
+            != get_function_identity(add_one))
+
+def test_function_identity_closures():
+    def make_filter(label):
+        def label_filter(ds):
+            return ds == label
+        return label_filter
+
+    assert (get_function_identity(make_filter("a"))
+            == get_function_identity(make_filter("a")))
+    assert (get_function_identity(make_filter("a"))
+            != get_function_identity(make_filter("b")))
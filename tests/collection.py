@@ -4,40 +4,9 @@ from ocelot.filesystem import OutputDir
 from ocelot.model import system_model
 from unittest import mock
 import os
-import pytest
-import tempfile
 import uuid
 
 
-def do_nothing(*args, **kwargs):
-    """Mock for `HTMLReport` that doesn't do anything"""
-    pass
-
-def passthrough(obj, use_cache=True):
-    """Mock for ``extract_directory`` that returns the initial input"""
-    return obj
-
-@pytest.fixture(scope="function")
-def fake_report(monkeypatch):
-    tempdir = tempfile.mkdtemp()
-    get_fake_directory = lambda : tempdir
-    monkeypatch.setattr(
-        'ocelot.filesystem.get_base_directory',
-        get_fake_directory
-    )
-    monkeypatch.setattr(
-        'ocelot.model.cache_data',
-        lambda x, y: None
-    )
-    monkeypatch.setattr(
-        'ocelot.model.extract_directory',
-        passthrough
-    )
-    monkeypatch.setattr(
-        'ocelot.model.HTMLReport',
-        do_nothing
-    )
-
 def test_report_and_extract_directory_mock(fake_report):
     output_dir, data = system_model([])
     assert data == []
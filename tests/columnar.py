@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from ocelot.columnar import ColumnarCache, LazyDatasets, write_columnar_cache
+from ocelot.io.extract_ecospold2 import generic_extractor
+from collections import OrderedDict
+import os
+import pickle
+import pytest
+import sys
+import tempfile
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def extracted():
+    return {
+        filename: generic_extractor(os.path.join(test_data_dir, filename))
+        for filename in sorted(os.listdir(test_data_dir))
+    }
+
+@pytest.fixture
+def cache(extracted):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirpath = write_columnar_cache(extracted, os.path.join(tmpdir, "cache"))
+        yield ColumnarCache(dirpath)
+
+def test_roundtrip(cache, extracted):
+    assert sorted(cache) == sorted(extracted)
+    for filename, datasets in extracted.items():
+        assert cache[filename] == datasets
+
+def test_roundtrip_types(cache):
+    ds = cache['basic.xml'][0]
+    exc = ds['exchanges'][0]
+    assert type(exc['amount']) is float
+    assert exc['conditional exchange'] is False
+    assert ds['parent'] == 'some uuid'
+
+def test_production_volume_roundtrip(cache):
+    exc = cache['prod_volume.xml'][0]['exchanges'][0]
+    assert exc['production volume']['amount'] == 23.0
+    assert exc['production volume']['variable'] == 'Cason_Volkman'
+
+def test_unusual_values_roundtrip():
+    data = {'a': [{
+        'name': None,
+        'location': 42,
+        'exchanges': [{
+            'amount': float('nan'),
+            'name': ['not', 'a', 'string'],
+            'production volume': {'formula': 'foo'},
+            'conditional exchange': 'maybe',
+        }, {
+            'production volume': {'amount': 1},
+        }],
+    }], 'b': [{'name': 'no exchanges'}]}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ColumnarCache(write_columnar_cache(data, os.path.join(tmpdir, "c")))
+        result = cache['a'][0]
+        assert result['name'] is None
+        assert result['location'] == 42
+        assert result['exchanges'][0]['amount'] != result['exchanges'][0]['amount']
+        result['exchanges'][0]['amount'] = data['a'][0]['exchanges'][0]['amount']
+        assert result == data['a'][0]
+        assert cache['b'] == data['b']
+
+def test_strings_are_shared(cache):
+    first, second = cache.datasets()[:2]
+    assert first['exchanges'][0]['tag'] is second['exchanges'][0]['tag']
+
+def test_strings_are_interned(cache):
+    exc = cache['basic.xml'][0]['exchanges'][0]
+    assert exc['unit'] is sys.intern('m3')
+    assert exc['uncertainty']['type'] is sys.intern('lognormal')
+
+def test_empty_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ColumnarCache(write_columnar_cache({}, os.path.join(tmpdir, "c")))
+        assert len(cache) == 0
+        assert list(cache.datasets()) == []
+
+def test_overwrite_existing_cache(extracted):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirpath = os.path.join(tmpdir, "cache")
+        write_columnar_cache(extracted, dirpath)
+        write_columnar_cache({'basic.xml': extracted['basic.xml']}, dirpath)
+        assert list(ColumnarCache(dirpath)) == ['basic.xml']
+
+def test_files_written_in_any_order_are_sorted(extracted):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirpath = write_columnar_cache(sorted(extracted.items(), reverse=True),
+                                       os.path.join(tmpdir, "cache"))
+        cache = ColumnarCache(dirpath)
+        assert list(cache) == sorted(extracted)
+        assert isinstance(cache.filenames, OrderedDict)
+
+def test_replace_cache_while_reading(extracted):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirpath = write_columnar_cache(extracted, os.path.join(tmpdir, "cache"))
+        old = ColumnarCache(dirpath)
+
+        def merged():
+            try:
+                for filename in list(old):
+                    yield filename, old[filename]
+            finally:
+                old.close()
+
+        write_columnar_cache(merged(), dirpath)
+        assert old.blobs is None and not old.exchanges_table
+        assert dict(ColumnarCache(dirpath)) == extracted
+
+def test_lazy_datasets_materialize_on_access(cache, extracted):
+    lazy = cache.datasets()
+    assert isinstance(lazy, LazyDatasets)
+    assert len(lazy) == sum(len(x) for x in extracted.values())
+    assert not any(isinstance(item, dict) for item in lazy.items)
+    first = lazy[0]
+    assert lazy[0] is first
+    assert sum(isinstance(item, dict) for item in lazy.items) == 1
+
+def test_lazy_datasets_order_and_equality(cache, extracted):
+    expected = [ds for filename in sorted(extracted) for ds in extracted[filename]]
+    assert cache.datasets() == expected
+    assert list(cache.datasets()) == expected
+
+def test_lazy_datasets_keep_changes(cache):
+    lazy = cache.datasets()
+    lazy[1]['name'] = 'changed'
+    assert [ds for ds in lazy][1]['name'] == 'changed'
+
+def test_lazy_datasets_mutable(cache):
+    lazy = cache.datasets()
+    length = len(lazy)
+    lazy.append({'name': 'new'})
+    del lazy[0]
+    assert len(lazy) == length
+    assert lazy[-1] == {'name': 'new'}
+    assert isinstance(lazy + [1], list)
+    assert len([1] + lazy) == length + 1
+
+def test_lazy_datasets_pickle_as_list(cache):
+    lazy = cache.datasets()
+    restored = pickle.loads(pickle.dumps(lazy))
+    assert type(restored) is list
+    assert restored == lazy
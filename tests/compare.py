@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from ocelot.compare import compare_results, load_results
+from ocelot.errors import OutputDirectoryError
+from ocelot.model import system_model
+import copy
+import pytest
+import tempfile
+
+
+def make_data():
+    return [{
+        'code': 'a',
+        'name': 'steel production',
+        'location': 'CH',
+        'exchanges': [
+            {'type': 'reference product', 'name': 'steel', 'unit': 'kg', 'amount': 1.},
+            {'type': 'from technosphere', 'name': 'coal', 'unit': 'kg',
+             'amount': 2., 'code': 'c'},
+            {'type': 'to environment', 'name': 'CO2', 'unit': 'kg',
+             'compartment': 'air', 'subcompartment': 'urban', 'amount': 3.},
+        ]
+    }, {
+        'code': 'c',
+        'name': 'coal mining',
+        'location': 'GLO',
+        'exchanges': [
+            {'type': 'reference product', 'name': 'coal', 'unit': 'kg', 'amount': 1.},
+        ]
+    }, {
+        # No code: matched by activity hash
+        'name': 'market for steel',
+        'location': 'GLO',
+        'reference product': 'steel',
+        'exchanges': [
+            {'type': 'reference product', 'name': 'steel', 'unit': 'kg', 'amount': 1.},
+        ]
+    }]
+
+def test_identical_results():
+    result = compare_results(make_data(), make_data())
+    assert result['datasets'] == []
+    assert result['summary']['matched datasets'] == 3
+    assert result['summary']['compared exchanges'] == 5
+    assert result['summary']['changed amounts'] == 0
+
+def test_amount_tolerance():
+    second = make_data()
+    second[0]['exchanges'][1]['amount'] = 2. * (1 + 1e-9)
+    assert compare_results(make_data(), second)['datasets'] == []
+    second[0]['exchanges'][1]['amount'] = 2.5
+    result = compare_results(make_data(), second)
+    assert result['summary']['changed amounts'] == 1
+    assert result['datasets'][0]['amounts'] == [
+        ["from technosphere: coal (kg) <- c", 2., 2.5]
+    ]
+    assert compare_results(make_data(), second, rtol=0.5)['datasets'] == []
+
+def test_exchanges_and_fields():
+    second = make_data()
+    second[0]['location'] = 'DE'
+    del second[0]['exchanges'][2]
+    second[0]['exchanges'][1]['code'] = 'd'
+    diff = compare_results(make_data(), second)['datasets'][0]
+    assert diff['status'] == "changed"
+    assert diff['fields'] == {'location': ['CH', 'DE']}
+    assert diff['only in first'] == [
+        "from technosphere: coal (kg) <- c",
+        "to environment: CO2 (kg) [air/urban]",
+    ]
+    assert diff['only in second'] == ["from technosphere: coal (kg) <- d"]
+
+def test_unmatched_datasets():
+    second = make_data()[1:]
+    second.append(copy.deepcopy(second[0]))
+    second[-1]['code'] = 'e'
+    result = compare_results(make_data(), second)
+    assert result['summary']['only in first'] == 1
+    assert result['summary']['only in second'] == 1
+    assert sorted(diff['status'] for diff in result['datasets']) == [
+        "only in first", "only in second"
+    ]
+
+def test_duplicate_keys_matched_in_order():
+    first = make_data() + [copy.deepcopy(make_data()[1])]
+    second = copy.deepcopy(first)
+    second[-1]['exchanges'][0]['amount'] = 2.
+    result = compare_results(first, second)
+    assert result['summary']['matched datasets'] == 4
+    assert len(result['datasets']) == 1
+
+def test_load_results(monkeypatch):
+    tempdir = tempfile.mkdtemp()
+    monkeypatch.setattr(
+        'ocelot.filesystem.get_base_directory',
+        lambda : tempdir
+    )
+    monkeypatch.setattr(
+        'ocelot.model.extract_directory',
+        lambda obj, use_cache=True: obj
+    )
+    monkeypatch.setattr(
+        'ocelot.model.HTMLReport',
+        lambda *args, **kwargs: None
+    )
+    output_dir, data = system_model(make_data(), [lambda data: data[:2]],
+                                     save_strategy="0:0")
+    assert load_results(output_dir.report_id) == data
+    assert load_results(output_dir.directory) == data
+    assert load_results(output_dir.report_id + ":0") == data
+    with pytest.raises(OutputDirectoryError):
+        load_results(output_dir.report_id + ":1")
+    with pytest.raises(OutputDirectoryError):
+        load_results("nothing")
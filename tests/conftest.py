@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+@pytest.fixture(scope="function")
+def fake_report(monkeypatch, tmpdir):
+    """Run ``system_model`` on lists of datasets, writing all output to a temporary directory.
+
+    Returns the path of the temporary directory."""
+    tempdir = str(tmpdir)
+    monkeypatch.setenv("OCELOT_OUTPUT", tempdir)
+    monkeypatch.setattr(
+        'ocelot.filesystem.get_base_directory',
+        lambda : tempdir
+    )
+    monkeypatch.setattr(
+        'ocelot.model.extract_directory',
+        lambda obj, use_cache=True: obj
+    )
+    return tempdir
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from ocelot.dependencies import dependency_closure, DependencyGraph
+from ocelot.errors import NoMatchingDatasets
+from ocelot.model import system_model
+from ocelot.transformations.locations import link_consumers_to_markets
+import pytest
+
+
+def dataset(id_, name, product, type_="transforming activity", location="GLO",
+            inputs=(), byproducts=(), parent=None, filepath=None):
+    exchanges = [{'name': product, 'type': 'reference product', 'amount': 1.}]
+    exchanges.extend({'name': name, 'type': 'byproduct', 'amount': 1.}
+                     for name in byproducts)
+    for input_name, link in inputs:
+        exc = {'name': input_name, 'type': 'from technosphere', 'amount': 1.}
+        if link:
+            exc['activity link'] = link
+        exchanges.append(exc)
+    ds = {
+        'id': id_,
+        'name': name,
+        'type': type_,
+        'location': location,
+        'exchanges': exchanges,
+        'filepath': filepath or "/data/{}.spold".format(id_),
+    }
+    if parent:
+        ds['parent'] = parent
+    return ds
+
+DATA = [
+    dataset('steel', 'steel production', 'steel', inputs=[('coal', None)]),
+    dataset('steel-ch', 'steel production', 'steel', location='CH'),
+    dataset('scrap', 'scrap sorting', 'iron', byproducts=['steel']),
+    dataset('market-steel', 'market for steel', 'steel', 'market activity'),
+    dataset('group-steel', 'market group for steel', 'steel', 'market group'),
+    dataset('coal', 'coal mining', 'coal'),
+    dataset('market-coal', 'market for coal', 'coal', 'market activity'),
+    dataset('car', 'car production', 'car', inputs=[('steel', 'steel-ch')]),
+    dataset('electric car', 'car production, electric', 'car', parent='car'),
+    dataset('bike', 'bike production', 'bike', inputs=[('steel', None)]),
+]
+
+def ids(data):
+    return [ds['id'] for ds in data]
+
+def test_market_group_closure():
+    assert ids(dependency_closure(DATA, ['group-steel'])) == [
+        'steel', 'steel-ch', 'scrap', 'market-steel', 'group-steel', 'car'
+    ]
+
+def test_activity_links_both_directions():
+    assert ids(dependency_closure(DATA, 'car.spold')) == ['steel', 'steel-ch', 'car']
+    # Linked-to dataset loses production volume to the car
+    assert 'car' in ids(dependency_closure(DATA, 'steel-ch'))
+
+def test_parent():
+    assert ids(dependency_closure(DATA, 'electric car')) == [
+        'steel', 'steel-ch', 'car', 'electric car'
+    ]
+
+def test_markets_for_unlinked_inputs():
+    # Markets for the inputs of the selected datasets, and their suppliers
+    assert ids(dependency_closure(DATA, ['bike'])) == [
+        'steel', 'steel-ch', 'scrap', 'market-steel', 'group-steel', 'car', 'bike'
+    ]
+    assert ids(dependency_closure(DATA, ['coal'])) == ['coal', 'market-coal']
+
+def test_unlinked_inputs_followed_one_level():
+    # Coal is an input of steel, which is only a dependency of the bike
+    assert 'market-coal' not in ids(dependency_closure(DATA, ['bike']))
+    assert 'market-coal' in ids(dependency_closure(DATA, ['steel.spold']))
+
+def test_select():
+    graph = DependencyGraph(DATA)
+    assert graph.select('/data/bike.spold') == {9}
+    assert graph.select('bike.spold') == {9}
+    assert graph.select('bike') == {9}
+    assert graph.select('coal') == {5, 6}
+    assert graph.select('nothing') == set()
+
+def test_no_match():
+    with pytest.raises(NoMatchingDatasets):
+        dependency_closure(DATA, ['bike', 'nothing'])
+
+def test_system_model_subset(fake_report):
+    _, data = system_model(DATA, [lambda data: data], subset=['car.spold'])
+    assert ids(data) == ['steel', 'steel-ch', 'car']
+
+def linking_data():
+    data = [
+        dataset('steel-ch', 'steel production', 'steel', location='CH'),
+        dataset('steel-row', 'steel production', 'steel', location='RoW'),
+        dataset('market-steel-ch', 'market for steel', 'steel',
+                'market activity', location='CH'),
+        dataset('market-steel-row', 'market for steel', 'steel',
+                'market activity', location='RoW'),
+        dataset('bike-ch', 'bike production', 'bike', location='CH',
+                inputs=[('steel', None)]),
+        dataset('bike-row', 'bike production', 'bike', location='RoW',
+                inputs=[('steel', None)]),
+        dataset('car', 'car production', 'car', location='DE',
+                inputs=[('steel', None)]),
+    ]
+    for ds in data:
+        ds['code'] = ds['id']
+        ds['reference product'] = ds['exchanges'][0]['name']
+    return data
+
+def linked_inputs(data):
+    return {ds['id']: [exc.get('code') for exc in ds['exchanges']
+                       if exc['type'] == 'from technosphere']
+            for ds in data}
+
+def test_system_model_subset_links_as_full_run(fake_report):
+    config = [link_consumers_to_markets]
+    _, full = system_model(linking_data(), config)
+    _, subset = system_model(linking_data(), config, subset=['bike'])
+    assert 'market-steel-ch' in ids(subset)
+    expected = linked_inputs(full)
+    assert linked_inputs(subset) == {
+        key: expected[key] for key in ids(subset)
+    }
+    assert expected['bike-ch'] == ['market-steel-ch']
+    assert expected['bike-row'] == ['market-steel-row']
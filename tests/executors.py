@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from ocelot.executors import (
+    open_executor,
+    ProcessExecutor,
+    SerialExecutor,
+    ThreadExecutor,
+    use_executor,
+)
+from ocelot.model import system_model
+from ocelot.transformations.utils import single_input
+from ocelot.wrapper import TransformationWrapper
+import logging
+import pytest
+
+
+class Collector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.msg)
+
+
+@pytest.fixture
+def collector():
+    logger = logging.getLogger('ocelot')
+    handler, level = Collector(), logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+
+
+def split(ds):
+    logging.getLogger('ocelot').info({'type': 'table element', 'data': [ds['n']]})
+    return [{'n': ds['n']}, {'n': -ds['n']}]
+
+split.__table__ = {'title': 'Split datasets', 'columns': ["n"]}
+
+@single_input
+def double(ds):
+    return [{'n': ds['n'] * 2}]
+
+def is_even(ds):
+    return ds['n'] % 2 == 0
+
+def nested(ds):
+    return double([ds])
+
+DATA = [{'n': n} for n in range(1, 26)]
+EXPECTED = [{'n': s * n} for n in range(1, 26) for s in (1, -1)]
+
+
+@pytest.mark.parametrize("executor", [
+    SerialExecutor(),
+    ThreadExecutor(workers=3, chunksize=4),
+    ProcessExecutor(workers=3, chunksize=4),
+])
+def test_executor_preserves_order(executor):
+    try:
+        assert TransformationWrapper(split, executor=executor)(DATA) == EXPECTED
+    finally:
+        executor.close()
+
+def test_process_executor_merges_log_records(collector):
+    executor = ProcessExecutor(2, chunksize=3)
+    try:
+        TransformationWrapper(split, executor=executor)(DATA)
+    finally:
+        executor.close()
+    assert [msg['data'] for msg in collector.messages] == [
+        [n] for n in range(1, 26)
+    ]
+
+def test_filter_function_not_sent_to_workers():
+    executor = ProcessExecutor(2, chunksize=2)
+    wrapper = TransformationWrapper(split, lambda ds: ds['n'] % 2 == 0,
+                                    executor=executor)
+    try:
+        result = wrapper([{'n': n} for n in range(1, 9)])
+    finally:
+        executor.close()
+    assert result == [{'n': 1}, {'n': 2}, {'n': -2}, {'n': 3}, {'n': 4},
+                      {'n': -4}, {'n': 5}, {'n': 6}, {'n': -6}, {'n': 7},
+                      {'n': 8}, {'n': -8}]
+
+def test_single_input_uses_current_executor():
+    with use_executor(ProcessExecutor(2, chunksize=5)) as executor:
+        assert double(DATA) == [{'n': n * 2} for n in range(1, 26)]
+        assert executor.pool is not None
+        executor.close()
+
+def test_nested_wrappers_run_serially_in_workers():
+    with use_executor(ThreadExecutor(2, chunksize=5)):
+        assert TransformationWrapper(nested)(DATA) == double(DATA)
+
+def test_executor_strings():
+    with use_executor("thread") as executor:
+        assert isinstance(executor, ThreadExecutor)
+    with open_executor() as executor:
+        assert isinstance(executor, SerialExecutor)
+    with pytest.raises(ValueError):
+        with use_executor("gpu"):
+            pass
+
+def test_system_model_executor(fake_report):
+    config = [TransformationWrapper(split, is_even), double]
+    _, serial = system_model(DATA, config)
+    executor = ProcessExecutor(2, chunksize=4)
+    try:
+        _, parallel = system_model(DATA, config, executor=executor)
+    finally:
+        executor.close()
+    assert serial == parallel
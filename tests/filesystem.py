@@ -2,18 +2,26 @@
 from ocelot.filesystem import (
     cache_data,
     check_cache_directory,
+    fingerprint_file,
     get_base_directory,
     get_cache_directory,
+    get_cache_manifest,
     get_from_cache,
     get_output_directory,
+    stale_cache_files,
 )
+from ocelot.io import extract_directory
 import os
 import pytest
 import random
+import shutil
 import tempfile
 import time
 
 
+test_data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+
 def test_base_directory():
     assert get_base_directory()
 
@@ -57,18 +65,86 @@ def test_fake_output_dir_fixture(fake_output_dir):
     assert "Ocelot" not in get_cache_directory()
 
 def test_cache_loading(fake_output_dir):
-    random_data = {k: random.randint(0, 10) for k in "abcdefghijklmnop"}
+    random_data = {k: [{'name': k, 'amount': float(random.randint(0, 10))}]
+                   for k in "abcdefghijklmnop"}
     fp = os.path.abspath(__file__)
     cache_data(random_data, fp)
-    assert random_data == get_from_cache(fp)
+    assert random_data == dict(get_from_cache(fp))
 
 def test_cache_expiration(fake_output_dir):
-    new_file = os.path.join(fake_output_dir, "test.file")
+    new_file = os.path.join(fake_output_dir, "test.spold")
     with open(new_file, "w") as f:
         f.write("foo")
-    random_data = {k: random.randint(0, 10) for k in "abcdefghijklmnop"}
-    cache_data(random_data, fake_output_dir)
+    fingerprints, _, _ = stale_cache_files(fake_output_dir)
+    cache_data({}, fake_output_dir, fingerprints)
+    assert check_cache_directory(fake_output_dir)
     time.sleep(0.5)
     with open(new_file, "w") as f:
         f.write("bar")
     assert not check_cache_directory(fake_output_dir)
+
+def test_cache_without_manifest_not_fresh(fake_output_dir):
+    cache_data({}, fake_output_dir)
+    assert not check_cache_directory(fake_output_dir)
+
+def test_fingerprint_file_reuses_previous(fake_output_dir):
+    fp = os.path.join(fake_output_dir, "test.spold")
+    with open(fp, "w") as f:
+        f.write("foo")
+    fingerprint = fingerprint_file(fp)
+    previous = dict(fingerprint, hash="not read")
+    assert fingerprint_file(fp, previous) is previous
+    previous['size'] = 42
+    assert fingerprint_file(fp, previous) == fingerprint
+
+def test_stale_cache_files_touched_file_not_changed(fake_output_dir):
+    fp = os.path.join(fake_output_dir, "test.spold")
+    with open(fp, "w") as f:
+        f.write("foo")
+    fingerprints, changed, removed = stale_cache_files(fake_output_dir)
+    assert changed == ["test.spold"]
+    cache_data({}, fake_output_dir, fingerprints)
+    os.utime(fp, (time.time() + 10, time.time() + 10))
+    _, changed, removed = stale_cache_files(fake_output_dir)
+    assert changed == removed == []
+
+def test_cache_manifest_io_version(fake_output_dir, monkeypatch):
+    with open(os.path.join(fake_output_dir, "test.spold"), "w") as f:
+        f.write("foo")
+    fingerprints, _, _ = stale_cache_files(fake_output_dir)
+    cache_data({}, fake_output_dir, fingerprints)
+    assert get_cache_manifest(fake_output_dir)
+    monkeypatch.setattr('ocelot.filesystem.__io_version__', "foo")
+    assert get_cache_manifest(fake_output_dir) == {}
+
+@pytest.fixture
+def source_dir(fake_output_dir):
+    dirpath = os.path.join(fake_output_dir, "source")
+    os.mkdir(dirpath)
+    for filename in os.listdir(test_data_dir):
+        if filename.endswith(".spold"):
+            shutil.copy(os.path.join(test_data_dir, filename), dirpath)
+    return dirpath
+
+def test_incremental_extraction(source_dir, monkeypatch):
+    reference = extract_directory(source_dir, use_cache=False, use_mp=False)
+    assert extract_directory(source_dir, use_mp=False) == reference
+
+    extracted = []
+    def tracker(filelist, *args):
+        for fp in filelist:
+            extracted.append(os.path.basename(fp))
+            yield fp, [{'filepath': fp}]
+    monkeypatch.setattr('ocelot.io.extract_ecospold2_files', tracker)
+
+    assert extract_directory(source_dir, use_mp=False) == reference
+    assert not extracted
+
+    os.remove(os.path.join(source_dir, "corrugated-board.spold"))
+    with open(os.path.join(source_dir, "heat-cogeneration-glo.spold"), "a") as f:
+        f.write("\n")
+    data = extract_directory(source_dir, use_mp=False)
+    assert extracted == ["heat-cogeneration-glo.spold"]
+    assert len(data) == len(reference) - 1
+    assert not any("corrugated-board" in ds['filepath'] for ds in data)
+    assert {'filepath': os.path.join(source_dir, "heat-cogeneration-glo.spold")} in data
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from ocelot.follow import (
+    DatasetFollower,
+    list_followed,
+    read_follow_file,
+    reconstruct,
+)
+from ocelot.model import system_model
+from ocelot.wrapper import TransformationWrapper
+import copy
+import tempfile
+
+
+def make_data():
+    return [{'id': str(n), 'filepath': '/data/{}.spold'.format(n), 'amount': n}
+            for n in range(5)]
+
+def double_amount(data):
+    for ds in data:
+        ds['amount'] *= 2
+    return data
+
+def do_nothing(data):
+    return data
+
+def split(ds):
+    first, second = copy.deepcopy(ds), copy.deepcopy(ds)
+    first['code'], second['code'] = 'a', 'b'
+    return [first, second]
+
+def drop_b(data):
+    return [ds for ds in data if ds.get('code') != 'b']
+
+CONFIG = [double_amount, do_nothing, TransformationWrapper(split), drop_b]
+
+
+def test_only_changes_written():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data = make_data()
+        follower = DatasetFollower(tmpdir, "3.spold")
+        follower.start(data)
+        follower.snapshot(0, double_amount(data), "double_amount")
+        follower.snapshot(1, data, "do_nothing")
+        records = list(read_follow_file(list(follower.files.values())[0]))
+        assert [record['index'] for record in records] == [-1, 0]
+        assert records[1]['changes'] == {
+            '3#0': {'set': {'amount': 6}, 'delete': []}
+        }
+
+def test_identity_fast_path_skips_lookup(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data = make_data()
+        follower = DatasetFollower(tmpdir, "3.spold")
+        follower.start(data)
+        monkeypatch.setattr(follower, 'resolve', None)
+        follower.snapshot(0, data, "do_nothing")
+
+def test_system_model_follow(fake_report):
+    output_dir, data = system_model(make_data(), CONFIG, follow="2.spold")
+    followed = list_followed(output_dir.directory)
+    assert list(followed) == ['/data/2.spold']
+    filepath, indices = followed['/data/2.spold']
+    assert indices == [-1, 0, 2, 3]
+    assert reconstruct(filepath, -1) == {
+        '2#0': {'id': '2', 'filepath': '/data/2.spold', 'amount': 2}
+    }
+    assert reconstruct(filepath, 1) == {
+        '2#0': {'id': '2', 'filepath': '/data/2.spold', 'amount': 4}
+    }
+    after_split = reconstruct(filepath, 2)
+    assert sorted(ds['code'] for ds in after_split.values()) == ['a', 'b']
+    final = reconstruct(filepath)
+    assert list(final.values()) == [
+        {'id': '2', 'filepath': '/data/2.spold', 'amount': 4, 'code': 'a'}
+    ]
+    assert final == reconstruct(filepath, 3)
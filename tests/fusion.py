@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+from ocelot.collection import (
+    Collection,
+    fuse_functions,
+    fusion_allowed,
+    FusedPass,
+)
+from ocelot.executors import use_executor
+from ocelot.filesystem import list_checkpoints
+from ocelot.model import system_model
+from ocelot.report import read_json_log
+from ocelot.transformations.utils import single_input
+from ocelot.wrapper import TransformationWrapper
+import logging
+import os
+
+logger = logging.getLogger('ocelot')
+
+
+def split(ds):
+    logger.info({'type': 'table element', 'data': ['split', ds['n']]})
+    return [{'n': ds['n']}, {'n': ds['n'] + 100}]
+
+split.__table__ = {'title': 'Split datasets', 'columns': ["Step", "n"]}
+
+def is_odd(ds):
+    return ds['n'] % 2
+
+def drop_large(ds):
+    logger.info({'type': 'table element', 'data': ['drop', ds['n']]})
+    return [] if ds['n'] > 150 else [ds]
+
+drop_large.__table__ = {'title': 'Drop large datasets', 'columns': ["Step", "n"]}
+
+@single_input
+def negate(ds):
+    return [{'n': -ds['n']}]
+
+def reverse(data):
+    return data[::-1]
+
+DATA = [{'n': n} for n in range(1, 61)]
+CONFIG = [
+    TransformationWrapper(split, is_odd),
+    TransformationWrapper(drop_large),
+    negate,
+    reverse,
+    TransformationWrapper(split),
+]
+
+
+def apply_separately(data):
+    for func in CONFIG:
+        data = func(data)
+    return data
+
+def test_fuse_functions():
+    fused = fuse_functions(CONFIG)
+    assert len(fused) == 3
+    assert isinstance(fused[0], FusedPass)
+    assert list(fused[0]) == CONFIG[:3]
+    assert fused[1:] == CONFIG[3:]
+
+def test_fuse_functions_split_after():
+    fused = fuse_functions(CONFIG, lambda index: index == 0)
+    assert fused[0] is CONFIG[0]
+    assert list(fused[1]) == CONFIG[1:3]
+
+def test_fuse_functions_own_executor_not_fused():
+    wrapper = TransformationWrapper(split, executor="serial")
+    assert fuse_functions([wrapper, negate]) == [wrapper, negate]
+
+def test_fused_pass_same_result():
+    expected = apply_separately(DATA)
+    assert Collection("c", *CONFIG)(DATA) == expected
+    data, counts, durations, records = FusedPass(CONFIG[:3]).run(DATA)
+    assert data == negate(CONFIG[1](CONFIG[0](DATA)))
+    assert counts == [90, 85, 85]
+    assert all(duration >= 0 for duration in durations)
+
+def test_collection_fuses_only_if_allowed(monkeypatch):
+    passes = []
+    run = FusedPass.run
+    monkeypatch.setattr(FusedPass, 'run',
+                        lambda self, data: passes.append(self) or run(self, data))
+    collection = Collection("c", *CONFIG)
+    expected = apply_separately(DATA)
+    assert collection(DATA) == expected
+    assert len(passes) == 1
+    with fusion_allowed(False):
+        assert collection(DATA) == expected
+    with use_executor("thread", 2):
+        assert collection(DATA) == expected
+    assert len(passes) == 1
+
+def test_system_model_fused_log(fake_report):
+    output_dir, data = system_model(DATA, CONFIG)
+    _, expected = system_model(DATA, CONFIG, fuse=False)
+    assert data == expected
+    lines = []
+    for line in read_json_log(os.path.join(output_dir.directory,
+                                           "report.log.json")):
+        lines.append(line)
+        if line['type'] == 'report end':
+            break
+    functions = [(line['type'], line['index'], line['count']) for line in lines
+                 if line['type'].startswith('function')]
+    assert functions == [
+        ('function start', 0, 60), ('function end', 0, 90),
+        ('function start', 1, 90), ('function end', 1, 85),
+        ('function start', 2, 85), ('function end', 2, 85),
+        ('function start', 3, 85), ('function end', 3, 85),
+        ('function start', 4, 85), ('function end', 4, 170),
+    ]
+    # Table elements are logged between the start and end of their function
+    current = None
+    for line in lines:
+        if line['type'] == 'function start':
+            current = line['name']
+        elif line['type'] == 'table element':
+            assert current.startswith(line['data'][0])
+        assert line['time'] >= lines[0]['time']
+
+def test_system_model_fused_checkpoints(fake_report):
+    output_dir, data = system_model(DATA, CONFIG, save_strategy="0:4")
+    assert list_checkpoints(output_dir.directory) == [0, 1, 2, 3, 4]
+    assert data == apply_separately(DATA)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from ocelot.transformations.locations._topology import LazyTopology, Topology
+import json
+import subprocess
+import sys
+
+# Modules which take most of the time of a full import of Ocelot
+HEAVY_MODULES = (
+    'constructive_geometries',
+    'numpy',
+    'ocelot.model',
+    'ocelot.transformations',
+    'scipy',
+    'stats_arrays',
+    'toolz',
+)
+
+LIST_HEAVY_MODULES = """
+import json, sys
+print(json.dumps([name for name in {} if name in sys.modules]))
+""".format(HEAVY_MODULES)
+
+
+def imported_heavy_modules(code):
+    """Run ``code`` in a new interpreter, and return the heavy modules it imported"""
+    output = subprocess.run(
+        [sys.executable, "-c", code + LIST_HEAVY_MODULES],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def test_import_ocelot_is_lazy():
+    assert imported_heavy_modules("import ocelot") == []
+
+def test_cli_help_is_lazy():
+    code = "\n".join([
+        "import sys",
+        "sys.argv = ['ocelot-cli', '--help']",
+        "from ocelot.bin.ocelot_cli import main",
+        "try:",
+        "    main()",
+        "except SystemExit:",
+        "    pass",
+    ])
+    assert imported_heavy_modules(code) == []
+
+def test_public_names_imported_on_use():
+    code = "from ocelot import system_model, cutoff_config, toolz\n"
+    assert 'ocelot.model' in imported_heavy_modules(code)
+
+def test_unknown_name():
+    code = "\n".join([
+        "import ocelot",
+        "try:",
+        "    ocelot.nothing",
+        "except AttributeError:",
+        "    pass",
+        "else:",
+        "    raise AssertionError",
+    ])
+    assert imported_heavy_modules(code) == []
+
+def test_import_doesnt_create_topology():
+    code = "\n".join([
+        "import ocelot.transformations.locations as locations",
+        "assert type(locations.topology).__name__ == 'LazyTopology'",
+    ])
+    assert 'constructive_geometries' not in imported_heavy_modules(code)
+
+def test_lazy_topology_becomes_topology():
+    topology = LazyTopology()
+    assert not isinstance(topology, Topology)
+    assert topology.contains('RER', 'CH')
+    assert type(topology) is Topology
+    assert topology('CH') == Topology()('CH')
+
+def test_lazy_topology_call():
+    topology = LazyTopology()
+    assert topology('RoW') == set()
+    assert type(topology) is Topology
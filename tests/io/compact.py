@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from copy import deepcopy
+from ocelot.io.compact import intern_strings, share_strings
+import pickle
+import sys
+
+
+def kg():
+    # Build a new, equal string object each time
+    return "".join(["k", "g"])
+
+
+def test_share_strings_roundtrip():
+    data = [{
+        'name': 'foo',
+        'exchanges': [
+            {'unit': kg(), 'amount': 1.0, 'properties': []},
+            {'unit': kg(), 'amount': 2.0, 'properties': [{'a': None}]},
+        ],
+        'flag': True,
+    }, {}]
+    expected = pickle.loads(pickle.dumps(data))
+    assert share_strings(data) is data
+    assert data == expected
+
+def test_share_strings_identity():
+    data = [{'unit': kg()}, {'unit': kg(), 'list': [kg()]}]
+    assert data[0]['unit'] is not data[1]['unit']
+    share_strings(data)
+    assert data[0]['unit'] is data[1]['unit'] is data[1]['list'][0]
+
+def test_share_strings_survives_pickle():
+    data = pickle.loads(pickle.dumps(share_strings([{'unit': kg()}, {'unit': kg()}])))
+    assert data[0]['unit'] is data[1]['unit']
+
+def test_share_strings_across_calls():
+    strings = {}
+    first = share_strings({'unit': kg()}, strings)
+    second = share_strings({'unit': kg()}, strings)
+    assert first['unit'] is second['unit']
+
+def test_share_strings_smaller_pickle():
+    data = [{'unit': kg(), 'compartment': "".join(["a", "ir"])}
+            for _ in range(100)]
+    before = len(pickle.dumps(data))
+    assert len(pickle.dumps(share_strings(data))) < before
+
+def test_intern_strings_values_and_keys():
+    key = "".join(["un", "it"])
+    data = [{key: kg()}, {'list': [kg()]}]
+    intern_strings(data)
+    assert data[0]['unit'] is sys.intern("kg")
+    assert data[1]['list'][0] is sys.intern("kg")
+    assert next(iter(data[0])) is sys.intern("unit")
+
+def test_intern_strings_preserves_key_order():
+    data = {"".join(["z"]): 1, 'a': 2}
+    assert list(intern_strings(data)) == ['z', 'a']
+
+def test_intern_strings_shared_after_deepcopy():
+    data = intern_strings({'unit': kg()})
+    assert deepcopy(data)['unit'] is data['unit']
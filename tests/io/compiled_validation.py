@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from ocelot.io.compile_schema import compile_schema
+from ocelot.io.extract_ecospold2 import generic_extractor
+from ocelot.io.validate_internal import (
+    dataset_schema,
+    valid_lognormal,
+    valid_parameter,
+    validate_dataset,
+)
+from copy import deepcopy
+from voluptuous import Any, Invalid, Optional, Required, Schema
+import os
+import pytest
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def voluptuous_errors(schema, data):
+    try:
+        schema(data)
+    except Invalid as err:
+        return str(err)
+
+@pytest.fixture(scope="module")
+def datasets():
+    return [ds
+            for filename in sorted(os.listdir(test_data_dir))
+            for ds in generic_extractor(os.path.join(test_data_dir, filename))]
+
+def mutations(ds):
+    """Generate invalid (and some valid) variations of ``ds``"""
+    exc = next((exc for exc in ds['exchanges'] if 'uncertainty' in exc), None)
+    if exc is None:
+        return
+    index = ds['exchanges'].index(exc)
+
+    def mutated(func):
+        new = deepcopy(ds)
+        func(new, new['exchanges'][index])
+        return new
+
+    yield mutated(lambda ds, exc: ds.update(name=1))
+    yield mutated(lambda ds, exc: ds.update(parent=None))
+    yield mutated(lambda ds, exc: ds.update(type='foo'))
+    yield mutated(lambda ds, exc: ds.update(foo='bar'))
+    yield mutated(lambda ds, exc: ds.pop('location'))
+    yield mutated(lambda ds, exc: ds.update(suppliers=[]))
+    yield mutated(lambda ds, exc: ds.update(suppliers=()))
+    yield mutated(lambda ds, exc: ds.update(exchanges={}))
+    yield mutated(lambda ds, exc: ds['exchanges'].append(1))
+    yield mutated(lambda ds, exc: exc.update(amount=1))
+    yield mutated(lambda ds, exc: exc.update(amount=True))
+    yield mutated(lambda ds, exc: exc.update(tag='parameter'))
+    yield mutated(lambda ds, exc: exc.update(properties={}))
+    yield mutated(lambda ds, exc: exc.update(formula=None))
+    yield mutated(lambda ds, exc: exc.pop('unit'))
+    yield mutated(lambda ds, exc: exc['uncertainty'].update(type='normal'))
+    yield mutated(lambda ds, exc: exc['uncertainty'].update(mean='1'))
+    yield mutated(lambda ds, exc: exc['uncertainty'].pop('pedigree matrix'))
+    yield mutated(lambda ds, exc: exc['uncertainty'].update({'pedigree matrix': {}}))
+    yield mutated(lambda ds, exc: exc['uncertainty']['pedigree matrix'].popitem())
+    yield mutated(lambda ds, exc: exc['uncertainty']['pedigree matrix'].update(foo=1))
+    yield mutated(lambda ds, exc: exc['uncertainty']['pedigree matrix'].update(
+        reliability=1.))
+    yield mutated(lambda ds, exc: exc['uncertainty'].update(bar=2.))
+    if exc.get('properties'):
+        yield mutated(lambda ds, exc: exc['properties'][0].update(amount='1'))
+        yield mutated(lambda ds, exc: exc['properties'][0].pop('unit'))
+    if ds['parameters']:
+        # Parameter schema doesn't require keys
+        yield mutated(lambda ds, exc: ds['parameters'][0].pop('unit'))
+        yield mutated(lambda ds, exc: ds['parameters'][0].update(unit=1))
+
+def test_valid_datasets(datasets):
+    for ds in datasets:
+        assert validate_dataset.is_valid(ds)
+        assert validate_dataset(ds) is ds
+
+def test_same_verdicts_and_errors_as_voluptuous(datasets):
+    checked = 0
+    for ds in datasets:
+        for new in mutations(ds):
+            expected = voluptuous_errors(dataset_schema, new)
+            assert validate_dataset.is_valid(new) == (expected is None)
+            assert voluptuous_errors(validate_dataset, new) == expected
+            checked += 1
+    assert checked > 50
+
+def test_subschemas():
+    given = {'mean': 1., 'pedigree matrix': {}, 'type': 'lognormal',
+             'variance with pedigree uncertainty': 1.}
+    assert compile_schema(valid_lognormal).is_valid(given)
+    assert not compile_schema(valid_lognormal).is_valid(dict(given, mu=1))
+    assert compile_schema(valid_parameter).is_valid({})
+    assert not compile_schema(valid_parameter).is_valid([])
+
+def test_compiled_once():
+    assert compile_schema(dataset_schema) is validate_dataset
+
+def test_required_optional_and_literals():
+    schema = Schema({
+        Required('a'): Any(None, 'x', int),
+        Optional('b'): [str],
+        'c': [],
+    })
+    validate = compile_schema(schema)
+    for given in ({'a': None}, {'a': 'x', 'b': ['y']}, {'a': 1, 'c': []},
+                  {'a': 'y'}, {'b': []}, {'a': 1, 'c': [1]}, {'a': 1, 'd': 1},
+                  {'a': 1, 'b': 'y'}, {'a': 1, 'b': [1]}):
+        expected = voluptuous_errors(schema, given)
+        assert validate.is_valid(given) == (expected is None)
+        assert voluptuous_errors(validate, given) == expected
+
+def test_callables_are_called():
+    schema = Schema({'a': lambda x: int(x)})
+    validate = compile_schema(schema)
+    assert validate.is_valid({'a': '1'})
+    assert not validate.is_valid({'a': 'foo'})
+
+def test_unsupported_schema():
+    with pytest.raises(NotImplementedError):
+        compile_schema(Schema({Optional('a', default=1): int}))
+    with pytest.raises(NotImplementedError):
+        compile_schema(Schema({str: int}))
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
-from ocelot.io.extract_ecospold2 import generic_extractor
+from ocelot.io.extract_ecospold2 import (
+    extract_chunk,
+    extract_ecospold2_directory,
+    extract_ecospold2_files,
+    generic_extractor,
+)
+from ocelot.io.extract_ecospold2_stream import stream_extractor
 from ocelot.io.validate_internal import dataset_schema
 import os
+import pickle
+import pytest
+import sys
 
 
 test_data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
@@ -284,3 +293,78 @@ def test_multioutput_extraction():
 
 def test_multioutput_validation():
     assert dataset_schema(MULTIOUTPUT_REFERENCE[0])
+
+
+# Streaming extraction engine
+
+
+@pytest.mark.parametrize("filename", sorted(os.listdir(test_data_dir)))
+def test_stream_extractor_equivalent(filename):
+    fp = os.path.join(test_data_dir, filename)
+    assert stream_extractor(fp) == generic_extractor(fp)
+
+def test_stream_extractor_basic():
+    fp = os.path.join(test_data_dir, "basic.xml")
+    BASIC_REFERENCE[0]['filepath'] = fp
+    assert stream_extractor(fp) == BASIC_REFERENCE
+
+def test_extract_directory_stream_engine():
+    objectify = extract_ecospold2_directory(test_data_dir, use_mp=False)
+    stream = extract_ecospold2_directory(test_data_dir, use_mp=False,
+                                         engine="stream")
+    assert stream == objectify
+
+def test_extract_directory_unknown_engine():
+    with pytest.raises(ValueError):
+        extract_ecospold2_directory(test_data_dir, engine="foo")
+
+
+# Chunked multiprocessing extraction
+
+
+def test_extract_chunk():
+    fp = os.path.join(test_data_dir, "basic.xml")
+    assert extract_chunk(("stream", [fp, fp])) == [
+        (fp, generic_extractor(fp)),
+        (fp, generic_extractor(fp)),
+    ]
+
+def test_extract_chunk_is_compact():
+    filelist = sorted(os.path.join(test_data_dir, fn)
+                      for fn in os.listdir(test_data_dir))
+    plain = [(fp, generic_extractor(fp)) for fp in filelist]
+    chunk = extract_chunk(("objectify", filelist))
+    assert chunk == plain
+    assert len(pickle.dumps(chunk)) < len(pickle.dumps(plain))
+
+def test_extract_files_yields_pairs():
+    filelist = [os.path.join(test_data_dir, fn)
+                for fn in ("basic.xml", "prod_volume.xml")]
+    result = list(extract_ecospold2_files(filelist, use_mp=False))
+    assert [fp for fp, _ in result] == filelist
+    assert result[1][1] == generic_extractor(filelist[1])
+
+def test_extract_files_chunked_mp():
+    filelist = sorted(os.path.join(test_data_dir, fn)
+                      for fn in os.listdir(test_data_dir))
+    result = extract_ecospold2_files(filelist, processes=2, chunksize=2)
+    assert sorted(result) == sorted(
+        extract_ecospold2_files(filelist, use_mp=False))
+
+def test_extract_directory_sorted_by_filepath():
+    serial = extract_ecospold2_directory(test_data_dir, use_mp=False)
+    assert [ds['filepath'] for ds in serial] == sorted(
+        ds['filepath'] for ds in serial)
+    assert extract_ecospold2_directory(test_data_dir, processes=2,
+                                       chunksize=1) == serial
+
+def test_extract_files_interns_strings():
+    filelist = [os.path.join(test_data_dir, "corrugated-board.spold")]
+    (_, datasets), = extract_ecospold2_files(filelist, use_mp=False)
+    units = [exc['unit'] for exc in datasets[0]['exchanges'] if exc['unit'] == 'kg']
+    assert len(units) > 1
+    assert all(unit is sys.intern('kg') for unit in units)
+
+def test_extract_files_invalid_chunksize():
+    with pytest.raises(ValueError):
+        list(extract_ecospold2_files([], chunksize=0))
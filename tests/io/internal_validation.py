@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from ocelot.io.extract_ecospold2 import generic_extractor
+from ocelot.io.validate_ecospold2 import (
+    dataset_fingerprint,
+    load_validation_cache,
+    schema_fingerprint,
+    validate_datasets,
+    validate_directory,
+    validation_errors,
+)
+from copy import deepcopy
+from voluptuous import Invalid
+import json
+import os
+import pytest
+import shutil
+import tempfile
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+@pytest.fixture
+def source_dir(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setattr(
+            'ocelot.filesystem.get_base_directory',
+            lambda: os.path.abspath(tmpdir)
+        )
+        dirpath = os.path.join(tmpdir, "source")
+        os.mkdir(dirpath)
+        for filename in os.listdir(test_data_dir):
+            if filename.endswith(".spold"):
+                shutil.copy(os.path.join(test_data_dir, filename), dirpath)
+        yield dirpath
+
+@pytest.fixture
+def basic():
+    return generic_extractor(os.path.join(test_data_dir, "basic.xml"))[0]
+
+def test_validation_errors_valid(basic):
+    assert validation_errors(basic) == []
+
+def test_validation_errors_reports_all_errors(basic):
+    basic['name'] = 1
+    basic['exchanges'][0]['amount'] = 'foo'
+    errors = validation_errors(basic)
+    assert {'path': ['name'], 'message': 'expected str'} in errors
+    assert ['exchanges', 0, 'amount'] in [error['path'] for error in errors]
+    assert len(errors) > 1
+
+def test_dataset_fingerprint_ignores_key_order(basic):
+    reordered = dict(reversed(list(deepcopy(basic).items())))
+    assert dataset_fingerprint(reordered) == dataset_fingerprint(basic)
+    reordered['name'] = 'something else'
+    assert dataset_fingerprint(reordered) != dataset_fingerprint(basic)
+
+def test_validate_datasets_parallel_same_as_sequential(basic):
+    broken = deepcopy(basic)
+    broken['location'] = None
+    given = [basic, broken] * 3
+    sequential = list(validate_datasets(given, jobs=1))
+    parallel = list(validate_datasets(given, jobs=2, chunksize=1))
+    assert [x[1:] for x in sequential] == [x[1:] for x in parallel]
+    assert [bool(x[2]) for x in parallel] == [False, True] * 3
+
+def test_validate_datasets_skips_cached_verdicts(basic, monkeypatch):
+    verdicts = {dataset_fingerprint(basic): [{'path': [], 'message': 'cached'}]}
+    monkeypatch.setattr(
+        'ocelot.io.validate_ecospold2.validation_errors',
+        lambda ds: pytest.fail("Validated again")
+    )
+    result = list(validate_datasets([basic], jobs=1, verdicts=verdicts))
+    assert result[0][2] == [{'path': [], 'message': 'cached'}]
+
+def test_validate_datasets_invalid_jobs():
+    with pytest.raises(ValueError):
+        list(validate_datasets([], jobs=0))
+
+def test_validate_directory(source_dir, monkeypatch):
+    logfile = os.path.join(source_dir, "..", "errors.jsonl")
+    assert validate_directory(source_dir, jobs=2, logfile=logfile) == []
+    assert not os.path.exists(logfile)
+    assert load_validation_cache(source_dir)
+
+    validated = []
+    monkeypatch.setattr(
+        'ocelot.io.validate_ecospold2.validation_errors',
+        lambda ds: validated.append(ds) or []
+    )
+    assert validate_directory(source_dir, jobs=1, logfile=logfile) == []
+    assert not validated
+
+def test_validate_directory_error_log(source_dir, monkeypatch):
+    def fail(ds):
+        raise Invalid("something wrong", path=['exchanges', 0])
+
+    monkeypatch.setattr('ocelot.io.validate_ecospold2.validate_dataset', fail)
+    logfile = os.path.join(source_dir, "..", "errors.jsonl")
+    errors = validate_directory(source_dir, jobs=1, logfile=logfile)
+    assert len(errors) == 4
+    with open(logfile, encoding='utf-8') as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == errors
+    assert lines[0]['path'] == ['exchanges', 0]
+    assert lines[0]['message'] == "something wrong"
+    assert lines[0]['filepath'].endswith(".spold")
+    assert set(lines[0]) == {'filepath', 'id', 'name', 'location',
+                             'path', 'message'}
+
+def test_validation_cache_schema_change(source_dir, monkeypatch):
+    validate_directory(source_dir, jobs=1, logfile=os.devnull)
+    assert load_validation_cache(source_dir)
+    monkeypatch.setattr(
+        'ocelot.io.validate_ecospold2.schema_fingerprint', lambda: "foo")
+    assert load_validation_cache(source_dir) == {}
+
+@pytest.mark.parametrize("module", ["compile_schema", "ecospold2_meta"])
+def test_schema_fingerprint_includes_dependencies(module, monkeypatch):
+    fingerprint = schema_fingerprint()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, module + ".py")
+        with open(filepath, "w") as f:
+            f.write("# Changed module\n")
+        monkeypatch.setattr('ocelot.io.{}.__file__'.format(module), filepath)
+        assert schema_fingerprint() != fingerprint
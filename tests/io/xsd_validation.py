@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from ocelot.data import data_dir
+from ocelot.io.validate_ecospold2 import (
+    load_xsd_schema,
+    validate_directory_against_xsd,
+    validate_file_against_xsd,
+    validate_files_against_xsd,
+)
+import os
+import pytest
+import shutil
+import tempfile
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+schema = os.path.join(data_dir, "EcoSpold02.xsd")
+
+
+@pytest.fixture
+def spold_dir():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filename in ("basic.xml", "treatment-aluminium.spold",
+                         "treatment-waste-graphical-paper.spold"):
+            shutil.copy(
+                os.path.join(test_data_dir, filename),
+                os.path.join(tmpdir, filename.replace(".xml", ".spold"))
+            )
+        with open(os.path.join(tmpdir, "broken.spold"), "w") as f:
+            f.write("<?xml version='1.0'?>\n<foo>\n</bar>")
+        yield tmpdir
+
+def test_validate_file_valid():
+    fp = os.path.join(test_data_dir, "treatment-aluminium.spold")
+    assert validate_file_against_xsd(fp, load_xsd_schema(schema)) == (fp, [])
+
+def test_validate_file_errors_have_line_and_message():
+    fp = os.path.join(test_data_dir, "treatment-waste-graphical-paper.spold")
+    _, errors = validate_file_against_xsd(fp, load_xsd_schema(schema))
+    assert len(errors) == 1
+    assert errors[0]['line'] == 126
+    assert "administrativeInformation" in errors[0]['message']
+
+def test_validate_file_syntax_error(spold_dir):
+    fp = os.path.join(spold_dir, "broken.spold")
+    _, errors = validate_file_against_xsd(fp, load_xsd_schema(schema))
+    assert len(errors) == 1
+    assert errors[0]['line'] == 3
+
+def test_validate_files_parallel_same_as_sequential(spold_dir):
+    filelist = sorted(os.path.join(spold_dir, fn) for fn in os.listdir(spold_dir))
+    sequential = list(validate_files_against_xsd(filelist, schema, jobs=1))
+    assert [fp for fp, _ in sequential] == filelist
+    parallel = list(validate_files_against_xsd(filelist, schema, jobs=2))
+    assert sorted(parallel) == sorted(sequential)
+
+def test_validate_files_invalid_jobs():
+    with pytest.raises(ValueError):
+        list(validate_files_against_xsd([], schema, jobs=0))
+
+def test_validate_directory_against_xsd(spold_dir, capsys):
+    errors = validate_directory_against_xsd(spold_dir, schema, jobs=2)
+    assert sorted(errors) == ["broken.spold",
+                              "treatment-waste-graphical-paper.spold"]
+    output = capsys.readouterr().out
+    assert "treatment-waste-graphical-paper.spold:126: " in output
+    assert "2 of 4 files did not validate" in output
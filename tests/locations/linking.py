@@ -7,6 +7,7 @@ from ocelot.transformations.locations.linking import (add_reference_product_code
     link_consumers_to_recycled_content_activities,
     link_consumers_to_markets,
     log_and_delete_unlinked_exchanges,
+    SupplierIndex,
 )
 import pytest
 from copy import deepcopy
@@ -715,3 +716,50 @@ def test_link_consumers_to_recycled_content_activities_wrong_name():
     result = link_consumers_to_recycled_content_activities(given)
     assert result[1]['reference product'] == 'crackers'
     assert 'code' not in result[1]['exchanges'][0]
+
+
+def supplier_index_data():
+    market = lambda location, code: {
+        'type': 'market activity',
+        'reference product': 'cheese',
+        'name': 'market for cheese',
+        'location': location,
+        'code': code,
+        'exchanges': [],
+    }
+    consumer = lambda location, name='crackers': {
+        'type': 'transforming activity',
+        'reference product': 'crackers',
+        'name': name,
+        'location': location,
+        'exchanges': [],
+    }
+    return [market('US', 'a'), market('CA', 'b'), market('RoW', 'c'),
+            consumer('NAFTA'), consumer('DE'), consumer('RoW'), consumer('CH'),
+            consumer('RoW', 'pretzels'), consumer('US', 'pretzels')]
+
+def test_supplier_index_suppliers():
+    data = supplier_index_data()
+    index = SupplierIndex(data)
+    assert 'cheese' in index
+    assert 'milk' not in index
+    codes = lambda ds: [x['code'] for x in index.suppliers('cheese', ds)]
+    assert sorted(codes(data[3])) == ['a', 'b']
+    assert codes(data[4]) == ['c']
+    # Consumer RoW (crackers is only in NAFTA and DE) contains supplier RoW
+    assert codes(data[5]) == ['c']
+    # Consumer RoW is everything but the US; contains CA and supplier RoW
+    assert sorted(codes(data[7])) == ['b', 'c']
+
+def test_supplier_index_cache(monkeypatch):
+    data = supplier_index_data()
+    index = SupplierIndex(data)
+    searches = []
+    search = index.search
+    monkeypatch.setattr(index, 'search',
+                        lambda *args: searches.append(args[:2]) or search(*args))
+    for ds in data[3:] + data[3:]:
+        index.suppliers('cheese', ds)
+    assert len(searches) == 6
+    assert len(index.products) == 1
+    assert len(index.consumer_rows) == 2
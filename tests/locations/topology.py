@@ -1,8 +1,21 @@
 # -*- coding: utf-8 -*-
 from collections import defaultdict
 from ocelot.transformations.locations import topology
-from ocelot.transformations.locations._topology import Topology
+from ocelot.transformations.locations._topology import (
+    compute_index,
+    index_key,
+    LazyTopology,
+    load_index,
+    _pack_bits,
+    _unpack_bits,
+    read_index,
+    Topology,
+    write_index,
+)
+import numpy as np
+import os
 import pytest
+import tempfile
 
 
 SWISS_FACE = list(topology('CH'))[0]
@@ -234,3 +247,87 @@ def test_topology_ordered_dependencies_different_size_proxy():
 
 def test_topology_subtract():
     assert topology.contained('RER', subtract=('Europe without Switzerland',)) == {'CH'}
+
+def test_topology_bitsets_match_face_sets():
+    for location in ('CH', 'RER', 'GLO', 'IAI Area 8'):
+        row = topology.bits[topology.index[location]]
+        assert topology._decode(row) == topology(location)
+    contained = {key for key, value in topology.data.items()
+                 if value.issubset(topology('RER'))}
+    assert topology.contained('RER') == contained
+    assert topology.resolve_row([]) == topology('GLO')
+
+def test_topology_index_round_trip():
+    header, arrays = compute_index(Topology.compatibility)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "topology.index")
+        write_index(filepath, header, arrays)
+        read_header, read_arrays = read_index(filepath)
+        assert read_header == header
+        for name, array in arrays.items():
+            assert isinstance(read_arrays[name], np.memmap)
+            assert np.array_equal(read_arrays[name], array)
+    assert header['aliases']['IAI Area 8'] == 'IAI Area, Gulf Cooperation Council'
+
+def test_topology_index_rebuilt_if_invalid(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        monkeypatch.setattr(
+            'ocelot.transformations.locations._topology.get_cache_directory',
+            lambda: tmpdir
+        )
+        filepath = os.path.join(
+            tmpdir, "topology.{}.index".format(index_key(Topology.compatibility)))
+        with open(filepath, "wb") as f:
+            f.write(b"not an index")
+        header, _ = load_index(Topology.compatibility)
+        assert header['locations'] == topology.locations
+        assert read_index(filepath)[0] == header
+        t = Topology()
+        assert t.contained('RU') == topology.contained('RU')
+        assert t('CH') == topology('CH')
+
+def test_topology_face_areas():
+    areas = dict(zip(topology.faces.tolist(), topology.face_areas))
+    # Switzerland has 41285 km2
+    assert abs(sum(areas[face] for face in topology('CH')) - 41285) < 400
+    assert 1.4e8 < sum(topology.face_areas) < 1.5e8
+
+def test_topology_ordered_dependencies_area():
+    given = [{'location': location}
+             for location in ('GLO', 'CA', 'RU', 'RER', 'CH', 'RoW')]
+    assert topology.ordered_dependencies(given) == [
+        'GLO', 'RER', 'CA', 'RU', 'CH', 'RoW']
+    t = Topology("area")
+    assert t.ordered_dependencies(given) == ['GLO', 'RU', 'CA', 'RER', 'CH', 'RoW']
+    resolved = t.resolve_row(['RU', 'CA'])
+    assert t.ordered_dependencies(given, resolved) == [
+        'GLO', 'RoW', 'RU', 'CA', 'RER', 'CH']
+
+def test_topology_size_proxy_weights():
+    t = Topology({SWISS_FACE: 1e6})
+    given = [{'location': 'GLO'}, {'location': 'CA'}, {'location': 'CH'}]
+    assert t.ordered_dependencies(given) == ['GLO', 'CH', 'CA']
+    t.size_proxy = np.where(t.faces == SWISS_FACE, 0., 1.)
+    assert t.ordered_dependencies(given) == ['GLO', 'CA', 'CH']
+    t.size_proxy = None
+    assert t.size_proxy == "faces"
+    assert t.location_sizes()[t.index['CH']] == len(topology('CH'))
+    with pytest.raises(ValueError):
+        t.size_proxy = "population"
+    with pytest.raises(ValueError):
+        t.size_proxy = [1, 2]
+        t.face_weights()
+
+def test_lazy_topology_set_size_proxy():
+    t = LazyTopology()
+    t.size_proxy = "area"
+    assert type(t) is Topology
+    assert t.size_proxy == "area"
+
+def test_pack_bits_least_significant_first():
+    mask = np.zeros(16, dtype=bool)
+    mask[[0, 3, 9]] = True
+    assert _pack_bits(mask).tolist() == [0b1001, 0b10]
+    assert _unpack_bits(_pack_bits(mask)).astype(bool).tolist() == mask.tolist()
+    rows = np.array([[1, 128], [0, 2]], dtype=np.uint8)
+    assert np.nonzero(_unpack_bits(rows))[1].tolist() == [0, 15, 9]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Measure memory used by extracted datasets, with and without string interning.
+
+Usage: python memory_benchmark.py <dirpath>
+
+Run this against a full ecoinvent release. Not part of the CI tests."""
+from ocelot.io.extract_ecospold2 import EXTRACTION_ENGINES
+from ocelot.filesystem import list_source_files
+from ocelot.io.compact import intern_strings
+from copy import deepcopy
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+
+def measure(dirpath, intern):
+    filelist = [os.path.join(dirpath, fn) for fn in list_source_files(dirpath)]
+    extractor = EXTRACTION_ENGINES['stream']
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    data = []
+    for fp in filelist:
+        datasets = extractor(fp)
+        data.extend(intern_strings(datasets) if intern else datasets)
+    extracted = tracemalloc.get_traced_memory()[0]
+    # Per-dataset deepcopy, as in ``choose_reference_product_exchange``
+    copies = [deepcopy(ds) for ds in data]
+    copied = tracemalloc.get_traced_memory()[0]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    elapsed = time.time() - start
+    del data, copies
+    return extracted, copied - extracted, peak, elapsed
+
+
+def run_memory_benchmark(dirpath):
+    template = ("{:<12} extracted: {:>8.1f} MB; deepcopy: {:>8.1f} MB; "
+                "peak: {:>8.1f} MB; {:.1f} seconds")
+    for label, intern in (("plain", False), ("interned", True)):
+        extracted, copied, peak, elapsed = measure(dirpath, intern)
+        print(template.format(label, extracted / 1e6, copied / 1e6,
+                              peak / 1e6, elapsed))
+
+
+if __name__ == "__main__":
+    run_memory_benchmark(sys.argv[1])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from ocelot.model import system_model
+from ocelot.profiling import TransformationProfiler
+import os
+import pstats
+import tempfile
+import tracemalloc
+
+
+def allocate(data):
+    junk = [list(range(100)) for _ in range(1000)]
+    return data + [len(junk)]
+
+def add_one(data):
+    return data + [1]
+
+def test_profiler_measurements():
+    result, profile = TransformationProfiler()(allocate, [], 0, "allocate")
+    assert result == [1000]
+    assert profile['wall time'] >= profile['cpu time'] * 0.5 >= 0
+    assert profile['peak rss delta'] >= 0
+    assert profile['peak traced memory'] > 100000
+    assert profile['traced memory delta'] <= profile['peak traced memory']
+    assert 'allocated blocks' not in profile
+    assert 'pstats' not in profile
+
+def test_profiler_count_blocks():
+    keep = lambda data: data + [[list(range(10)) for _ in range(1000)]]
+    _, profile = TransformationProfiler(count_blocks=True)(keep, [], 0, "keep")
+    assert profile['allocated blocks'] > 1000
+
+def test_profiler_without_reset_peak(monkeypatch):
+    monkeypatch.delattr('tracemalloc.reset_peak', raising=False)
+    _, profile = TransformationProfiler()(allocate, [], 0, "allocate")
+    assert profile['peak traced memory'] > 100000
+    tracemalloc.start()
+    try:
+        _, profile = TransformationProfiler()(allocate, [], 0, "allocate")
+    finally:
+        tracemalloc.stop()
+    assert 'peak traced memory' not in profile
+    assert 'traced memory delta' in profile
+
+def test_profiler_without_tracemalloc():
+    _, profile = TransformationProfiler(trace_allocations=False)(
+        allocate, [], 0, "allocate")
+    assert 'peak traced memory' not in profile
+    assert 'traced memory delta' not in profile
+
+def test_profiler_cprofile():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        profiler = TransformationProfiler(tmpdir, cprofile=True)
+        _, profile = profiler(allocate, [], 3, "allocate")
+        filepath = os.path.join(tmpdir, profile['pstats'])
+        assert os.path.basename(filepath).startswith("3.allocate")
+        stats = pstats.Stats(filepath)
+        assert any(name == 'allocate' for _, _, name in stats.stats)
+
+def test_system_model_profile(fake_report):
+    output_dir, data = system_model([], [allocate, add_one], profile=True)
+    assert data == [1000, 1]
+    with open(os.path.join(output_dir.directory, "report.html"),
+              encoding='utf-8') as f:
+        report = f.read()
+    assert "<h1>Profile</h1>" in report
+    assert 'class="flame-block"' in report
+    assert "Peak RSS increase" in report
+
+def test_system_model_cprofile(fake_report):
+    output_dir, _ = system_model([], [add_one], profile="cprofile")
+    assert os.listdir(os.path.join(output_dir.directory, "profiles"))
+
+def test_system_model_without_profile(fake_report):
+    output_dir, _ = system_model([], [add_one])
+    with open(os.path.join(output_dir.directory, "report.html"),
+              encoding='utf-8') as f:
+        assert "<h1>Profile</h1>" not in f.read()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from ocelot.columnar import ColumnarCache, write_columnar_cache
+from ocelot.io.extract_ecospold2 import (
+    extract_ecospold2_directory,
+    generic_extractor,
+)
+from ocelot.records import (
+    Dataset,
+    Exchange,
+    ProductionVolume,
+    Uncertainty,
+    dataset_record,
+)
+from ocelot.transformations.utils import (
+    activity_hash,
+    choose_reference_product_exchange,
+    get_single_reference_product,
+    iterate_all_uncertainties,
+    label_reference_product,
+    normalize_reference_production_amount,
+)
+from copy import deepcopy
+import os
+import pickle
+import pytest
+import sys
+import tempfile
+
+
+test_data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def datasets():
+    return [ds
+            for filename in sorted(os.listdir(test_data_dir))
+            for ds in generic_extractor(os.path.join(test_data_dir, filename))]
+
+def test_mapping_interface():
+    exc = Exchange({'name': 'foo', 'amount': 1})
+    assert exc['name'] == 'foo'
+    assert 'amount' in exc
+    assert 'formula' not in exc
+    assert exc.get('formula') is None
+    assert exc.get('formula', 2) == 2
+    assert len(exc) == 2
+    assert list(exc) == ['name', 'amount']
+    with pytest.raises(KeyError):
+        exc['formula']
+    exc['formula'] = 'a * 2'
+    del exc['amount']
+    assert dict(exc) == {'name': 'foo', 'formula': 'a * 2'}
+    with pytest.raises(KeyError):
+        del exc['amount']
+    assert exc.pop('formula') == 'a * 2'
+    exc.update(unit='kg')
+    assert exc.setdefault('unit', 'm') == 'kg'
+    assert dict(exc) == {'name': 'foo', 'unit': 'kg'}
+
+def test_extra_keys():
+    exc = Exchange({'name': 'foo', 'something else': [1]})
+    assert exc['something else'] == [1]
+    assert list(exc) == ['name', 'something else']
+    del exc['something else']
+    assert 'something else' not in exc
+    with pytest.raises(KeyError):
+        del exc['something else']
+    with pytest.raises(AttributeError):
+        exc.unknown = 1
+
+def test_iteration_follows_field_order():
+    exc = Exchange([('amount', 1), ('other', None), ('name', 'foo')])
+    assert list(exc) == ['name', 'amount', 'other']
+    assert exc == {'amount': 1, 'other': None, 'name': 'foo'}
+
+def test_subclass_slot_table():
+    class Small(Exchange):
+        fields = ('name',)
+        __slots__ = ()
+
+    assert Small._slot_for == {'name': '_name'}
+    assert Small._slots_in_order == (('name', '_name'),)
+    assert [key for key, _ in Exchange._slots_in_order] == list(Exchange.fields)
+    assert Exchange._slot_for['amount'] == '_amount'
+
+def test_equality_with_dicts():
+    given = {'name': 'foo', 'amount': 1, 'other': None}
+    assert Exchange(given) == given
+    assert given == Exchange(given)
+    assert Exchange(given) != dict(given, amount=2)
+    assert Exchange(given) != ProductionVolume(amount=1)
+    assert [Exchange(given)] == [given]
+
+def test_copy_pickle_and_deepcopy():
+    exc = Exchange({
+        'name': 'foo',
+        'production volume': ProductionVolume(amount=1),
+        'other': 'bar',
+    })
+    for other in (exc.copy(), deepcopy(exc), pickle.loads(pickle.dumps(exc))):
+        assert other == exc
+        assert type(other) is Exchange
+        assert type(other['production volume']) is ProductionVolume
+    copied = deepcopy(exc)
+    copied['production volume']['amount'] = 2
+    assert exc['production volume']['amount'] == 1
+    assert exc.copy()['production volume'] is exc['production volume']
+
+def test_dataset_record_conversion(datasets):
+    for ds in datasets:
+        record = dataset_record(deepcopy(ds))
+        assert record == ds
+        assert type(record) is Dataset
+        for exc in record['exchanges']:
+            assert type(exc) is Exchange
+            if 'production volume' in exc:
+                assert type(exc['production volume']) is ProductionVolume
+            if 'uncertainty' in exc:
+                assert type(exc['uncertainty']) is Uncertainty
+
+def test_records_are_smaller(datasets):
+    exc = datasets[0]['exchanges'][0]
+    assert sys.getsizeof(Exchange(exc)) < sys.getsizeof(exc)
+
+def test_transformations_work_on_records(datasets):
+    datasets = [ds for ds in datasets
+                if sum(1 for exc in ds['exchanges']
+                       if exc['type'] == 'reference product') == 1]
+    assert datasets
+    given = deepcopy(datasets)
+    records = [dataset_record(ds) for ds in deepcopy(datasets)]
+    expected = label_reference_product(given)
+    result = label_reference_product(records)
+    assert result == expected
+    assert [activity_hash(ds) for ds in result] == [
+        activity_hash(ds) for ds in expected]
+    assert [list(iterate_all_uncertainties(ds)) for ds in result] == [
+        list(iterate_all_uncertainties(ds)) for ds in expected]
+    for ds, record in zip(expected, result):
+        assert (choose_reference_product_exchange(
+                    record, get_single_reference_product(record))
+                == choose_reference_product_exchange(
+                    ds, get_single_reference_product(ds)))
+        assert (normalize_reference_production_amount(record, log=False)
+                == normalize_reference_production_amount(ds, log=False))
+
+def test_extract_records():
+    data = extract_ecospold2_directory(test_data_dir, use_mp=False,
+                                       records=True)
+    assert all(type(ds) is Dataset for ds in data)
+    assert data == extract_ecospold2_directory(test_data_dir, use_mp=False)
+
+def test_cache_records(datasets):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dirpath = write_columnar_cache({'a': datasets},
+                                       os.path.join(tmpdir, "cache"))
+        loaded = ColumnarCache(dirpath, records=True).datasets()
+        assert all(type(ds) is Dataset for ds in loaded)
+        assert loaded == datasets
+        # Records can be written back to the cache
+        write_columnar_cache({'a': loaded}, dirpath)
+        assert ColumnarCache(dirpath)['a'] == datasets
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from ocelot.model import system_model
+from ocelot.step_cache import StepCache, fingerprint_data
+import functools
+import os
+import pytest
+import tempfile
+
+
+@pytest.fixture
+def cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield StepCache(tmpdir)
+
+calls = []
+
+def add_one(data):
+    calls.append('add_one')
+    return data + [1]
+
+def add_two(data):
+    calls.append('add_two')
+    return data + [2]
+
+def add_number(data, number):
+    calls.append(number)
+    return data + [number]
+
+def test_fingerprint_data():
+    assert fingerprint_data([1, {'a': 2}]) == fingerprint_data([1, {'a': 2}])
+    assert fingerprint_data([1, {'a': 2}]) != fingerprint_data([1, {'a': 3}])
+
+def test_apply_miss_then_hit(cache):
+    del calls[:]
+    cache.start([])
+    assert cache.apply(add_one, []) == ([1], False)
+    assert cache.apply(add_two, [1]) == ([1, 2], False)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    cache.start([])
+    assert cache.apply(add_one, []) == ([1], True)
+    assert cache.apply(add_two, [1]) == ([1, 2], True)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert calls == ['add_one', 'add_two']
+
+def test_key_depends_on_input_and_function(cache):
+    cache.start([])
+    first = cache.key(add_one)
+    assert cache.key(add_two) != first
+    cache.start([0])
+    assert cache.key(add_one) != first
+
+def test_partial_arguments_in_key(cache):
+    del calls[:]
+    cache.start([])
+    assert cache.apply(functools.partial(add_number, number=3), [])[0] == [3]
+    cache.start([])
+    assert cache.apply(functools.partial(add_number, number=4), [])[0] == [4]
+    assert calls == [3, 4]
+
+def test_corrupt_entry_is_a_miss(cache):
+    cache.start([])
+    key = cache.key(add_one)
+    with open(cache.filepath(key), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.apply(add_one, []) == ([1], False)
+
+def test_eviction_removes_least_recently_used(cache):
+    cache.start([])
+    first = cache.filepath(cache.key(add_one))
+    cache.apply(add_one, [])
+    os.utime(first, (0, 0))
+    # Room for one result, but not two
+    cache.max_size = 2 * os.path.getsize(first) - 1
+    cache.start([0])
+    second = cache.filepath(cache.key(add_one))
+    cache.apply(add_one, [0])
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+
+def test_system_model_step_cache(fake_report):
+    del calls[:]
+    output_dir, data = system_model([], [add_one, add_two], step_cache=True)
+    assert calls == ['add_one', 'add_two']
+    output_dir, cached = system_model([], [add_one, add_two], step_cache=True)
+    assert cached == data == [1, 2]
+    assert calls == ['add_one', 'add_two']
+    with open(os.path.join(output_dir.directory, "report.html"),
+              encoding='utf-8') as f:
+        report = f.read()
+    assert "Step cache: 2 hits, 0 misses" in report
+    assert "Step cache: hit" in report
+
+def test_system_model_step_cache_different_input(fake_report):
+    del calls[:]
+    system_model([], [add_one], step_cache=True)
+    _, data = system_model([5], [add_one], step_cache=True)
+    assert data == [5, 1]
+    assert calls == ['add_one', 'add_one']
+
+def test_system_model_without_step_cache(fake_report):
+    del calls[:]
+    system_model([], [add_one])
+    system_model([], [add_one])
+    assert calls == ['add_one', 'add_one']
+    assert not os.path.exists(os.path.join(fake_report, "cache", "steps"))
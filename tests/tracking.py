@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+from ocelot.follow import DatasetFollower
+from ocelot.model import system_model
+from ocelot.step_cache import StepCache
+from ocelot.tracking import (
+    ChangeTracker,
+    track,
+    TrackedDict,
+    TrackedList,
+    version,
+)
+import copy
+import gc
+import os
+import pickle
+import tempfile
+import weakref
+
+
+def make_data():
+    return [{
+        'name': str(n),
+        'filepath': '/data/{}.spold'.format(n),
+        'exchanges': [{'amount': n}],
+    } for n in range(4)]
+
+def change_exchange(data):
+    data[1]['exchanges'][0]['amount'] = 10
+    return data
+
+def add_exchange(data):
+    data[2]['exchanges'].append({'amount': 5})
+    return data
+
+def remove_and_copy(data):
+    new = copy.deepcopy(data[0])
+    new['name'] = 'copy'
+    return data[1:] + [new]
+
+def do_nothing(data):
+    return data
+
+
+def test_track_converts_nested_objects():
+    data = track(make_data())
+    ds = data[0]
+    assert isinstance(ds, TrackedDict)
+    assert isinstance(ds['exchanges'], TrackedList)
+    assert isinstance(ds['exchanges'][0], TrackedDict)
+    assert ds == make_data()[0]
+
+def test_changes_increase_dataset_version():
+    ds = track(make_data())[0]
+    assert version(ds) == 0
+    ds['exchanges'][0]['amount'] = 2
+    assert version(ds) == 1
+    ds['exchanges'].append({'amount': 3})
+    ds['exchanges'][-1]['amount'] = 4
+    assert version(ds) == 3
+    ds.setdefault('location', 'GLO')
+    ds.setdefault('location', 'RoW')
+    ds['exchanges'].sort(key=lambda exc: exc['amount'])
+    del ds['name']
+    assert version(ds) == 6
+    assert version({}) is None
+
+def test_reading_doesnt_change_version():
+    ds = track(make_data())[0]
+    ds.get('name'), list(ds.items()), [exc['amount'] for exc in ds['exchanges']]
+    assert version(ds) == 0
+
+def test_moved_objects_change_new_dataset():
+    first, second = track(make_data())[:2]
+    exchanges = first.pop('exchanges')
+    second['exchanges'] = exchanges
+    versions = version(first), version(second)
+    exchanges[0]['amount'] = 7
+    assert version(second) == versions[1] + 1
+    # Objects are never removed from a dataset, so this is counted as well
+    assert version(first) == versions[0] + 1
+
+def test_shared_objects_change_all_datasets():
+    first, second = track(make_data())[:2]
+    second['exchanges'].append(first['exchanges'][0])
+    versions = version(first), version(second)
+    second['exchanges'][-1]['amount'] = 7
+    assert version(first) == versions[0] + 1
+    assert version(second) == versions[1] + 1
+    first['exchanges'].append({'amount': 2})
+    first['exchanges'][-1]['amount'] = 3
+    assert version(second) == versions[1] + 1
+
+def test_shared_objects_dont_keep_datasets_alive():
+    first, second = track(make_data())[:2]
+    exc = first['exchanges'][0]
+    second['exchanges'].append(exc)
+    ref = weakref.ref(first)
+    del first
+    gc.collect()
+    assert ref() is None
+    versions = version(second)
+    exc['amount'] = 3
+    assert version(second) == versions + 1
+
+def test_copy_is_plain_and_shallow():
+    ds = track(make_data())[0]
+    new = ds.copy()
+    assert type(new) is dict
+    new['name'] = 'other'
+    assert version(ds) == 0
+    new['exchanges'][0]['amount'] = 2
+    assert version(ds) == 1
+
+def test_deepcopy_of_part_is_not_shared():
+    ds = track(make_data())[0]
+    exc = copy.deepcopy(ds['exchanges'][0])
+    exc['amount'] = 2
+    assert version(ds) == 0
+
+def share_exchange(data):
+    data[1]['exchanges'].append(data[0]['exchanges'][0])
+    return data
+
+def change_shared_exchange(data):
+    data[1]['exchanges'][-1]['amount'] = 10
+    return data
+
+def test_step_cache_with_shared_objects():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = StepCache(tmpdir)
+        cache.start(make_data())
+        data, _ = cache.apply(share_exchange, track(make_data()))
+        result, hit = cache.apply(change_shared_exchange, data)
+        assert not hit
+        assert result[0]['exchanges'][0]['amount'] == 10
+
+        cache.start(make_data())
+        data, _ = cache.apply(share_exchange, make_data())
+        cached, hit = cache.apply(change_shared_exchange, data)
+        assert hit
+        assert cached[0]['exchanges'][0]['amount'] == 10
+
+def test_deepcopy_is_new_tracked_dataset():
+    ds = track(make_data())[0]
+    new = copy.deepcopy(ds)
+    assert isinstance(new['exchanges'][0], TrackedDict)
+    new['exchanges'][0]['amount'] = 2
+    assert version(ds) == 0
+    assert version(new) == 1
+    assert new != ds
+
+def test_pickled_as_plain_objects():
+    ds = track(make_data())[0]
+    loaded = pickle.loads(pickle.dumps(ds, protocol=pickle.HIGHEST_PROTOCOL))
+    assert type(loaded) is dict
+    assert type(loaded['exchanges']) is list
+    assert type(loaded['exchanges'][0]) is dict
+    assert loaded == ds
+    assert type(copy.copy(ds)) is dict
+
+def test_change_tracker():
+    data = track(make_data())
+    tracker = ChangeTracker(data)
+    data, changed, removed = tracker.step(change_exchange(data))
+    assert (changed, removed) == (1, 0)
+    data, changed, removed = tracker.step(do_nothing(data))
+    assert (changed, removed) == (0, 0)
+    data, changed, removed = tracker.step(remove_and_copy(data))
+    assert (changed, removed) == (1, 1)
+    data, changed, removed = tracker.step(data + [{'name': 'new'}])
+    assert (changed, removed) == (1, 0)
+    assert isinstance(data[-1], TrackedDict)
+    data, changed, removed = tracker.step(add_exchange(data))
+    assert (changed, removed) == (1, 0)
+
+def test_follow_skips_unchanged_datasets(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data = track(make_data())
+        follower = DatasetFollower(tmpdir, ".spold")
+        follower.start(data)
+        states = []
+        monkeypatch.setattr('ocelot.follow._state',
+                            lambda ds: states.append(ds['name']) or dict(ds))
+        follower.snapshot(0, change_exchange(data), "change_exchange")
+        assert states == ['1']
+
+def test_step_cache_stores_changed_datasets():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = StepCache(tmpdir)
+        # Tracked datasets are pickled differently, so fingerprint plain data
+        cache.start(make_data())
+        data = track(make_data())
+        filepath = cache.filepath(cache.key(change_exchange))
+        result, hit = cache.apply(change_exchange, data)
+        assert not hit
+        with open(filepath, "rb") as f:
+            stored = pickle.load(f)
+        assert stored['delta'][0] == 0
+        assert stored['delta'][1]['exchanges'][0]['amount'] == 10
+
+        cache.start(make_data())
+        cached, hit = cache.apply(change_exchange, make_data())
+        assert hit
+        assert cached == result
+
+def test_system_model_track_changes(fake_report):
+    output_dir, data = system_model(
+        make_data(),
+        [change_exchange, do_nothing, remove_and_copy],
+        track_changes=True
+    )
+    assert [ds['name'] for ds in data] == ['1', '2', '3', 'copy']
+    with open(os.path.join(output_dir.directory, "report.html"),
+              encoding='utf-8') as f:
+        report = f.read()
+    assert "Datasets modified per step" in report
+    assert "Datasets modified or added: 1; removed: 0" in report
+    assert "Datasets modified or added: 0; removed: 0" in report
+    assert "Datasets modified or added: 1; removed: 1" in report
+
+def test_system_model_without_tracking(fake_report):
+    output_dir, data = system_model(make_data(), [change_exchange])
+    assert type(data[0]) is dict
+    with open(os.path.join(output_dir.directory, "report.html"),
+              encoding='utf-8') as f:
+        assert "Datasets modified per step" not in f.read()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from ocelot.filesystem import find_pickle, load_checkpoint, load_pickle
+from ocelot.model import system_model
+from ocelot.writer import ResultWriter
+import json
+import os
+import pytest
+import tempfile
+
+
+METHODS = ["fork", "thread", "sync"] if hasattr(os, "fork") else ["thread", "sync"]
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_snapshot_taken_at_save(method):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data = [{'amount': 1}]
+        filepath = os.path.join(tmpdir, "0.pickle")
+        sidecar = (os.path.join(tmpdir, "0.json"), {'index': 0})
+        with ResultWriter("gzip", method=method) as writer:
+            writer.save(filepath, data, sidecar)
+            data[0]['amount'] = 2
+        assert find_pickle(filepath) == filepath + ".gz"
+        assert load_pickle(filepath + ".gz") == [{'amount': 1}]
+        with open(sidecar[0]) as f:
+            assert json.load(f) == {'index': 0}
+        assert not [name for name in os.listdir(tmpdir) if name.endswith(".tmp")]
+
+@pytest.mark.parametrize("method", METHODS)
+def test_many_results_bounded(method):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        writer = ResultWriter(None, max_pending=1, method=method)
+        for index in range(5):
+            writer.save(os.path.join(tmpdir, "{}.pickle".format(index)), [index])
+            assert len(writer.children) <= 1
+        writer.close()
+        assert [load_pickle(os.path.join(tmpdir, "{}.pickle".format(index)))
+                for index in range(5)] == [[0], [1], [2], [3], [4]]
+
+@pytest.mark.parametrize("method", METHODS)
+def test_errors_raised_on_flush(method):
+    writer = ResultWriter(None, method=method)
+    try:
+        writer.save("/nonexistent/directory/0.pickle", [1])
+    except OSError:
+        assert method == "sync"
+        return
+    with pytest.raises(OSError):
+        writer.close()
+
+@pytest.mark.parametrize("compression", ["lz4", "zstd"])
+def test_optional_compression(compression):
+    pytest.importorskip({'lz4': 'lz4.frame', 'zstd': 'zstandard'}[compression])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with ResultWriter(compression) as writer:
+            writer.save(os.path.join(tmpdir, "0.pickle"), [1, 2])
+        assert load_pickle(find_pickle(os.path.join(tmpdir, "0.pickle"))) == [1, 2]
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        ResultWriter("rar")
+
+def test_thread_is_default():
+    assert ResultWriter().method == "thread"
+    with pytest.raises(ValueError):
+        ResultWriter(method="pigeon")
+
+def add_one(data):
+    return data + [1]
+
+def test_system_model_compressed_results(fake_report):
+    output_dir, data = system_model([], [add_one, add_one],
+                                    save_strategy="0:1", compression="gzip")
+    filenames = os.listdir(output_dir.directory)
+    assert "final-results.pickle.gz" in filenames
+    checkpoint, metadata = load_checkpoint(output_dir.report_id + ":0")
+    assert checkpoint == [1]
+    _, resumed = system_model(None, [add_one, add_one, add_one],
+                              resume_from=output_dir.report_id + ":1")
+    assert resumed == [1, 1, 1]
+
+def fail(data):
+    raise ValueError
+
+def test_system_model_closes_writer_on_error(fake_report, monkeypatch):
+    writers = []
+    monkeypatch.setattr(
+        'ocelot.model.ResultWriter',
+        lambda *args: writers.append(ResultWriter(*args)) or writers[-1]
+    )
+    with pytest.raises(ValueError):
+        system_model([], [add_one, fail], save_strategy="0")
+    assert writers[0].thread is None
+    assert writers[0].queue is None
+
+def interrupt(data):
+    raise KeyboardInterrupt
+
+class FailingWriter(ResultWriter):
+    def close(self):
+        failed, self.failed = not getattr(self, 'failed', False), True
+        if failed:
+            raise OSError("Couldn't write results")
+
+def test_system_model_interrupt_deletes_output_on_write_error(fake_report,
+                                                               monkeypatch):
+    monkeypatch.setattr('ocelot.model.ResultWriter', FailingWriter)
+    with pytest.raises(OSError):
+        system_model([], [add_one, interrupt])
+    assert not any(len(name) == 32 for name in os.listdir(fake_report))